@@ -1,4 +1,62 @@
 #!/usr/bin/env python
-from .parmap import map, map_async, starmap, starmap_async
+from .parmap import (
+    Cache,
+    ChunkStats,
+    Failure,
+    SinkSummary,
+    Stats,
+    close_shared_pool,
+    imap,
+    imap_aio,
+    imap_unordered,
+    imap_unordered_aio,
+    istarmap,
+    istarmap_aio,
+    istarmap_unordered,
+    istarmap_unordered_aio,
+    map,
+    map_aio,
+    map_async,
+    map_batched,
+    map_indexed,
+    map_reduce,
+    map_to,
+    read_results,
+    set_default_pool,
+    starmap,
+    starmap_aio,
+    starmap_async,
+    starmap_reduce,
+    starmap_to,
+)
 
-__all__ = ["map", "starmap", "map_async", "starmap_async"]
+__all__ = [
+    "map",
+    "starmap",
+    "map_async",
+    "starmap_async",
+    "imap",
+    "imap_unordered",
+    "istarmap",
+    "istarmap_unordered",
+    "map_batched",
+    "map_indexed",
+    "map_reduce",
+    "starmap_reduce",
+    "map_aio",
+    "starmap_aio",
+    "imap_aio",
+    "imap_unordered_aio",
+    "istarmap_aio",
+    "istarmap_unordered_aio",
+    "map_to",
+    "starmap_to",
+    "read_results",
+    "set_default_pool",
+    "close_shared_pool",
+    "Stats",
+    "ChunkStats",
+    "Cache",
+    "Failure",
+    "SinkSummary",
+]
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+#   Copyright 2014-2026 Sergio Oller <sergioller@gmail.com>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""
+Benchmarks of the overheads added by parmap.
+
+Run them with::
+
+    python -m parmap.bench [--quick] [--processes 1 2 4] [--output results.json]
+
+The result is a JSON document with some information about the environment
+and one entry per measurement. Each entry has a ``name``, the ``params`` of
+the measurement and the ``min``, ``median`` and ``mean`` wall time in
+seconds over ``repeat`` runs. Entries that run over several items also give
+``per_item``, the median time divided by the number of items.
+
+Compare the output of two parmap releases on the same machine to catch
+performance regressions. Prefer ``min`` and ``median``: they are less
+sensitive to noise than ``mean``.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+import typing as T
+
+from . import parmap
+
+SCHEMA_VERSION = 1
+
+
+def _noop(x, *args):
+    """The cheapest function to map: it measures parmap, not the work"""
+    return x
+
+
+def _noop_star(x, y, *args):
+    return x
+
+
+class _NullPbar:
+    """A progress bar that draws nothing, to measure parmap's side of the
+    progress bar updates without measuring tqdm"""
+
+    def __init__(self, total=None, **kwargs):
+        self.total = total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def update(self, n=1):
+        pass
+
+
+def _get_pbar(devnull):
+    """Returns the pm_pbar option to benchmark and its name: tqdm (writing
+    to devnull) if available"""
+    if parmap.HAVE_TQDM:
+        return {"file": devnull}, "tqdm"
+    return _NullPbar, "null"
+
+
+def _time(function, repeat):
+    """Run function() repeat times, returning the list of wall times"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _entry(name, params, times, num_items=None):
+    median = statistics.median(times)
+    entry = {
+        "name": name,
+        "params": params,
+        "repeat": len(times),
+        "min": min(times),
+        "median": median,
+        "mean": statistics.mean(times),
+    }
+    if num_items:
+        entry["per_item"] = median / num_items
+    return entry
+
+
+def bench_pool_startup(processes, repeat):
+    """Time of a call that creates and closes its own pool, with a single
+    item, compared to a serial call"""
+    yield _entry(
+        "pool_startup",
+        {"processes": 0},
+        _time(lambda: parmap.map(_noop, [0], pm_parallel=False), repeat),
+    )
+    for num in processes:
+        yield _entry(
+            "pool_startup",
+            {"processes": num},
+            _time(lambda: parmap.map(_noop, [0], pm_processes=num), repeat),
+        )
+
+
+def bench_dispatch(pool, num_items, repeat):
+    """Per-item overhead of map and starmap on an existing pool"""
+    items = list(range(num_items))
+    pairs = [(x, x) for x in items]
+    params = {"processes": pool._processes, "items": num_items}
+    yield _entry(
+        "dispatch_map",
+        params,
+        _time(lambda: parmap.map(_noop, items, pm_pool=pool), repeat),
+        num_items,
+    )
+    yield _entry(
+        "dispatch_starmap",
+        params,
+        _time(lambda: parmap.starmap(_noop_star, pairs, pm_pool=pool), repeat),
+        num_items,
+    )
+
+
+def bench_chunksize(pool, num_items, chunksizes, repeat):
+    """Effect of pm_chunksize on the per-item overhead"""
+    items = list(range(num_items))
+    for chunksize in chunksizes:
+        yield _entry(
+            "chunksize",
+            {
+                "processes": pool._processes,
+                "items": num_items,
+                "chunksize": chunksize,
+            },
+            _time(
+                lambda: parmap.map(
+                    _noop, items, pm_pool=pool, pm_chunksize=chunksize
+                ),
+                repeat,
+            ),
+            num_items,
+        )
+
+
+def bench_large_args(pool, num_items, arg_sizes, repeat):
+    """Cost of sending a large constant argument, with and without
+    pm_share_args"""
+    items = list(range(num_items))
+    for size in arg_sizes:
+        payload = b"x" * size
+        for share_args in (False, True):
+            yield _entry(
+                "large_args",
+                {
+                    "processes": pool._processes,
+                    "items": num_items,
+                    "arg_bytes": size,
+                    "share_args": share_args,
+                },
+                _time(
+                    lambda: parmap.map(
+                        _noop,
+                        items,
+                        payload,
+                        pm_pool=pool,
+                        pm_share_args=share_args,
+                    ),
+                    repeat,
+                ),
+                num_items,
+            )
+
+
+def bench_pbar(pool, num_items, repeat):
+    """Overhead of showing a progress bar"""
+    items = list(range(num_items))
+    with open(os.devnull, "w") as devnull:
+        pbar, pbar_name = _get_pbar(devnull)
+        for name, option in (("none", False), (pbar_name, pbar)):
+            yield _entry(
+                "pbar",
+                {"processes": pool._processes, "items": num_items, "pbar": name},
+                _time(
+                    lambda: parmap.map(_noop, items, pm_pool=pool, pm_pbar=option),
+                    repeat,
+                ),
+                num_items,
+            )
+
+
+def bench_async(pool, num_items, repeat):
+    """map compared to map_async(...).get() on the same pool"""
+    items = list(range(num_items))
+    params = {"processes": pool._processes, "items": num_items}
+    yield _entry(
+        "sync",
+        params,
+        _time(lambda: parmap.map(_noop, items, pm_pool=pool), repeat),
+        num_items,
+    )
+    yield _entry(
+        "async",
+        params,
+        _time(lambda: parmap.map_async(_noop, items, pm_pool=pool).get(), repeat),
+        num_items,
+    )
+
+
+def _environment(quick):
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+
+        parmap_version = version("parmap")  # type: T.Optional[str]
+    except PackageNotFoundError:
+        parmap_version = None
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "parmap_version": parmap_version,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "start_method": multiprocessing.get_start_method(),
+        "quick": quick,
+    }
+
+
+def run(processes=None, quick=False, repeat=None):
+    """Run all the benchmarks, returning a JSON-serializable dict
+
+    :param processes: Worker counts to benchmark. Defaults to 1, 2 and the
+      number of CPUs.
+    :type processes: list of int
+    :param quick: Use fewer items and repetitions, for a smoke test
+    :type quick: bool
+    :param repeat: Number of runs of each measurement
+    :type repeat: int
+    """
+    if processes is None:
+        processes = sorted({1, 2, os.cpu_count() or 1})
+    if quick:
+        num_items, chunksizes, arg_sizes = 200, [1, 50, "auto", "guided"], [1 << 16]
+        repeat = repeat or 1
+    else:
+        num_items = 10000
+        chunksizes = [1, 10, 100, 1000, None, "auto", "guided"]
+        arg_sizes = [1 << 10, 1 << 20, 1 << 23]
+        repeat = repeat or 5
+    results = list(bench_pool_startup(processes, repeat))
+    for num in processes:
+        with multiprocessing.Pool(num) as pool:
+            results.extend(bench_dispatch(pool, num_items, repeat))
+            results.extend(bench_chunksize(pool, num_items, chunksizes, repeat))
+            results.extend(
+                bench_large_args(pool, num_items // 10, arg_sizes, repeat)
+            )
+            results.extend(bench_pbar(pool, num_items, repeat))
+            results.extend(bench_async(pool, num_items, repeat))
+            pool.close()
+            pool.join()
+    output = _environment(quick)
+    output["results"] = results
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m parmap.bench",
+        description="Measure parmap overheads and print them as JSON.",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="few items and repetitions"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        nargs="+",
+        help="worker counts to benchmark (default: 1, 2 and the CPU count)",
+    )
+    parser.add_argument("--repeat", type=int, help="runs of each measurement")
+    parser.add_argument(
+        "--output", help="write the JSON to this file instead of stdout"
+    )
+    options = parser.parse_args(argv)
+    output = run(
+        processes=options.processes, quick=options.quick, repeat=options.repeat
+    )
+    text = json.dumps(output, indent=2)
+    if options.output is None:
+        sys.stdout.write(text + "\n")
+    else:
+        with open(options.output, "w") as fh:
+            fh.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -68,141 +68,2374 @@ Members
 # The original idea for this implementation was given by J.F. Sebastian
 # at  http://stackoverflow.com/a/5443941/446149
 
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib
 import inspect
+import mmap
 import multiprocessing
+import os
+import pickle
+import queue
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import threading
+import time
 import typing as T
+import uuid
 import warnings
-from functools import partial
-from itertools import repeat
+import weakref
+from collections import OrderedDict
+from functools import partial, reduce
+from itertools import islice, repeat
+from operator import itemgetter
+import multiprocessing.pool
+from multiprocessing import resource_tracker, shared_memory
 from multiprocessing.pool import AsyncResult
+from multiprocessing.reduction import ForkingPickler
+
+try:
+    import _posixshmem  # type: ignore
+except ImportError:  # Windows
+    _posixshmem = None
 
 try:
     import tqdm.auto as tqdm  # type: ignore
 
-    HAVE_TQDM = True
-except ImportError:
-    HAVE_TQDM = False
+    HAVE_TQDM = True
+except ImportError:
+    HAVE_TQDM = False
+
+
+def _func_star_single(func_item_args):
+    """Equivalent to:
+    func = func_item_args[0]
+    item = func_item_args[1]
+    args = func_item_args[2]
+    kwargs = func_item_args[3]
+    return func(item, args[0], args[1], ..., **kwargs)
+    """
+    return func_item_args[0](
+        *[func_item_args[1]] + func_item_args[2], **func_item_args[3]
+    )
+
+
+def _func_star_many(func_items_args):
+    """Equivalent to:
+    func = func_items_args[0]
+    items = func_items_args[1]
+    args = func_items_args[2]
+    kwargs = func_items_args[3]
+    return func(items[0], items[1], ..., args[0], args[1], ..., **kwargs)
+    """
+    return func_items_args[0](
+        *list(func_items_args[1]) + func_items_args[2], **func_items_args[3]
+    )
+
+
+# Registry of the calls installed in this (worker) process by pm_share_args,
+# keyed by a token unique to each parmap call. A long lived pool may serve
+# many parmap calls, so only the most recently used ones are kept.
+_SHARED_CALLS: "OrderedDict[str, _SharedCall]" = OrderedDict()
+_MAX_SHARED_CALLS = 8
+
+
+class _SharedCall:
+    """Callable binding the constant ``args`` and ``kwargs`` of a parmap call
+    to ``function``.
+
+    When pickled, only a token is sent (plus the path of a file holding the
+    function and its arguments, if the workers were not started with them).
+    Each worker resolves the token once and keeps the call in its registry,
+    so the constant parts of the call do not travel with every chunk.
+    """
+
+    def __init__(self, token, function, args, kwargs, path=None):
+        self.token = token
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.path = path
+
+    def __call__(self, *items):
+        return self.function(*items, *self.args, **self.kwargs)
+
+    def __reduce__(self):
+        return (_get_shared_call, (self.token, self.path))
+
+
+def _install_shared_call(token, call):
+    """Pool initializer (and cache filler) for pm_share_args. `call` is the
+    (function, args, kwargs) tuple, possibly held in a _Serialized."""
+    if isinstance(call, _Serialized):  # Not pickled: a forked worker
+        call = call.obj
+    function, args, kwargs = call
+    _SHARED_CALLS[token] = _SharedCall(token, function, args, kwargs)
+    while len(_SHARED_CALLS) > _MAX_SHARED_CALLS:
+        _SHARED_CALLS.popitem(last=False)
+
+
+def _get_shared_call(token, path):
+    """Resolve a pickled _SharedCall in the worker"""
+    try:
+        shared = _SHARED_CALLS[token]
+    except KeyError:
+        if path is None:
+            raise RuntimeError(
+                "Internal parmap error: the worker was not initialized with "
+                "the shared arguments. This should not happen"
+            )
+        with open(path, "rb") as fh:
+            _install_shared_call(token, pickle.load(fh))
+        return _SHARED_CALLS[token]
+    _SHARED_CALLS.move_to_end(token)
+    return shared
+
+
+def _prepare_shared_call(share_args, function, args, kwargs, serializer=None):
+    """Returns the _SharedCall for this parmap call (or None if pm_share_args
+    is not set) and the pool initializer and initargs that install it. With
+    a pm_serializer `serializer`, the call is sent with it.
+
+    kwargs must be the same dict the caller keeps popping the pm_* options
+    from: it is stored by reference and has to be clean before the pool
+    (and its initializer) starts.
+    """
+    if not share_args:
+        return None, None, ()
+    shared = _SharedCall(uuid.uuid4().hex, function, list(args), kwargs)
+    initargs = (shared.token, _shared_call_payload(shared, serializer))
+    return shared, _install_shared_call, initargs
+
+
+def _shared_call_payload(shared, serializer):
+    """What is sent to the workers to install `shared`"""
+    call = (shared.function, shared.args, shared.kwargs)
+    if serializer is None:
+        return call
+    return _Serialized(call, serializer)
+
+
+def _no_cleanup():
+    pass
+
+
+def _publish_shared_call(shared, close_pool, serializer=None):
+    """Make `shared` available to workers that did not run its initializer
+    (i.e. pools that parmap did not create for this call) by dumping it to a
+    temporary file, with the pm_serializer `serializer` if given. Returns a
+    function that removes that file.
+    """
+    if close_pool:
+        return _no_cleanup
+    fd, path = tempfile.mkstemp(prefix="parmap-", suffix=".pickle")
+
+    def cleanup():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(
+                _shared_call_payload(shared, serializer),
+                fh,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+    except BaseException:  # e.g. a lambda without pm_serializer
+        cleanup()
+        raise
+    shared.path = path
+    return cleanup
+
+
+class _ExecutorResult:
+    """AsyncResult compatible view of a list of
+    :py:class:`concurrent.futures.Future`. Its value is the concatenation of
+    their results, or the result of the only future if `single` is True.
+
+    As in :py:class:`multiprocessing.pool.MapResult`, it is ready (and the
+    error callback is called) as soon as one of the futures fails.
+    """
+
+    def __init__(self, futures, single, callback=None, error_callback=None):
+        self._futures = futures
+        self._single = single
+        self._callback = callback
+        self._error_callback = error_callback
+        self._lock = threading.Lock()
+        self._done = False
+        self._event = threading.Event()
+        self._number_left = len(futures)
+        self._value: T.Any = None
+        self._error: T.Optional[BaseException] = None
+        if not futures:
+            self._finish()
+        for future in futures:
+            future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        if future.cancelled():
+            error = concurrent.futures.CancelledError()
+        else:
+            error = future.exception()
+        with self._lock:
+            if self._done:
+                return
+            self._number_left -= 1
+            if error is None and self._number_left > 0:
+                return
+            self._done = True
+            self._error = error
+        self._finish()
+
+    def _finish(self):
+        if self._error is None:
+            if self._single:
+                self._value = self._futures[0].result()
+            else:
+                self._value = [x for f in self._futures for x in f.result()]
+        self._event.set()
+        if self._error is not None:
+            if self._error_callback is not None:
+                self._error_callback(self._error)
+        elif self._callback is not None:
+            self._callback(self._value)
+
+    def get(self, timeout=None):
+        self.wait(timeout)
+        if not self.ready():
+            raise multiprocessing.TimeoutError
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def wait(self, timeout=None):
+        self._event.wait(timeout)
+
+    def ready(self):
+        return self._event.is_set()
+
+    def successful(self):
+        if not self.ready():
+            raise ValueError("{!r} not ready".format(self))
+        return self._error is None
+
+
+def _run_chunk_list(func, chunk):
+    return [func(item) for item in chunk]
+
+
+class _ExecutorPool:
+    """Exposes the subset of the :py:class:`multiprocessing.pool.Pool` API
+    that parmap uses on top of a :py:class:`concurrent.futures.Executor`.
+    """
+
+    def __init__(self, executor, num_workers):
+        self._executor = executor
+        # multiprocessing pools keep their workers here. parmap only uses
+        # its length:
+        self._pool = [None] * num_workers
+
+    def apply_async(self, func, args=(), kwds={}, callback=None, error_callback=None):
+        future = self._executor.submit(func, *args, **kwds)
+        return _ExecutorResult([future], True, callback, error_callback)
+
+    def map_async(
+        self, func, iterable, chunksize=None, callback=None, error_callback=None
+    ):
+        items = list(iterable)
+        chunksize = _get_default_chunksize(chunksize, self, len(items))
+        chunksize = max(chunksize, 1)
+        futures = [
+            self._executor.submit(_run_chunk_list, func, items[i : i + chunksize])
+            for i in range(0, len(items), chunksize)
+        ]
+        return _ExecutorResult(futures, False, callback, error_callback)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def join(self):
+        self._executor.shutdown(wait=True)
+
+    def terminate(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_BACKENDS = ("process", "thread", "interpreter", "serial")
+
+
+def _new_pool(
+    backend,
+    processes,
+    initializer=None,
+    initargs=(),
+    maxtasksperchild=None,
+    start_method=None,
+    preload=None,
+):
+    """Creates a pool of the given pm_backend"""
+    if backend == "process":
+        context = multiprocessing.get_context(start_method)
+        if preload is not None:
+            if context.get_start_method() == "forkserver":
+                context.set_forkserver_preload(list(preload))
+            else:
+                warnings.warn("pm_preload requires pm_start_method='forkserver'")
+        return context.Pool(
+            processes=processes,
+            initializer=initializer,
+            initargs=initargs,
+            maxtasksperchild=maxtasksperchild,
+        )
+    for name, value in (
+        ("pm_maxtasksperchild", maxtasksperchild),
+        ("pm_start_method", start_method),
+        ("pm_preload", preload),
+    ):
+        if value is not None:
+            warnings.warn("{} requires pm_backend='process'".format(name))
+    if backend == "thread":
+        return multiprocessing.pool.ThreadPool(
+            processes=processes, initializer=initializer, initargs=initargs
+        )
+    if backend == "interpreter":
+        try:
+            executor_class = concurrent.futures.InterpreterPoolExecutor  # type: ignore
+        except AttributeError:
+            raise RuntimeError(
+                "pm_backend='interpreter' requires Python 3.14 or newer"
+            ) from None
+        if processes is None:
+            processes = os.cpu_count() or 1
+        executor = executor_class(
+            max_workers=processes, initializer=initializer, initargs=initargs
+        )
+        return _ExecutorPool(executor, processes)
+    raise AssertionError(
+        "Internal parmap error: Invalid backend." + " This should not happen"
+    )
+
+
+# The pool used when pm_pool is not given (see set_default_pool)
+_default_pool: T.Union[None, str, multiprocessing.pool.Pool] = None
+
+# The pool behind pm_pool="shared". It is created lazily, and it is only
+# valid in the process that created it (_shared_pool_pid).
+_shared_pool_lock = threading.Lock()
+_shared_pool: T.Optional[multiprocessing.pool.Pool] = None
+_shared_pool_pid: T.Optional[int] = None
+_shared_pool_processes: T.Optional[int] = None
+_shared_pool_backend: T.Optional[str] = None
+_shared_pool_options: T.Dict[str, T.Any] = {}
+_shared_pool_atexit = False
+# Number of calls using each shared pool (the current one, or one that was
+# replaced or closed while in use, which is closed once it is not used)
+_shared_pool_users: T.Dict[T.Any, int] = {}
+# Shared pools with a task that never completes, to terminate once unused
+_shared_pool_broken: T.Set[T.Any] = set()
+
+
+def _same_option(value, other):
+    try:
+        return value is other or bool(value == other)
+    except Exception:  # e.g. arrays in initargs
+        return False
+
+
+def _get_shared_pool(processes, backend, **options):
+    """Returns the shared pool, creating it if needed. If `processes` is
+    given and differs from the size of the shared pool, or if the shared
+    pool has a different backend, it is replaced by a new one. The same
+    applies to the `options` of _new_pool that are not None.
+
+    The call is counted as a user of the pool until it calls
+    _release_shared_pool, so the pool is not closed under it.
+    """
+    global _shared_pool, _shared_pool_pid, _shared_pool_processes
+    global _shared_pool_backend, _shared_pool_options, _shared_pool_atexit
+    options = {name: value for name, value in options.items() if value is not None}
+    with _shared_pool_lock:
+        if _shared_pool is not None and _shared_pool_pid != os.getpid():
+            # We are in a forked child: the workers belong to the parent.
+            _shared_pool = None
+            _shared_pool_users.clear()
+            _shared_pool_broken.clear()
+        if _shared_pool is not None and (
+            (processes is not None and processes != _shared_pool_processes)
+            or backend != _shared_pool_backend
+            or not all(
+                _same_option(value, _shared_pool_options.get(name))
+                for name, value in options.items()
+            )
+        ):
+            # Tasks already submitted to the old pool still finish. If other
+            # calls still use it, the last one closes it.
+            if _shared_pool not in _shared_pool_users:
+                _shared_pool.close()
+            _shared_pool = None
+        if _shared_pool is None:
+            _shared_pool = _new_pool(backend, processes, **options)
+            _shared_pool_pid = os.getpid()
+            _shared_pool_processes = len(_shared_pool._pool)
+            _shared_pool_backend = backend
+            _shared_pool_options = options
+            if not _shared_pool_atexit:
+                atexit.register(_terminate_shared_pool)
+                _shared_pool_atexit = True
+        _shared_pool_users[_shared_pool] = _shared_pool_users.get(_shared_pool, 0) + 1
+        return _shared_pool
+
+
+def _is_shared_pool(pool):
+    """Whether `pool` is a shared pool (current or replaced) in use"""
+    return pool in _shared_pool_users
+
+
+def _release_shared_pool(pool):
+    """Ends a use of `pool` counted by _get_shared_pool, closing it if it is
+    no longer the shared pool and this was its last user."""
+    with _shared_pool_lock:
+        users = _shared_pool_users.pop(pool, 0) - 1
+        if users > 0:
+            _shared_pool_users[pool] = users
+            return
+        retired = pool is not _shared_pool
+        broken = pool in _shared_pool_broken
+        _shared_pool_broken.discard(pool)
+    if broken:
+        pool.terminate()
+    elif retired:
+        pool.close()
+
+
+def _discard_shared_pool(pool):
+    """Stops using `pool` as the shared pool, and terminates it once the
+    calls using it are done: pm_task_timeout killed one of its workers, so
+    one of its tasks never completes, and it could not be joined."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if pool is _shared_pool:
+            _shared_pool = None
+        in_use = pool in _shared_pool_users
+        if in_use:
+            _shared_pool_broken.add(pool)
+    if not in_use:
+        pool.terminate()
+
+
+def _terminate_shared_pool():
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool_pid == os.getpid():
+            for pool in {_shared_pool, *_shared_pool_users} - {None}:
+                pool.terminate()
+        _shared_pool = None
+        _shared_pool_users.clear()
+        _shared_pool_broken.clear()
+
+
+def close_shared_pool():
+    """Close the shared pool used by ``pm_pool="shared"``, waiting for its
+    pending tasks to finish. If calls running in other threads still use
+    it, it is closed when the last of them finishes instead, without
+    waiting. A new one is created the next time it is needed. The shared
+    pool is also terminated automatically at exit.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        pool, _shared_pool = _shared_pool, None
+        owned = _shared_pool_pid == os.getpid()
+        in_use = pool in _shared_pool_users
+    if pool is not None and owned and not in_use:
+        pool.close()
+        pool.join()
+
+
+def set_default_pool(pool):
+    """Set the pool used by parmap when ``pm_pool`` is not given.
+
+    :param pool: ``None`` (the default) to create a new pool on every call,
+      ``"shared"`` to reuse a pool managed by parmap across calls, created
+      lazily and resized by ``pm_processes``, or an existing
+      :py:class:`multiprocessing.pool.Pool`.
+    :type pool: None, str or multiprocessing.pool.Pool
+    """
+    global _default_pool
+    if isinstance(pool, str) and pool != "shared":
+        raise ValueError("Invalid pool: {!r}".format(pool))
+    _default_pool = pool
+
+
+# Arrays and buffers smaller than this are pickled as usual with
+# pm_shared_memory=True. Below it, creating a segment costs more than it saves.
+_SHM_MIN_BYTES = 1 << 16
+
+# Segments attached by this worker for the arguments of a call. They are
+# reused by all the items of the call, and the least recently used ones are
+# closed when there are too many.
+_ATTACHED_SHM: "OrderedDict[str, T.Any]" = OrderedDict()
+_MAX_ATTACHED_SHM = 32
+
+
+class _ShmHandle:
+    """Reference to an array or buffer placed in a shared memory segment by
+    pm_shared_memory. `kind` is "ndarray", "bytes" or "buffer".
+
+    If `owned` is True the receiver owns the segment, and unlinks it once
+    it has used it (items and results). Otherwise the sender unlinks it at
+    the end of the call (arguments shared by all the items).
+    """
+
+    def __init__(self, name, nbytes, kind, dtype=None, shape=None, owned=False):
+        self.name = name
+        self.nbytes = nbytes
+        self.kind = kind
+        self.dtype = dtype
+        self.shape = shape
+        self.owned = owned
+
+
+class _ShmResult(_ShmHandle):
+    """A result placed in shared memory by a worker. It is copied out of
+    the segment, and the segment unlinked, when it is unpickled.
+    """
+
+    def __reduce__(self):
+        return (
+            _receive_shm_result,
+            (self.name, self.nbytes, self.kind, self.dtype, self.shape),
+        )
+
+
+class _ShmItem:
+    """An item (or map_batched chunk) of a call with pm_shared_memory,
+    numbered by the parent so that it knows the name of the segment of its
+    result. `values` are the positional arguments it stands for.
+    """
+
+    def __init__(self, index, values):
+        self.index = index
+        self.values = values
+
+
+def _shm_result_name(prefix, index):
+    """Name of the segment of the result of the item numbered `index`"""
+    return "{}_r{}".format(prefix, index)
+
+
+def _new_shm(name, size):
+    """Creates a segment whose lifetime parmap manages itself (so the
+    resource tracker must not unlink it when this process exits)"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(
+            name=name, create=True, size=size, track=False  # type: ignore
+        )
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore
+    return shm
+
+
+class _AttachedShm:
+    """Mapping of an existing shared memory segment of at least `size` bytes.
+
+    Unlike :py:class:`multiprocessing.shared_memory.SharedMemory` before
+    Python 3.13, it does not register the segment with the resource tracker,
+    which would unlink it when this process exits (or forget the creator's
+    registration, if the tracker is shared with it). And closing it never
+    unmaps memory still used by views of the segment.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        if _posixshmem is None:
+            # Windows: open the named mapping
+            self._mmap = mmap.mmap(
+                -1, max(size, 1), tagname=name  # type: ignore[call-overload]
+            )
+        else:
+            fd = _posixshmem.shm_open("/" + name, os.O_RDWR, mode=0o600)
+            try:
+                self._mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+            finally:
+                os.close(fd)
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        """Drops this reference to the mapping. The views of the segment
+        (NumPy arrays point to the mmap object itself, without keeping a
+        buffer exported) keep it alive, so it is unmapped once they are all
+        gone."""
+        self.buf = self._mmap = None
+
+
+def _unlink_shm(name):
+    try:
+        _posixshmem.shm_unlink("/" + name)
+    except FileNotFoundError:
+        pass
+
+
+def _as_shareable(obj, min_bytes):
+    """Returns (kind, memoryview of bytes, dtype, shape) if `obj` should go
+    through shared memory, or None"""
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject or obj.nbytes < min_bytes:
+            return None
+        array = np.ascontiguousarray(obj)
+        data = memoryview(array.reshape(-1).view(np.uint8))
+        return "ndarray", data, array.dtype, array.shape
+    if isinstance(obj, (str, int, float, complex)) or obj is None:
+        return None
+    try:
+        data = memoryview(obj)
+    except TypeError:
+        return None
+    if data.nbytes < min_bytes or not data.c_contiguous:
+        return None
+    kind = "bytes" if isinstance(obj, bytes) else "buffer"
+    return kind, data.cast("B"), None, None
+
+
+def _shm_view(shm, handle):
+    """The object `handle` refers to, without copying it out of `shm`"""
+    if handle.kind == "ndarray":
+        import numpy as np
+
+        view = np.ndarray(handle.shape, dtype=handle.dtype, buffer=shm.buf)
+        view.flags.writeable = False
+        return view
+    if handle.kind == "bytes":
+        return bytes(shm.buf[: handle.nbytes])
+    return shm.buf[: handle.nbytes].toreadonly()
+
+
+def _receive_shm_result(name, nbytes, kind, dtype, shape):
+    shm = _AttachedShm(name, nbytes)
+    try:
+        if kind == "ndarray":
+            import numpy as np
+
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            value = view.copy()
+            del view
+        else:
+            value = bytes(shm.buf[:nbytes])
+            if kind == "buffer":
+                value = bytearray(value)
+    finally:
+        shm.close()
+        _unlink_shm(name)
+    return value
+
+
+class _ShmFunction:
+    """Wraps the mapped function in the workers for pm_shared_memory.
+
+    It receives each item as a _ShmItem. Arguments given as _ShmHandle are
+    replaced by views of their shared memory segments, and large array and
+    buffer results are returned through new segments (named after `prefix`
+    and the number of the item, so the parent can remove them if the worker
+    dies before returning them).
+    """
+
+    def __init__(self, function, min_bytes, prefix):
+        self.function = function
+        self.min_bytes = min_bytes
+        self.prefix = prefix
+
+    def __call__(self, item, *args, **kwargs):
+        owned = []
+        args = [self._resolve(x, owned) for x in item.values + args]
+        kwargs = {k: self._resolve(v, owned) for k, v in kwargs.items()}
+        try:
+            # The result may be (a view of) an item in an owned segment:
+            # export it before the segment is released
+            result = self.function(*args, **kwargs)
+            return self._export_result(result, item.index)
+        finally:
+            del args, kwargs
+            for shm in owned:
+                shm.close()
+                _unlink_shm(shm.name)
+
+    def _resolve(self, value, owned):
+        if isinstance(value, list):
+            # A batch of items (map_batched)
+            return [self._resolve(x, owned) for x in value]
+        if not isinstance(value, _ShmHandle):
+            return value
+        if value.owned:
+            shm = _AttachedShm(value.name, value.nbytes)
+            owned.append(shm)
+            return _shm_view(shm, value)
+        try:
+            shm = _ATTACHED_SHM[value.name]
+            _ATTACHED_SHM.move_to_end(value.name)
+        except KeyError:
+            if len(_ATTACHED_SHM) >= _MAX_ATTACHED_SHM:
+                _ATTACHED_SHM.popitem(last=False)[1].close()
+            shm = _ATTACHED_SHM[value.name] = _AttachedShm(value.name, value.nbytes)
+        return _shm_view(shm, value)
+
+    def _export_result(self, result, index):
+        if _posixshmem is None:
+            # On Windows, segments die with their last handle, so they can't
+            # outlive the worker's.
+            return result
+        shareable = _as_shareable(result, self.min_bytes)
+        if shareable is None:
+            return result
+        kind, data, dtype, shape = shareable
+        name = _shm_result_name(self.prefix, index)
+        try:
+            shm = _new_shm(name, max(data.nbytes, 1))
+        except FileExistsError:
+            # Left by a worker killed by pm_task_timeout before it returned
+            # the result of its chunk, which is run again
+            _unlink_shm(name)
+            shm = _new_shm(name, max(data.nbytes, 1))
+        try:
+            shm.buf[: data.nbytes] = data
+        finally:
+            shm.close()
+        return _ShmResult(shm.name, data.nbytes, kind, dtype, shape, owned=True)
+
+
+class _ShmTransport:
+    """Places the items and arguments of a parallel call in shared memory
+    segments (pm_shared_memory), and removes them at the end of the call.
+    """
+
+    def __init__(self, min_bytes):
+        self.min_bytes = min_bytes
+        self.prefix = "pm" + uuid.uuid4().hex[:8]
+        self._segments: T.List[T.Any] = []
+        # Segments of the items, unlinked by the workers once used
+        self._item_names: T.List[str] = []
+        self._num_items = 0
+
+    def export(self, obj, owned):
+        shareable = _as_shareable(obj, self.min_bytes)
+        if shareable is None:
+            return obj
+        kind, data, dtype, shape = shareable
+        name = "{}_{}".format(self.prefix, uuid.uuid4().hex[:12])
+        if owned and _posixshmem is not None:
+            # The worker unlinks it when done. Don't keep it mapped here.
+            shm = _new_shm(name, max(data.nbytes, 1))
+            self._item_names.append(name)
+            shm.buf[: data.nbytes] = data
+            shm.close()
+        else:
+            shm = shared_memory.SharedMemory(
+                name=name, create=True, size=max(data.nbytes, 1)
+            )
+            shm.buf[: data.nbytes] = data
+            self._segments.append(shm)
+            owned = False
+        return _ShmHandle(shm.name, data.nbytes, kind, dtype, shape, owned)
+
+    def export_chunk(self, chunk):
+        """A chunk of map_batched, as a whole"""
+        return self._new_item((self.export(chunk, True),))
+
+    def export_items(self, iterable, map_or_starmap):
+        if map_or_starmap == "map":
+            items = (self._new_item((self.export(x, True),)) for x in iterable)
+        else:
+            # The function receives the _ShmItem as a single argument
+            items = (
+                (self._new_item(tuple(self.export(x, True) for x in item)),)
+                for item in iterable
+            )
+        return _SizedIterable(items, _get_num_tasks(iterable))
+
+    def _new_item(self, values):
+        item = _ShmItem(self._num_items, values)
+        self._num_items += 1
+        return item
+
+    def cleanup(self):
+        for shm in self._segments:
+            shm.close()
+            shm.unlink()
+        self._segments = []
+        if _posixshmem is None:
+            return
+        # Items never processed, and results of workers that died before
+        # returning them:
+        for name in self._item_names:
+            _unlink_shm(name)
+        self._item_names = []
+        for index in range(self._num_items):
+            _unlink_shm(_shm_result_name(self.prefix, index))
+        self._num_items = 0
+
+
+class _Serializer(T.NamedTuple):
+    """The dumps and loads functions of pm_serializer"""
+
+    dumps: T.Callable[[T.Any], T.Any]
+    loads: T.Callable[[T.Any], T.Any]
+
+
+# Compression modules of pm_compress
+_COMPRESSORS = ("zlib", "lzma", "bz2")
+# Serializations smaller than this are not compressed by pm_compress, unless
+# another threshold is given. Below it, compression saves little.
+_COMPRESS_MIN_BYTES = 1 << 12
+
+
+class _CompressionCounters(threading.local):
+    """Bytes before and after compression, and seconds spent compressing
+    and decompressing with pm_compress, in this thread"""
+
+    def __init__(self):
+        self.uncompressed_bytes = 0
+        self.compressed_bytes = 0
+        self.compression_time = 0.0
+
+    def snapshot(self):
+        return (self.uncompressed_bytes, self.compressed_bytes, self.compression_time)
+
+    def since(self, snapshot):
+        """The counts since `snapshot` was taken"""
+        return tuple(now - then for now, then in zip(self.snapshot(), snapshot))
+
+
+_COMPRESSION_COUNTERS = _CompressionCounters()
+
+
+def _compressed_dumps(dumps, compressor, min_bytes, obj):
+    data = dumps(obj)
+    if len(data) < min_bytes:
+        return None, data
+    counters = _COMPRESSION_COUNTERS
+    tic = time.perf_counter()
+    compressed = importlib.import_module(compressor).compress(data)
+    counters.compression_time += time.perf_counter() - tic
+    counters.uncompressed_bytes += len(data)
+    if len(compressed) >= len(data):  # Not compressible
+        counters.compressed_bytes += len(data)
+        return None, data
+    counters.compressed_bytes += len(compressed)
+    return compressor, compressed
+
+
+def _compressed_loads(loads, payload):
+    compressor, data = payload
+    if compressor is not None:
+        tic = time.perf_counter()
+        data = importlib.import_module(compressor).decompress(data)
+        _COMPRESSION_COUNTERS.compression_time += time.perf_counter() - tic
+    return loads(data)
+
+
+def _get_compression(compress_option):
+    """The compressor and minimum size of pm_compress, or None"""
+    if compress_option is None or compress_option is False:
+        return None
+    if compress_option is True:
+        compress_option = _COMPRESSORS[0]
+    if isinstance(compress_option, str):
+        compress_option = (compress_option, _COMPRESS_MIN_BYTES)
+    if (
+        not isinstance(compress_option, tuple)
+        or len(compress_option) != 2
+        or compress_option[0] not in _COMPRESSORS
+    ):
+        raise ValueError("Invalid pm_compress: {!r}".format(compress_option))
+    return compress_option
+
+
+def _get_serializer(serializer_option):
+    """The _Serializer for pm_serializer, or None to let the pool pickle"""
+    if serializer_option is None or serializer_option == "pickle":
+        return None
+    if serializer_option == "cloudpickle":
+        try:
+            import cloudpickle  # type: ignore
+        except ImportError:
+            raise ImportError(
+                "pm_serializer='cloudpickle' requires the cloudpickle package"
+            ) from None
+        return _Serializer(cloudpickle.dumps, pickle.loads)
+    if isinstance(serializer_option, tuple) and len(serializer_option) == 2:
+        return _Serializer(*serializer_option)
+    raise ValueError("Invalid pm_serializer: {!r}".format(serializer_option))
+
+
+class _Compressed:
+    """Holds a chunk of items or of results that is pickled compressed with
+    pm_compress (`compression`, see _get_compression), if its pickle is
+    large enough, and unpickled as the chunk again"""
+
+    __slots__ = ("obj", "compression")
+
+    def __init__(self, obj, compression):
+        self.obj = obj
+        self.compression = compression
+
+    def __reduce__(self):
+        compressor, min_bytes = self.compression
+        payload = _compressed_dumps(_dumps, compressor, min_bytes, self.obj)
+        return (_compressed_loads, (pickle.loads, payload))
+
+
+class _CompressedRunner:
+    """Wraps the runner of a _ChunkDispatcher for pm_compress: it travels
+    compressed (with the arguments of the function), and so do the results
+    of each chunk on their way back."""
+
+    def __init__(self, runner, compression):
+        self.runner = _Compressed(runner, compression)
+        self.compression = compression
+
+    def __call__(self, items):
+        # Unpickled in the worker, self.runner is the runner itself
+        results, elapsed = self.runner(items)
+        return _Compressed(results, self.compression), elapsed
+
+
+def _deserialize(loads, data):
+    return loads(data)
+
+
+class _Serialized:
+    """Holds an object that is pickled as its pm_serializer serialization,
+    and unpickled as the object again"""
+
+    __slots__ = ("obj", "serializer")
+
+    def __init__(self, obj, serializer):
+        self.obj = obj
+        self.serializer = serializer
+
+    def __reduce__(self):
+        serializer = self.serializer
+        return (_deserialize, (serializer.loads, serializer.dumps(self.obj)))
+
+
+class _SerializedFunction:
+    """Wraps the mapped function for pm_serializer. The function travels
+    serialized, and so do its results on their way back."""
+
+    def __init__(self, function, serializer):
+        self.function = _Serialized(function, serializer)
+        self.serializer = serializer
+
+    def __call__(self, *args, **kwargs):
+        # Unpickled in the worker, self.function is the function itself
+        return _Serialized(self.function(*args, **kwargs), self.serializer)
+
+
+def _serialize_items(iterable, serializer):
+    items = (_Serialized(item, serializer) for item in iterable)
+    return _SizedIterable(items, _get_num_tasks(iterable))
+
+
+def _is_process_pool(pool):
+    return isinstance(pool, multiprocessing.pool.Pool) and not isinstance(
+        pool, multiprocessing.pool.ThreadPool
+    )
+
+
+def _worker_rss():
+    """Resident memory of this process in bytes, or None if unknown"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # The peak, not the current memory: in bytes on macOS, KiB elsewhere
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _worker_memory_limit(max_worker_memory, pool, close_pool):
+    """The pm_max_worker_memory to apply with `pool`, or None"""
+    if max_worker_memory is None:
+        return None
+    if not close_pool or not _is_process_pool(pool):
+        # The task of a retired worker never completes: only a pool that
+        # parmap terminates afterwards can run it
+        warnings.warn(
+            "pm_max_worker_memory only applies to process pools created by "
+            "parmap for the call"
+        )
+        return None
+    return max_worker_memory
+
+
+# Seconds an item may keep running past pm_task_timeout, once interrupted,
+# before its worker is killed
+_TASK_TIMEOUT_GRACE = 1.0
+
+
+# Seconds between two checks of the parent for workers killed by
+# pm_task_timeout or retired by pm_max_worker_memory
+_WORKER_REPORT_POLL = 0.1
+
+
+def _raise_task_timeout(signum, frame):
+    raise TimeoutError("parmap: the item exceeded pm_task_timeout")
+
+
+# In a worker running a chunk for a _WorkerMonitor: the path of the file
+# reporting a killed item to the parent, and the index of the next item
+_timeout_report: T.Optional[T.List[T.Any]] = None
+
+
+def _write_report(path, report):
+    """Writes the report of a chunk for the _WorkerMonitor of the parent,
+    as a whole: the parent only sees the file once it is complete"""
+    with open(path + ".tmp", "wb") as fh:
+        fh.write(_dumps(report))
+    os.replace(path + ".tmp", path)
+
+
+class _MonitoredTask:
+    """Runs the task of a chunk in a worker for a _WorkerMonitor, at `path`.
+
+    It tells _TaskTimeout where to report an item that makes the worker be
+    killed. If the resident memory of the worker exceeds
+    `max_worker_memory` once the chunk is done, the worker is retired: the
+    result of the chunk goes to the report file instead of the pool, and
+    the worker exits, to be replaced by the pool.
+    """
+
+    def __init__(self, task, path, max_worker_memory=None):
+        self.task = task
+        self.path = path
+        self.max_worker_memory = max_worker_memory
+
+    def __call__(self, items):
+        global _timeout_report
+        _timeout_report = [self.path, 0]
+        try:
+            value = self.task(items)
+        finally:
+            _timeout_report = None
+        if self.max_worker_memory is not None:
+            rss = _worker_rss()
+            if rss is not None and rss > self.max_worker_memory:
+                try:
+                    _write_report(self.path, ("retired", value))
+                except Exception:  # e.g. a full disk: keep the worker
+                    return value
+                os._exit(0)
+        return value
+
+
+class _Watchdog:
+    """Thread of a pool worker that kills it when an item is still running
+    past its hard deadline. The index of the item is written to the report
+    file of its chunk first, for the parent to fail the chunk, and the pool
+    replaces the dead worker."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._deadline = None
+        self._report = None
+        thread = threading.Thread(target=self._run, name="parmap-watchdog")
+        thread.daemon = True
+        thread.start()
+
+    def arm(self, deadline, report):
+        with self._cond:
+            self._deadline = deadline
+            self._report = report
+            self._cond.notify()
+
+    def disarm(self):
+        with self._cond:
+            self._deadline = None
+
+    def _run(self):
+        with self._cond:
+            while True:
+                if self._deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                path, index = self._report
+                try:
+                    _write_report(path, ("timeout", index))
+                finally:
+                    os._exit(1)
+
+
+_watchdog: T.Optional[_Watchdog] = None
+_watchdog_pid: T.Optional[int] = None
+
+
+def _get_watchdog():
+    global _watchdog, _watchdog_pid
+    if _watchdog_pid != os.getpid():
+        _watchdog = _Watchdog()
+        _watchdog_pid = os.getpid()
+    return _watchdog
+
+
+class _TaskTimeout:
+    """Wraps the mapped function for pm_task_timeout. An item that runs for
+    longer than `timeout` seconds is interrupted with TimeoutError (using
+    SIGALRM, where available). If it is still running after a grace period
+    (e.g. stuck in C code), the worker is killed, and the _WorkerMonitor of
+    the parent fails its chunk."""
+
+    def __init__(self, function, timeout):
+        self.function = function
+        self.timeout = timeout
+
+    def __call__(self, *args, **kwargs):
+        report = _timeout_report
+        if report is None:  # Not a chunk of a _ChunkDispatcher
+            return self.function(*args, **kwargs)
+        index = report[1]
+        report[1] += 1
+        interrupt = (
+            hasattr(signal, "setitimer")
+            and threading.current_thread() is threading.main_thread()
+        )
+        deadline = time.monotonic() + self.timeout
+        if interrupt:
+            deadline += _TASK_TIMEOUT_GRACE
+        watchdog = _get_watchdog()
+        watchdog.arm(deadline, (report[0], index))
+        try:
+            if interrupt:
+                signal.signal(signal.SIGALRM, _raise_task_timeout)
+                signal.setitimer(signal.ITIMER_REAL, self.timeout)
+            try:
+                return self.function(*args, **kwargs)
+            finally:
+                if interrupt:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        finally:
+            watchdog.disarm()
+
+
+class _WorkerTimeout(TimeoutError):
+    """pm_task_timeout killed the worker running the item at `parmap_index`,
+    so the results of the whole chunk, of `num_items` items, are lost"""
+
+    parmap_index: int
+    num_items: int
+
+
+def _stop_worker_monitor(stopped, directory):
+    stopped.set()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class _WorkerMonitor:
+    """Completes the chunks of a _ChunkDispatcher whose worker is gone: the
+    pool would never return their result.
+
+    Each chunk runs with the path of a report file (see _MonitoredTask). A
+    worker writes it before exiting: killed by pm_task_timeout, with the
+    index of the item that timed out, or retired by pm_max_worker_memory,
+    with the result of the chunk. A thread checks for those files, and
+    reports the chunks that have one to the dispatcher, as failed with a
+    _WorkerTimeout or as completed. It stops when the dispatcher stops it
+    or is garbage collected.
+    """
+
+    def __init__(self, dispatcher, timeout=None, max_worker_memory=None):
+        self.timeout = timeout
+        self.max_worker_memory = max_worker_memory
+        self.directory = tempfile.mkdtemp(prefix="parmap-")
+        # chunk id -> (start, num_items, on_success), for the chunks in
+        # flight:
+        self._chunks: T.Dict[int, T.Tuple[int, int, T.Any]] = {}
+        self._dispatcher = weakref.ref(dispatcher)
+        self._stopped = threading.Event()
+        self.stop = weakref.finalize(
+            dispatcher, _stop_worker_monitor, self._stopped, self.directory
+        )
+        thread = threading.Thread(target=self._run, name="parmap-workers")
+        thread.daemon = True
+        thread.start()
+
+    def wrap(self, task, chunk_id, start, num_items, on_success):
+        """The task to send for a chunk. `on_success` is called with the
+        result of the chunk if its worker is retired."""
+        self._chunks[chunk_id] = (start, num_items, on_success)
+        return _MonitoredTask(
+            task,
+            os.path.join(self.directory, str(chunk_id)),
+            self.max_worker_memory,
+        )
+
+    def completed(self, chunk_id):
+        self._chunks.pop(chunk_id, None)
+
+    def _run(self):
+        while not self._stopped.wait(_WORKER_REPORT_POLL):
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                return
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(self.directory, name)
+                with open(path, "rb") as fh:
+                    kind, value = pickle.load(fh)
+                os.remove(path)
+                chunk = self._chunks.pop(int(name), None)
+                dispatcher = self._dispatcher()
+                if chunk is None or dispatcher is None:
+                    continue
+                start, num_items, on_success = chunk
+                # The task of the worker is lost in the pool
+                dispatcher.workers_killed = True
+                if kind == "retired":
+                    on_success(value)
+                    continue
+                exc = _WorkerTimeout(
+                    "parmap: the item exceeded pm_task_timeout={}s and its "
+                    "worker was killed".format(self.timeout)
+                )
+                exc.parmap_index = value
+                exc.num_items = num_items
+                if _is_shared_pool(dispatcher._pool):
+                    _discard_shared_pool(dispatcher._pool)
+                dispatcher._on_done(int(name), start, False, exc)
+                del dispatcher
+
+
+class _SizedIterable:
+    """An iterable with a known length (if not None)"""
+
+    def __init__(self, iterable, length):
+        self._iterable = iterable
+        self._length = length
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def __len__(self):
+        if self._length is None:
+            raise TypeError("object has no len()")
+        return self._length
+
+
+def _prepare_parallel_call(
+    function,
+    iterable,
+    args,
+    kwargs,
+    map_or_starmap,
+    pool,
+    close_pool,
+    shared,
+    shm_min_bytes,
+    task_timeout=None,
+    serializer=None,
+):
+    """Applies pm_share_args (`shared`), pm_shared_memory, pm_task_timeout
+    and pm_serializer to the call.
+    Returns the function, iterable, args and kwargs to send to the pool, a
+    function to apply to each chunk before sending it (or None) and a
+    function to call when the pool is done with them.
+
+    For map_or_starmap="batch" whole chunks go through shared memory,
+    instead of each item.
+    """
+    cleanups = []
+    export_chunk = None
+
+    def cleanup():
+        while cleanups:
+            cleanups.pop()()
+
+    try:
+        if _is_shared_pool(pool):
+            # Released last, once the call is done with the pool
+            cleanups.append(partial(_release_shared_pool, pool))
+        if shared is not None:
+            cleanups.append(_publish_shared_call(shared, close_pool, serializer))
+            function, args, kwargs = shared, (), {}
+        if task_timeout is not None:
+            if _is_process_pool(pool):
+                function = _TaskTimeout(function, task_timeout)
+            else:
+                warnings.warn("pm_task_timeout requires a process pool")
+        # Threads share memory already:
+        if shm_min_bytes and not isinstance(pool, multiprocessing.pool.ThreadPool):
+            transport = _ShmTransport(shm_min_bytes)
+            cleanups.append(transport.cleanup)
+            function = _ShmFunction(function, shm_min_bytes, transport.prefix)
+            args = [transport.export(x, False) for x in args]
+            kwargs = {k: transport.export(v, False) for k, v in kwargs.items()}
+            if map_or_starmap == "batch":
+                export_chunk = transport.export_chunk
+            else:
+                iterable = transport.export_items(iterable, map_or_starmap)
+        # Threads do not pickle:
+        if serializer is not None and not isinstance(
+            pool, multiprocessing.pool.ThreadPool
+        ):
+            function = _SerializedFunction(function, serializer)
+            args = [_Serialized(x, serializer) for x in args]
+            kwargs = {k: _Serialized(v, serializer) for k, v in kwargs.items()}
+            if map_or_starmap == "batch":
+                export_shm = export_chunk
+
+                def export_chunk(chunk):
+                    if export_shm is not None:
+                        chunk = export_shm(chunk)
+                    return _Serialized(chunk, serializer)
+
+            else:
+                iterable = _serialize_items(iterable, serializer)
+    except BaseException:
+        cleanup()
+        raise
+    return function, iterable, args, kwargs, export_chunk, cleanup
+
+
+def _get_shm_min_bytes(shared_memory_option):
+    """Minimum size of the objects sent through shared memory, or None"""
+    if shared_memory_option is True:
+        return _SHM_MIN_BYTES
+    return shared_memory_option or None
+
+
+def _run_initializers(initializers):
+    """Pool initializer calling each (initializer, initargs) in turn"""
+    for initializer, initargs in initializers:
+        initializer(*initargs)
+
+
+def _create_pool(kwargs, initializer=None, initargs=()):
+    parallel: bool = kwargs.pop("pm_parallel", True)
+    pool = kwargs.pop("pm_pool", None)
+    close_pool = False
+    processes: T.Optional[int] = kwargs.pop("pm_processes", None)
+    backend: str = kwargs.pop("pm_backend", "process")
+    options = {
+        "maxtasksperchild": kwargs.pop("pm_maxtasksperchild", None),
+        "start_method": kwargs.pop("pm_start_method", None),
+        "preload": kwargs.pop("pm_preload", None),
+        "initializer": kwargs.pop("pm_initializer", None),
+        "initargs": kwargs.pop("pm_initargs", None),
+    }
+    if backend not in _BACKENDS:
+        raise ValueError("Invalid pm_backend: {!r}".format(backend))
+    start_method = options["start_method"]
+    if start_method not in (None, *multiprocessing.get_all_start_methods()):
+        raise ValueError("Invalid pm_start_method: {!r}".format(start_method))
+    if backend == "serial":
+        parallel = False
+    if pool is None:
+        pool = _default_pool
+    if pool is not None and not isinstance(pool, str):
+        for name, value in options.items():
+            if value is not None:
+                warnings.warn(
+                    "pm_{} only applies to pools created by parmap".format(name)
+                )
+    if options["initializer"] is None:
+        if options["initargs"] is not None:
+            raise ValueError("pm_initargs requires pm_initializer")
+    elif initializer is None:
+        initializer, initargs = options["initializer"], options["initargs"] or ()
+    else:
+        # The pm_share_args initializer runs after the user's one
+        initializer, initargs = _run_initializers, (
+            (
+                (options["initializer"], options["initargs"] or ()),
+                (initializer, initargs),
+            ),
+        )
+    if isinstance(pool, str):
+        if pool != "shared":
+            raise ValueError("Invalid pm_pool: {!r}".format(pool))
+        pool = None
+        if parallel:
+            try:
+                pool = _get_shared_pool(processes, backend, **options)
+            except Exception as exc:  # Disable parallel on error:
+                warnings.warn(str(exc))
+                parallel = False
+    # Initialize pool if parallel:
+    elif parallel and pool is None:
+        try:
+            pool = _new_pool(
+                backend,
+                processes,
+                initializer,
+                initargs,
+                options["maxtasksperchild"],
+                start_method,
+                options["preload"],
+            )
+            close_pool = True
+        except Exception as exc:  # Disable parallel on error:
+            warnings.warn(str(exc))
+            parallel = False
+    return parallel, pool, close_pool
+
+
+def _get_default_chunksize(chunksize, pool, num_tasks):
+    # default from multiprocessing
+    # https://github.com/python/cpython/blob/master/Lib/multiprocessing/pool.py
+    if chunksize is None:
+        num_workers = len(pool._pool)
+        if num_workers == 0:
+            return 1
+        chunksize, extra = divmod(num_tasks, num_workers * 4)
+        if extra:
+            chunksize += 1
+    return chunksize
+
+
+class _ThrottledPbar:
+    """Progress bar wrapper that forwards the updates to the progress bar
+    created by `pbar_wrapper` at most every `refresh` seconds"""
+
+    def __init__(self, pbar_wrapper, refresh, **kwargs):
+        self._pbar_cm = pbar_wrapper(**kwargs)
+        self._refresh = refresh
+        self._pending = 0
+
+    def __enter__(self):
+        self._pbar = self._pbar_cm.__enter__()
+        self._last_update = time.monotonic()
+        return self
+
+    def update(self, n=1):
+        self._pending += n
+        now = time.monotonic()
+        if now - self._last_update >= self._refresh:
+            self._pbar.update(self._pending)
+            self._pending = 0
+            self._last_update = now
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if self._pending:
+            self._pbar.update(self._pending)
+        return self._pbar_cm.__exit__(exception_type, exception_value, traceback)
+
+
+def _prepare_pbar_wrapper(progress, refresh=None):
+    has_pbar = False
+    wrapper = None
+    if progress is True and HAVE_TQDM:
+        has_pbar = True
+        wrapper = tqdm.tqdm
+    elif isinstance(progress, dict) and HAVE_TQDM:
+        has_pbar = True
+        wrapper = partial(tqdm.tqdm, **progress)
+    elif callable(progress):
+        has_pbar = True
+        wrapper = progress
+    if has_pbar and refresh:
+        wrapper = partial(_ThrottledPbar, wrapper, refresh)
+    return (has_pbar, wrapper)
+
+
+def _serial_imap_or_istarmap(
+    function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+):
+    func_star = _get_helper_func(map_or_starmap)
+    args = list(args)
+    if pbar_wrapper is None:
+        for item in iterable:
+            yield func_star((function, item, args, kwargs))
+        return
+    # Use the same progress bar protocol as in parallel, so any tqdm
+    # compatible callable works.
+    with pbar_wrapper(total=_get_num_tasks(iterable)) as pbar:
+        for item in iterable:
+            yield func_star((function, item, args, kwargs))
+            pbar.update(1)
+
+
+def _serial_map_or_starmap(
+    function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+):
+    if pbar_wrapper is not None:
+        return list(
+            _serial_imap_or_istarmap(
+                function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+            )
+        )
+    if map_or_starmap == "map":
+        output = [function(*([item] + list(args)), **kwargs) for item in iterable]
+    elif map_or_starmap == "starmap":
+        output = [function(*(list(item) + list(args)), **kwargs) for item in iterable]
+    else:
+        raise AssertionError(
+            "Internal parmap error: Invalid map_or_starmap." + " This should not happen"
+        )
+    return output
+
+
+def _get_helper_func(map_or_starmap):
+    if map_or_starmap == "map":
+        func_star = _func_star_single
+    elif map_or_starmap == "starmap":
+        func_star = _func_star_many
+    else:
+        raise AssertionError(
+            "Internal parmap error: Invalid map_or_starmap." + " This should not happen"
+        )
+    return func_star
+
+
+class _ChunkRunner:
+    """Evaluates a chunk of items in a worker.
+
+    It is pickled once per chunk, so the function and its additional
+    arguments travel once per chunk instead of once per item. Returns the
+    results and the time it took to compute them.
+
+    The exception raised by an item gets its index in the chunk as its
+    ``parmap_index`` attribute (the dispatcher adds the chunk start).
+    """
+
+    def __init__(self, function, args, kwargs, map_or_starmap):
+        self.func_star = _get_helper_func(map_or_starmap)
+        self.function = function
+        self.args = list(args)
+        self.kwargs = kwargs
+
+    def __call__(self, items):
+        func_star = self.func_star
+        function, args, kwargs = self.function, self.args, self.kwargs
+        tic = time.perf_counter()
+        results = []
+        try:
+            for item in items:
+                results.append(func_star((function, item, args, kwargs)))
+        except Exception as exc:
+            _set_parmap_index(exc, len(results))
+            raise
+        return results, time.perf_counter() - tic
+
+
+def _set_parmap_index(exc, index):
+    """Adds `index` to the parmap_index attribute of `exc`"""
+    try:
+        exc.parmap_index = index + getattr(exc, "parmap_index", 0)
+    except AttributeError:  # Exceptions with __slots__
+        pass
+
+
+class _BatchFunction:
+    """Calls the function given to map_batched on a batch of items, and
+    checks that it returns one result per item.
+    """
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, batch, *args, **kwargs):
+        results = self.function(batch, *args, **kwargs)
+        if len(results) != len(batch):
+            raise ValueError(
+                "map_batched: {!r} returned {} results for a batch of {} "
+                "items".format(self.function, len(results), len(batch))
+            )
+        return results
+
+
+class _BatchRunner:
+    """Like _ChunkRunner, for map_batched: calls the function once per
+    chunk, with the whole chunk as its first argument.
+    """
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = list(args)
+        self.kwargs = kwargs
+
+    def __call__(self, items):
+        tic = time.perf_counter()
+        results = self.function(items, *self.args, **self.kwargs)
+        return results, time.perf_counter() - tic
+
+
+class _FixedChunksize:
+    """Chunk size policy of a _ChunkDispatcher: always the same size"""
+
+    def __init__(self, chunksize):
+        self.chunksize = max(chunksize, 1)
+
+    def next_size(self, num_dispatched):
+        return self.chunksize
+
+    def record(self, num_items, elapsed):
+        pass
+
+
+# Computing time per chunk targeted by pm_chunksize="auto". Long enough to
+# make the dispatch overhead of each chunk negligible, short enough to
+# balance the load between workers.
+_AUTO_CHUNK_TARGET = 0.1
+
+
+class _AdaptiveChunksize:
+    """Chunk size policy of a _ChunkDispatcher for pm_chunksize="auto".
+
+    It starts with single item chunks, and then sizes the chunks so each of
+    them takes about `target` seconds, according to a moving average of the
+    measured time per item. Chunks at most double their size from one to
+    the next, to be robust to a few fast items at the beginning.
+
+    If the number of items is known, chunks never take more than a fraction
+    of the remaining items, so chunks get smaller near the end and all
+    workers finish at about the same time.
+    """
+
+    def __init__(self, num_workers, num_tasks=None, target=_AUTO_CHUNK_TARGET):
+        self.num_workers = max(num_workers, 1)
+        self.num_tasks = num_tasks
+        self.target = target
+        self.time_per_item: T.Optional[float] = None
+        self.last_size = 1
+
+    def next_size(self, num_dispatched):
+        if self.time_per_item is None:
+            size = 1
+        elif self.time_per_item > 0:
+            size = int(self.target / self.time_per_item)
+        else:
+            size = 2 * self.last_size
+        size = max(min(size, 2 * self.last_size), 1)
+        if self.num_tasks is not None:
+            remaining = self.num_tasks - num_dispatched
+            size = min(size, -(-remaining // (2 * self.num_workers)))
+        size = max(size, 1)
+        self.last_size = size
+        return size
+
+    def record(self, num_items, elapsed):
+        time_per_item = elapsed / num_items
+        if self.time_per_item is None:
+            self.time_per_item = time_per_item
+        else:
+            self.time_per_item = 0.7 * self.time_per_item + 0.3 * time_per_item
+
+
+class _GuidedChunksize:
+    """Chunk size policy of a _ChunkDispatcher for pm_chunksize="guided".
+
+    Guided self-scheduling: each chunk takes a fraction of the remaining
+    items, so chunks are large at the beginning, when their dispatch
+    overhead matters, and shrink to single items near the end. Idle workers
+    take the next chunk from the shared queue, so with skewed item costs no
+    worker is left with a large chunk while the others run out of work.
+
+    If the number of items is unknown, every chunk has a single item.
+    """
+
+    def __init__(self, num_workers, num_tasks=None):
+        self.num_workers = max(num_workers, 1)
+        self.num_tasks = num_tasks
+
+    def next_size(self, num_dispatched):
+        if self.num_tasks is None:
+            return 1
+        remaining = self.num_tasks - num_dispatched
+        return max(-(-remaining // (2 * self.num_workers)), 1)
+
+    def record(self, num_items, elapsed):
+        pass
+
+
+def _make_chunk_policy(chunksize, pool, num_tasks):
+    """Returns the chunk size policy of a _ChunkDispatcher for pm_chunksize"""
+    if chunksize == "auto":
+        return _AdaptiveChunksize(len(pool._pool), num_tasks)
+    if chunksize == "guided":
+        return _GuidedChunksize(len(pool._pool), num_tasks)
+    if chunksize is None and num_tasks is None:
+        chunksize = 1
+    return _FixedChunksize(_get_default_chunksize(chunksize, pool, num_tasks))
+
+
+def _default_max_inflight(pool):
+    # Enough to keep each worker busy while its next chunk waits:
+    return max(2 * len(pool._pool), 1)
+
+
+class ChunkStats(T.NamedTuple):
+    """Measurements of one chunk, recorded by :py:class:`Stats`.
+
+    Times are in seconds. Timestamps (``*_at``) are :py:func:`time.time`
+    values, comparable between the parent and the workers.
+    """
+
+    #: Index of the first item of the chunk
+    start: int
+    num_items: int
+    #: Process and thread of the worker that ran the chunk
+    pid: int
+    thread_id: int
+    #: Pickling the function, its arguments and the items in the parent
+    pickle_time: float
+    bytes_in: int
+    #: From sending the chunk until the worker unpickled it (queue wait,
+    #: transfer and unpickling)
+    dispatch_time: float
+    compute_time: float
+    #: Pickling the results in the worker
+    result_pickle_time: float
+    bytes_out: int
+    #: From the worker finishing until the parent received the results
+    return_time: float
+    dispatched_at: float
+    started_at: float
+    finished_at: float
+    received_at: float
+    #: With pm_compress, size of the compressed payloads of the chunk and
+    #: its results before and after compression, and time spent compressing
+    #: and decompressing them (in the parent and in the worker)
+    uncompressed_bytes: int = 0
+    compressed_bytes: int = 0
+    compression_time: float = 0.0
+
+
+class Stats:
+    """Collects a :py:class:`ChunkStats` per chunk of a parallel call, given
+    with ``pm_stats=``. For instance::
+
+        stats = parmap.Stats()
+        parmap.map(myfunction, mylist, pm_stats=stats)
+        print(stats.summary())
+        print(stats.by_worker())
+
+    Override :py:meth:`record` to process chunks as they complete. Serial
+    runs record nothing.
+    """
+
+    def __init__(self):
+        self.chunks: T.List[ChunkStats] = []
+
+    def record(self, chunk):
+        """Called in the parent with the ChunkStats of each chunk"""
+        self.chunks.append(chunk)
+
+    @property
+    def wall_time(self):
+        """From the first chunk sent to the last one received"""
+        if not self.chunks:
+            return 0.0
+        return max(c.received_at for c in self.chunks) - min(
+            c.dispatched_at for c in self.chunks
+        )
+
+    def by_worker(self):
+        """Returns a dict with the chunks, items, compute time and idle time
+        of each worker, by ``(pid, thread_id)``. Idle time is the part of
+        :py:attr:`wall_time` the worker did not spend running chunks."""
+        workers: T.Dict[T.Tuple[int, int], T.Dict[str, T.Any]] = {}
+        for c in self.chunks:
+            worker = workers.setdefault(
+                (c.pid, c.thread_id),
+                {"chunks": 0, "items": 0, "compute_time": 0.0, "busy_time": 0.0},
+            )
+            worker["chunks"] += 1
+            worker["items"] += c.num_items
+            worker["compute_time"] += c.compute_time
+            worker["busy_time"] += c.finished_at - c.started_at
+        wall_time = self.wall_time
+        for worker in workers.values():
+            worker["idle_time"] = max(wall_time - worker.pop("busy_time"), 0.0)
+        return workers
+
+    def summary(self):
+        """Returns a dict with the totals of all chunks"""
+        output: T.Dict[str, T.Any] = {
+            "chunks": len(self.chunks),
+            "items": sum(c.num_items for c in self.chunks),
+            "wall_time": self.wall_time,
+        }
+        for field in (
+            "pickle_time",
+            "bytes_in",
+            "dispatch_time",
+            "compute_time",
+            "result_pickle_time",
+            "bytes_out",
+            "return_time",
+            "uncompressed_bytes",
+            "compressed_bytes",
+            "compression_time",
+        ):
+            output[field] = sum(getattr(c, field) for c in self.chunks)
+        output["compression_ratio"] = (
+            output["uncompressed_bytes"] / output["compressed_bytes"]
+            if output["compressed_bytes"]
+            else None
+        )
+        workers = self.by_worker()
+        output["workers"] = len(workers)
+        output["idle_time"] = sum(w["idle_time"] for w in workers.values())
+        return output
+
+
+def _pop_stats(kwargs):
+    """Pops pm_stats from kwargs, checking it is a Stats"""
+    stats = kwargs.pop("pm_stats", None)
+    if stats is not None and not isinstance(stats, Stats):
+        raise TypeError("pm_stats must be a parmap.Stats, not {!r}".format(stats))
+    return stats
+
+
+def _dumps(obj):
+    return bytes(ForkingPickler.dumps(obj))
+
+
+def _run_measured(payload):
+    """Runs a chunk pickled by a _ChunkDispatcher with stats, measuring it
+    in the worker. The results are returned pickled, to measure them."""
+    compression = _COMPRESSION_COUNTERS.snapshot()
+    runner, items = pickle.loads(payload)
+    started_at = time.time()
+    results, elapsed = runner(items)
+    tic = time.perf_counter()
+    results = _dumps(results)
+    result_pickle_time = time.perf_counter() - tic
+    return (
+        results,
+        elapsed,
+        result_pickle_time,
+        os.getpid(),
+        threading.get_ident(),
+        started_at,
+        time.time(),
+        _COMPRESSION_COUNTERS.since(compression),
+    )
+
+
+class _UnlessCancelled:
+    """Runs the task of a chunk in a worker unless the file at `path`
+    exists: the call was cancelled, or failed, after the chunk was given to
+    the pool. If `task` is None, the task and the items come pickled
+    together, so a skipped chunk is not even unpickled (the files and
+    shared memory it refers to may be gone already)."""
+
+    def __init__(self, task, path):
+        self.task = task
+        self.path = path
+
+    def __call__(self, items):
+        if os.path.exists(self.path):
+            raise concurrent.futures.CancelledError()
+        task = self.task
+        if task is None:
+            task, items = pickle.loads(items)
+        return task(items)
+
+
+class _ChunkDispatcher:
+    """Lazily splits `iterable` in chunks and evaluates them with `runner`
+    on `pool`, keeping at most `max_inflight` chunks dispatched but not yet
+    consumed. Chunk sizes are chosen by `chunk_policy` (see
+    _FixedChunksize and _AdaptiveChunksize).
+
+    Iterating over it yields ``(start, results)`` for each chunk, where
+    `start` is the index of the first item of the chunk. Chunks are yielded
+    in input order if `ordered` is True, or as soon as they complete
+    otherwise. The exception raised by a chunk is raised when that chunk
+    would have been yielded.
+
+    Chunks are lists of items, or slices of `iterable` if it is an array.
+    If given, `export_chunk` is applied to each chunk before sending it.
+    With `compression` (pm_compress), process pools get each chunk, and
+    return its results, pickled as a whole and compressed.
+
+    If `stats` (a Stats) is given, chunks and results are pickled by the
+    dispatcher itself to measure them, and recorded as they are yielded.
+
+    If `task_timeout` (pm_task_timeout) is given, chunks whose worker is
+    killed fail with a _WorkerTimeout. If `collect_timeouts`, such a chunk
+    yields a Failure as the result of the item that timed out instead, and
+    _LOST for the others. If `max_worker_memory` (pm_max_worker_memory) is
+    given, workers that exceed it after a chunk are retired, and the result
+    of their chunk still arrives. In both cases `workers_killed` is set:
+    the pool has a task that never completes, and must be terminated.
+    """
+
+    def __init__(
+        self,
+        pool,
+        runner,
+        iterable,
+        chunk_policy,
+        max_inflight,
+        ordered,
+        export_chunk=None,
+        stats=None,
+        task_timeout=None,
+        collect_timeouts=False,
+        max_worker_memory=None,
+        compression=None,
+    ):
+        self._pool = pool
+        self._runner = runner
+        self._compression = None
+        if compression is not None and _is_process_pool(pool):
+            # Threads do not pickle
+            self._runner = _CompressedRunner(runner, compression)
+            self._compression = compression
+        if _is_sliceable(iterable):
+            self._array = iterable
+        else:
+            self._array = None
+            self._iterator = iter(iterable)
+        self._export_chunk = export_chunk
+        self._stats = stats
+        self._chunk_policy = chunk_policy
+        self._max_inflight = max_inflight
+        self._ordered = ordered
+        # Filled from the pool result handler thread:
+        self._completed: "queue.SimpleQueue[T.Any]" = queue.SimpleQueue()
+        self._num_dispatched = 0  # chunks
+        self._num_items = 0
+        self._num_consumed = 0  # chunks
+        self._exhausted = False
+        # Completed chunks not yielded yet (if ordered, because an earlier
+        # chunk is still running). They count as in-flight, so max_inflight
+        # also bounds this buffer.
+        self._ready: T.Dict[int, T.Any] = {}
+        self.workers_killed = False
+        self._collect_timeouts = collect_timeouts
+        self._monitor = None
+        if _is_process_pool(pool) and (
+            task_timeout is not None or max_worker_memory is not None
+        ):
+            self._monitor = _WorkerMonitor(self, task_timeout, max_worker_memory)
+        # Path of the file telling the workers to skip the chunks they get
+        # (see _UnlessCancelled), if any
+        self._cancel_path: T.Optional[str] = None
+
+    def _fill(self):
+        while (
+            not self._exhausted
+            and self._num_dispatched - self._num_consumed < self._max_inflight
+        ):
+            chunksize = self._chunk_policy.next_size(self._num_items)
+            if self._array is not None:
+                items = self._array[self._num_items : self._num_items + chunksize]
+            else:
+                items = list(islice(self._iterator, chunksize))
+            num_items = len(items)
+            if num_items == 0:
+                self._exhausted = True
+                break
+            if self._export_chunk is not None:
+                items = self._export_chunk(items)
+            if self._compression is not None:
+                items = _Compressed(items, self._compression)
+            chunk_id, start = self._num_dispatched, self._num_items
+            if self._stats is None:
+                task, callback = self._runner, self._on_done
+            else:
+                compression = _COMPRESSION_COUNTERS.snapshot()
+                tic = time.perf_counter()
+                items = _dumps((self._runner, items))
+                sent = (
+                    num_items,
+                    time.perf_counter() - tic,
+                    len(items),
+                    time.time(),
+                    _COMPRESSION_COUNTERS.since(compression),
+                )
+                task, callback = _run_measured, partial(self._on_measured, sent)
+            on_success = partial(callback, chunk_id, start, True)
+            if self._monitor is not None:
+                task = self._monitor.wrap(
+                    task, chunk_id, start, num_items, on_success
+                )
+            if self._cancel_path is not None:
+                if _is_process_pool(self._pool):
+                    items = _dumps((task, items))
+                    task = _UnlessCancelled(None, self._cancel_path)
+                else:
+                    task = _UnlessCancelled(task, self._cancel_path)
+            self._pool.apply_async(
+                task,
+                (items,),
+                callback=on_success,
+                error_callback=partial(self._on_done, chunk_id, start, False),
+            )
+            self._num_dispatched += 1
+            self._num_items += num_items
+
+    def _on_done(self, chunk_id, start, success, value):
+        self._completed.put((chunk_id, start, success, value))
+
+    def _on_measured(self, sent, chunk_id, start, success, value):
+        self._on_done(chunk_id, start, success, (value, sent, time.time()))
+
+    def _record(self, start, measured):
+        """Records the stats of a chunk run by _run_measured, returning its
+        unpickled value"""
+        value, sent, received_at = measured
+        payload, elapsed, result_pickle_time, pid, thread_id = value[:5]
+        started_at, finished_at, worker_compression = value[5:]
+        num_items, pickle_time, bytes_in, dispatched_at, compression = sent
+        snapshot = _COMPRESSION_COUNTERS.snapshot()
+        results = pickle.loads(payload)
+        compression = [
+            dispatched + worker + returned
+            for dispatched, worker, returned in zip(
+                compression,
+                worker_compression,
+                _COMPRESSION_COUNTERS.since(snapshot),
+            )
+        ]
+        self._stats.record(
+            ChunkStats(
+                start=start,
+                num_items=num_items,
+                pid=pid,
+                thread_id=thread_id,
+                pickle_time=pickle_time,
+                bytes_in=bytes_in,
+                dispatch_time=started_at - dispatched_at,
+                compute_time=elapsed,
+                result_pickle_time=result_pickle_time,
+                bytes_out=len(payload),
+                return_time=received_at - finished_at,
+                dispatched_at=dispatched_at,
+                started_at=started_at,
+                finished_at=finished_at,
+                received_at=received_at,
+                uncompressed_bytes=compression[0],
+                compressed_bytes=compression[1],
+                compression_time=compression[2],
+            )
+        )
+        return results, elapsed
+
+    def _add_completed(self, completed):
+        chunk_id, start, success, value = completed
+        if self._monitor is not None:
+            self._monitor.completed(chunk_id)
+        self._ready[chunk_id] = (start, success, value)
+
+    def _pop_ready(self):
+        """Returns the next chunk that can be yielded, or None if it has not
+        completed yet"""
+        if not self._ordered:
+            return self._ready.popitem()[1] if self._ready else None
+        return self._ready.pop(self._num_consumed, None)
+
+    def _consume(self, chunk):
+        """Returns the start and the results of a completed chunk (or
+        raises its exception), and dispatches more chunks"""
+        start, success, value = chunk
+        self._num_consumed += 1
+        if not success:
+            _set_parmap_index(value, start)
+            if self._collect_timeouts and isinstance(value, _WorkerTimeout):
+                results: T.List[T.Any] = [_LOST] * value.num_items
+                results[value.parmap_index - start] = Failure(value)
+                self._fill()
+                return start, results
+            raise value
+        if self._stats is not None:
+            value = self._record(start, value)
+        results, elapsed = value
+        if len(results) > 0:
+            self._chunk_policy.record(len(results), elapsed)
+        self._fill()
+        return start, results
+
+    def _stop_monitor(self):
+        if self._monitor is not None:
+            self._monitor.stop()
+
+    def __iter__(self):
+        try:
+            self._fill()
+            while self._num_consumed < self._num_dispatched:
+                chunk = self._pop_ready()
+                while chunk is None:
+                    self._add_completed(self._completed.get())
+                    chunk = self._pop_ready()
+                yield self._consume(chunk)
+        finally:
+            self._stop_monitor()
+
+
+class _BackgroundChunkDispatcher(_ChunkDispatcher):
+    """_ChunkDispatcher driven by the chunk completion callbacks, for
+    map_async and starmap_async. Implements the AsyncResult API, with the
+    results of all the chunks in input order.
+
+    After the first error no more chunks are dispatched. The error is
+    reported once the chunks in flight complete, or immediately if
+    `fail_fast`. If `close_pool`, the pool is closed once all the chunks
+    complete (see pool_closed); otherwise it has to be terminated.
+
+    If `skip_cancelled`, the workers skip the chunks they get once the call
+    is cancelled or fails: for pools that are not terminated, which are
+    given many chunks at once.
+    """
+
+    def __init__(
+        self,
+        *args,
+        fail_fast=False,
+        close_pool=False,
+        callback=None,
+        error_callback=None,
+        skip_cancelled=False,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self._num_returned = 0  # chunks, including those discarded
+        if skip_cancelled:
+            directory = tempfile.mkdtemp(prefix="parmap-")
+            self._cancel_path = os.path.join(directory, "cancelled")
+            self._remove_cancel_path = weakref.finalize(
+                self, shutil.rmtree, directory, ignore_errors=True
+            )
+        self._fail_fast = fail_fast
+        self._close_pool = close_pool
+        self._callback = callback
+        self._error_callback = error_callback
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._finished = False
+        self._chunks: T.List[T.Any] = []
+        self._error: T.Optional[BaseException] = None
+        self._value = None
+        self.pool_closed = False
+
+    @property
+    def _number_left(self):
+        # Chunks, as in AsyncResult. Unknown chunks count as one.
+        left = self._num_dispatched - self._num_consumed
+        return left if self._exhausted or self._finished else left + 1
+
+    def start(self):
+        with self._lock:
+            self._fill()
+            finished = self._check_finished()
+        if finished:
+            self._finish()
+        self._drain()
+
+    def _fill(self):
+        if self._error is None:
+            super()._fill()
+
+    def _on_done(self, chunk_id, start, success, value):
+        self._completed.put((chunk_id, start, success, value))
+        self._drain()
+
+    def _drain(self):
+        """Processes the completed chunks. Completions are queued and
+        processed by whichever thread holds the lock, as a pool may run the
+        callback of a chunk while the chunk is being dispatched."""
+        while not self._completed.empty():
+            if not self._lock.acquire(blocking=False):
+                return  # The thread holding the lock will process them
+            try:
+                while not self._completed.empty():
+                    completed = self._completed.get()
+                    self._num_returned += 1
+                    if self._finished:
+                        continue  # Results of a cancelled or failed call
+                    self._add_completed(completed)
+                    chunk = self._pop_ready()
+                    while chunk is not None:
+                        try:
+                            self._chunks.append(self._consume(chunk))
+                        except Exception as exc:
+                            if self._error is None:
+                                self._error = exc
+                                self._skip_pending()
+                        chunk = self._pop_ready()
+                finished = self._check_finished()
+                if self._finished and self._num_returned == self._num_dispatched:
+                    self._stop_skipping()
+            finally:
+                self._lock.release()
+            if finished:
+                self._finish()
+
+    def _check_finished(self):
+        """Whether the result can be set now. Call with the lock held."""
+        in_flight = self._num_dispatched - self._num_consumed
+        if self._finished:
+            return False
+        if self._error is not None:
+            self._finished = self._fail_fast or in_flight == 0
+        else:
+            self._finished = self._exhausted and in_flight == 0
+        return self._finished
 
+    def cancel(self):
+        """Stops dispatching chunks, and sets a CancelledError as the result
+        if it was not set already. Returns whether it was not set."""
+        with self._lock:
+            if self._finished:
+                return False
+            self._error = concurrent.futures.CancelledError()
+            self._finished = True
+        self._skip_pending()
+        self._finish()
+        return True
 
-def _func_star_single(func_item_args):
-    """Equivalent to:
-    func = func_item_args[0]
-    item = func_item_args[1]
-    args = func_item_args[2]
-    kwargs = func_item_args[3]
-    return func(item, args[0], args[1], ..., **kwargs)
-    """
-    return func_item_args[0](
-        *[func_item_args[1]] + func_item_args[2], **func_item_args[3]
-    )
+    def _skip_pending(self):
+        """Makes the workers skip the chunks they did not start yet"""
+        if self._cancel_path is not None:
+            with open(self._cancel_path, "w"):
+                pass
 
+    def _stop_skipping(self):
+        """Removes the cancel file, once no chunks are left in the pool"""
+        if self._cancel_path is not None:
+            self._remove_cancel_path()
 
-def _func_star_many(func_items_args):
-    """Equivalent to:
-    func = func_items_args[0]
-    items = func_items_args[1]
-    args = func_items_args[2]
-    kwargs = func_items_args[3]
-    return func(items[0], items[1], ..., args[0], args[1], ..., **kwargs)
+    def _finish(self):
+        self._stop_monitor()
+        if (
+            self._close_pool
+            and self._num_dispatched == self._num_consumed
+            and not self.workers_killed
+        ):
+            self._pool.close()
+            self.pool_closed = True
+        if self._error is None:
+            self._chunks.sort(key=itemgetter(0))
+            self._value = [r for _, results in self._chunks for r in results]
+        self._chunks = []
+        self._event.set()
+        if self._error is not None:
+            if self._error_callback is not None:
+                self._error_callback(self._error)
+        elif self._callback is not None:
+            self._callback(self._value)
+
+    def get(self, timeout=None):
+        self.wait(timeout)
+        if not self.ready():
+            raise multiprocessing.TimeoutError
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def wait(self, timeout=None):
+        self._event.wait(timeout)
+
+    def ready(self):
+        return self._event.is_set()
+
+    def successful(self):
+        if not self.ready():
+            raise ValueError("{!r} not ready".format(self))
+        return self._error is None
+
+
+class _AsyncChunkDispatcher(_ChunkDispatcher):
+    """_ChunkDispatcher to iterate with ``async for`` in the event loop
+    `loop`. Chunk completions are handed to the loop from the pool result
+    handler thread, so waiting for them never blocks the loop.
     """
-    return func_items_args[0](
-        *list(func_items_args[1]) + func_items_args[2], **func_items_args[3]
-    )
 
+    def __init__(self, loop, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop = loop
+        self._async_completed: "asyncio.Queue[T.Any]" = asyncio.Queue()
 
-def _create_pool(kwargs):
-    parallel: bool = kwargs.pop("pm_parallel", True)
-    pool: T.Optional[multiprocessing.Pool] = kwargs.pop("pm_pool", None)
-    close_pool = False
-    processes: T.Optional[int] = kwargs.pop("pm_processes", None)
-    # Initialize pool if parallel:
-    if parallel and pool is None:
+    def _on_done(self, chunk_id, start, success, value):
         try:
-            pool = multiprocessing.Pool(processes=processes)
-            close_pool = True
-        except Exception as exc:  # Disable parallel on error:
-            warnings.warn(str(exc))
-            parallel = False
-    return parallel, pool, close_pool
+            self._loop.call_soon_threadsafe(
+                self._async_completed.put_nowait, (chunk_id, start, success, value)
+            )
+        except RuntimeError:  # The loop is closed, nobody is waiting
+            pass
+
+    async def __aiter__(self):
+        try:
+            self._fill()
+            while self._num_consumed < self._num_dispatched:
+                chunk = self._pop_ready()
+                while chunk is None:
+                    self._add_completed(await self._async_completed.get())
+                    chunk = self._pop_ready()
+                yield self._consume(chunk)
+        finally:
+            self._stop_monitor()
 
 
-def _do_pbar(async_result, num_tasks, chunksize, refresh_time, pbar_wrapper):
-    remaining = num_tasks
-    # tqdm provides a progress bar.
-    # the pbar needs to be updated with the increment on each
-    # iteration.
+def _iter_chunks(dispatcher, pbar_wrapper, num_tasks):
+    """Iterates over the chunks of `dispatcher`, updating the progress bar"""
+    if pbar_wrapper is None:
+        yield from dispatcher
+        return
     with pbar_wrapper(total=num_tasks) as pbar:
-        while True:
-            if async_result.ready():
-                pbar.update(remaining)
-                break
-            try:
-                remaining_now = async_result._number_left * chunksize
-                done_now = remaining - remaining_now
-                remaining = remaining_now
-            except AttributeError:
-                # _number_left is a private multiprocessing attribute that
-                # may not be present on all AsyncResult-like objects.
-                break
-            if done_now > 0:
-                pbar.update(done_now)
-            async_result.wait(refresh_time)  # update every two seconds
+        for chunk in dispatcher:
+            pbar.update(len(chunk[1]))
+            yield chunk
 
 
-def _get_default_chunksize(chunksize, pool, num_tasks):
-    # default from multiprocessing
-    # https://github.com/python/cpython/blob/master/Lib/multiprocessing/pool.py
-    if chunksize is None:
-        num_workers = len(pool._pool)
-        if num_workers == 0:
-            return 1
-        chunksize, extra = divmod(num_tasks, num_workers * 4)
-        if extra:
-            chunksize += 1
-    return chunksize
+class _Indices:
+    """The indices from `start` to `stop` (excluded) of a map_indexed
+    source. Its slices are _Indices too, so chunks of indices are sent to
+    the workers as two numbers."""
 
+    def __init__(self, start, stop):
+        self.start = start
+        self.stop = stop
 
-def _prepare_pbar_wrapper(progress):
-    has_pbar = False
-    wrapper = None
-    if progress is True and HAVE_TQDM:
-        has_pbar = True
-        wrapper = tqdm.tqdm
-    elif isinstance(progress, dict) and HAVE_TQDM:
-        has_pbar = True
-        wrapper = partial(tqdm.tqdm, **progress)
-    elif callable(progress):
-        has_pbar = True
-        wrapper = progress
-    return (has_pbar, wrapper)
+    def __len__(self):
+        return self.stop - self.start
 
+    def __iter__(self):
+        return iter(range(self.start, self.stop))
 
-def _serial_map_or_starmap(
-    function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
-):
-    if pbar_wrapper is not None:
-        iterable = pbar_wrapper(iterable)
-    if map_or_starmap == "map":
-        output = [function(*([item] + list(args)), **kwargs) for item in iterable]
-    elif map_or_starmap == "starmap":
-        output = [function(*(list(item) + list(args)), **kwargs) for item in iterable]
-    else:
-        raise AssertionError(
-            "Internal parmap error: Invalid map_or_starmap." + " This should not happen"
-        )
-    return output
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(len(self))
+        return _Indices(self.start + start, self.start + max(start, stop))
 
 
-def _get_helper_func(map_or_starmap):
-    if map_or_starmap == "map":
-        func_star = _func_star_single
-    elif map_or_starmap == "starmap":
-        func_star = _func_star_many
-    else:
-        raise AssertionError(
-            "Internal parmap error: Invalid map_or_starmap." + " This should not happen"
-        )
-    return func_star
+def _is_array(iterable):
+    """Whether `iterable` is a NumPy array"""
+    np = sys.modules.get("numpy")
+    return np is not None and isinstance(iterable, np.ndarray) and iterable.ndim > 0
+
+
+def _is_sliceable(iterable):
+    """Whether `iterable` can be chunked by slicing"""
+    return isinstance(iterable, _Indices) or _is_array(iterable)
+
+
+def _get_num_tasks(iterable):
+    """Returns len(iterable), or None if it has no length"""
+    try:
+        return len(iterable)
+    except TypeError:
+        return None
 
 
 def _deprecated_kwargs(kwargs, arg_newarg):
@@ -249,6 +2482,27 @@ _RESERVED_KWARGS_MAP = (
     "pm_pool",
     "pm_processes",
     "pm_pbar",
+    "pm_pbar_refresh",
+    "pm_share_args",
+    "pm_backend",
+    "pm_shared_memory",
+    "pm_maxtasksperchild",
+    "pm_max_worker_memory",
+    "pm_task_timeout",
+    "pm_start_method",
+    "pm_initializer",
+    "pm_initargs",
+    "pm_preload",
+    "pm_serializer",
+    "pm_compress",
+    "pm_fail_fast",
+    "pm_on_error",
+    "pm_retries",
+    "pm_retry_delay",
+    "pm_stats",
+    "pm_cache",
+    "pm_checkpoint",
+    "pm_ordered",
     "parallel",
     "chunksize",
     "pool",
@@ -262,6 +2516,19 @@ _RESERVED_KWARGS_ASYNC = (
     "pm_processes",
     "pm_callback",
     "pm_error_callback",
+    "pm_share_args",
+    "pm_backend",
+    "pm_shared_memory",
+    "pm_maxtasksperchild",
+    "pm_max_worker_memory",
+    "pm_task_timeout",
+    "pm_start_method",
+    "pm_initializer",
+    "pm_initargs",
+    "pm_preload",
+    "pm_serializer",
+    "pm_compress",
+    "pm_fail_fast",
     "parallel",
     "chunksize",
     "pool",
@@ -271,6 +2538,53 @@ _RESERVED_KWARGS_ASYNC = (
 )
 
 
+_RESERVED_KWARGS_BATCHED = (
+    "pm_parallel",
+    "pm_chunksize",
+    "pm_pool",
+    "pm_processes",
+    "pm_pbar",
+    "pm_pbar_refresh",
+    "pm_share_args",
+    "pm_backend",
+    "pm_shared_memory",
+    "pm_maxtasksperchild",
+    "pm_max_worker_memory",
+    "pm_task_timeout",
+    "pm_start_method",
+    "pm_initializer",
+    "pm_initargs",
+    "pm_preload",
+    "pm_serializer",
+    "pm_compress",
+    "pm_stats",
+)
+_RESERVED_KWARGS_IMAP = (
+    "pm_parallel",
+    "pm_chunksize",
+    "pm_pool",
+    "pm_processes",
+    "pm_pbar",
+    "pm_pbar_refresh",
+    "pm_share_args",
+    "pm_max_inflight",
+    "pm_backend",
+    "pm_shared_memory",
+    "pm_maxtasksperchild",
+    "pm_max_worker_memory",
+    "pm_task_timeout",
+    "pm_start_method",
+    "pm_initializer",
+    "pm_initargs",
+    "pm_preload",
+    "pm_serializer",
+    "pm_compress",
+    "pm_stats",
+)
+
+_RESERVED_KWARGS_REDUCE = _RESERVED_KWARGS_IMAP + ("pm_initial",)
+
+
 def _warn_reserved_kwarg_collisions(function, kwargs, reserved_names):
     """Warn if `function`'s own signature declares a parameter name that
     the caller also passed as one of parmap's reserved keyword arguments.
@@ -296,6 +2610,348 @@ def _warn_reserved_kwarg_collisions(function, kwargs, reserved_names):
         )
 
 
+class Cache:
+    """On-disk store of results for ``pm_cache=``, in an SQLite database at
+    `path`. For instance::
+
+        cache = parmap.Cache("results.sqlite", max_bytes=2**30)
+        y = parmap.map(myfunction, mylist, pm_cache=cache)
+
+    Results are keyed by a hash of the function (its qualified name and
+    source code), the item, the additional arguments and whether it was a
+    map or a starmap. Items and arguments are hashed by their pickle, so
+    objects without a deterministic pickle (e.g. sets of strings) never
+    hit the cache.
+
+    When the pickled results exceed `max_bytes` (None for no limit), the
+    least recently used ones are evicted.
+    """
+
+    # SQLite limits the number of parameters of a statement:
+    _BATCH = 500
+
+    def __init__(self, path, max_bytes=2**30):
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Connection in a transaction, committed if there are no errors"""
+        # Imported here: some Python builds lack sqlite3
+        import sqlite3
+
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def keys(self, function, items, args, kwargs, map_or_starmap):
+        """Returns the key of the result of each of `items`"""
+        prefix = _call_fingerprint(function, args, kwargs, map_or_starmap)
+        return [
+            hashlib.sha256(prefix + pickle.dumps(item, protocol=4)).hexdigest()
+            for item in items
+        ]
+
+    def get_many(self, keys):
+        """Returns a dict with the results found for `keys`"""
+        found = {}
+        now = time.time()
+        with self._connect() as conn:
+            for start in range(0, len(keys), self._BATCH):
+                batch = keys[start : start + self._BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    "SELECT key, value FROM results WHERE key IN ({})".format(marks),
+                    batch,
+                ).fetchall()
+                conn.execute(
+                    "UPDATE results SET used = ? WHERE key IN ({})".format(marks),
+                    [now] + batch,
+                )
+                for key, value in rows:
+                    found[key] = pickle.loads(value)
+        return found
+
+    def set_many(self, keys, values):
+        """Stores `values`, evicting the least recently used results if
+        needed"""
+        now = time.time()
+        rows = []
+        for key, value in zip(keys, values):
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, value, len(value), now))
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", rows
+            )
+            if self.max_bytes is not None:
+                self._evict(conn)
+
+    def _evict(self, conn):
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY used"):
+            evicted.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        conn.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def clear(self):
+        """Removes all the results"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
+
+
+def _function_fingerprint(function):
+    """What identifies `function` in a Cache key: its qualified name and
+    its source code if available, or its pickle otherwise"""
+    qualname = getattr(function, "__qualname__", None)
+    if qualname is None:  # e.g. functools.partial
+        return pickle.dumps(function, protocol=4)
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        source = None
+    return (getattr(function, "__module__", None), qualname, source)
+
+
+def _call_fingerprint(function, args, kwargs, map_or_starmap):
+    """Hash of everything that defines a call but the items"""
+    return hashlib.sha256(
+        pickle.dumps(
+            (
+                _function_fingerprint(function),
+                map_or_starmap,
+                tuple(args),
+                sorted(kwargs.items()),
+            ),
+            protocol=4,
+        )
+    ).digest()
+
+
+def _get_cache(cache_option):
+    if cache_option is None or isinstance(cache_option, Cache):
+        return cache_option
+    return Cache(cache_option)
+
+
+def _cached_map_or_starmap(cache, function, iterable, args, kwargs, map_or_starmap):
+    """Runs _run_map_or_starmap only on the items whose results are not in
+    `cache`, and merges all the results in order"""
+    items = list(iterable)
+    call_kwargs = {k: v for k, v in kwargs.items() if k not in _RESERVED_KWARGS_MAP}
+    keys = cache.keys(function, items, args, call_kwargs, map_or_starmap)
+    found = cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in found]
+    if missing:
+        results = _run_map_or_starmap(
+            function, [items[i] for i in missing], args, kwargs, map_or_starmap
+        )
+        missing_keys = [keys[i] for i in missing]
+        computed = [
+            (key, result)
+            for key, result in zip(missing_keys, results)
+            if not isinstance(result, Failure)
+        ]
+        cache.set_many([k for k, _ in computed], [result for _, result in computed])
+        output = [found.get(key) for key in keys]
+        for index, result in zip(missing, results):
+            output[index] = result
+        return output
+    return [found[key] for key in keys]
+
+
+def _checkpoint_fingerprint(function, items, args, kwargs, map_or_starmap):
+    """Hash of everything that defines a call, including its items"""
+    digest = hashlib.sha256(
+        _call_fingerprint(function, args, kwargs, map_or_starmap)
+    )
+    for item in items:
+        digest.update(pickle.dumps(item, protocol=4))
+    return digest.digest()
+
+
+class _Checkpoint:
+    """Append-only file with the results of a pm_checkpoint call.
+
+    The file starts with a header identifying the call and its items (see
+    _checkpoint_fingerprint) and their number, followed by one record per
+    chunk of results::
+
+        count, size (uint64) | count item indices (uint64) | pickled results
+
+    A record cut short by a crash is ignored, and overwritten by the next
+    run. The file is memory-mapped to find the completed items, so only
+    the record headers are read until the results are loaded.
+    """
+
+    _MAGIC = b"PARMAPC1"
+    _HEADER = struct.Struct("<8s32sQ")
+    _RECORD = struct.Struct("<QQ")
+
+    def __init__(self, path, fingerprint, num_items):
+        self.path = os.fspath(path)
+        self.num_items = num_items
+        # Offsets of the indices of each record, its count and size
+        self._records: T.List[T.Tuple[int, int, int]] = []
+        self.done = bytearray(num_items)
+        header = self._HEADER.pack(self._MAGIC, fingerprint, num_items)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, "wb") as fh:
+                fh.write(header)
+            return
+        with open(self.path, "r+b") as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[: self._HEADER.size] != header:
+                    raise ValueError(
+                        "pm_checkpoint {!r} was written by a different call "
+                        "(function, arguments or items). Remove it to start "
+                        "over.".format(self.path)
+                    )
+                end = self._scan(mm)
+            fh.truncate(end)
+
+    def _scan(self, mm):
+        """Reads the record headers, returning where the complete records
+        end"""
+        offset = end = self._HEADER.size
+        size = len(mm)
+        while offset + self._RECORD.size <= size:
+            count, nbytes = self._RECORD.unpack_from(mm, offset)
+            indices_at = offset + self._RECORD.size
+            offset = indices_at + 8 * count + nbytes
+            if offset > size:
+                break
+            indices = mm[indices_at : indices_at + 8 * count]
+            for (index,) in struct.iter_unpack("<Q", indices):
+                self.done[index] = 1
+            self._records.append((indices_at, count, nbytes))
+            end = offset
+        return end
+
+    def missing(self):
+        """Indices of the items without results"""
+        return [i for i, done in enumerate(self.done) if not done]
+
+    def load_into(self, output):
+        """Sets the results of the completed items in `output`"""
+        if not self._records:
+            return
+        with open(self.path, "rb") as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for indices_at, count, nbytes in self._records:
+                    results_at = indices_at + 8 * count
+                    indices = struct.unpack_from("<{}Q".format(count), mm, indices_at)
+                    results = pickle.loads(mm[results_at : results_at + nbytes])
+                    for index, result in zip(indices, results):
+                        output[index] = result
+
+    @contextlib.contextmanager
+    def writer(self):
+        """Context manager returning a function to append the results of
+        some items. Records are pickled and written by a background thread,
+        to keep them off the path that dispatches chunks. Records queued
+        while the thread was busy are written together."""
+        records: "queue.SimpleQueue[T.Any]" = queue.SimpleQueue()
+        errors = []
+
+        def write_records():
+            finished = False
+            with open(self.path, "ab") as fh:
+                while not finished:
+                    indices: T.List[int] = []
+                    results: T.List[T.Any] = []
+                    record = records.get()
+                    while record is not None:
+                        indices.extend(record[0])
+                        results.extend(record[1])
+                        try:
+                            record = records.get_nowait()
+                        except queue.Empty:
+                            break
+                    finished = record is None
+                    if errors or not indices:
+                        continue
+                    try:
+                        payload = pickle.dumps(
+                            results, protocol=pickle.HIGHEST_PROTOCOL
+                        )
+                        fh.write(
+                            self._RECORD.pack(len(indices), len(payload))
+                            + struct.pack("<{}Q".format(len(indices)), *indices)
+                            + payload
+                        )
+                        fh.flush()
+                    except BaseException as exc:
+                        errors.append(exc)
+
+        thread = threading.Thread(target=write_records, daemon=True)
+        thread.start()
+        try:
+            yield lambda indices, results: records.put((indices, results))
+        finally:
+            records.put(None)
+            thread.join()
+        if errors:
+            raise errors[0]
+
+
+def _checkpointed_map_or_starmap(
+    path, function, iterable, args, kwargs, map_or_starmap
+):
+    """Runs _run_map_or_starmap only on the items without results in the
+    checkpoint at `path`, appending their results to it as chunks
+    complete"""
+    items = list(iterable)
+    call_kwargs = {k: v for k, v in kwargs.items() if k not in _RESERVED_KWARGS_MAP}
+    checkpoint = _Checkpoint(
+        path,
+        _checkpoint_fingerprint(function, items, args, call_kwargs, map_or_starmap),
+        len(items),
+    )
+    missing = checkpoint.missing()
+    output: T.List[T.Any] = [None] * len(items)
+    if missing:
+        with checkpoint.writer() as write:
+
+            def on_chunk(start, chunk):
+                # Failures (with pm_on_error="collect") are computed again
+                # on the next run
+                done = [
+                    (missing[start + i], result)
+                    for i, result in enumerate(chunk)
+                    if not isinstance(result, Failure)
+                ]
+                if done:
+                    write([i for i, _ in done], [result for _, result in done])
+
+            results = _run_map_or_starmap(
+                function,
+                [items[i] for i in missing],
+                args,
+                kwargs,
+                map_or_starmap,
+                on_chunk=on_chunk,
+            )
+        for index, result in zip(missing, results):
+            output[index] = result
+    checkpoint.load_into(output)
+    return output
+
+
 def _map_or_starmap(function, iterable, args, kwargs, map_or_starmap):
     """
     Shared function between parmap.map and parmap.starmap.
@@ -310,62 +2966,364 @@ def _map_or_starmap(function, iterable, args, kwargs, map_or_starmap):
         ("parmap_progress", "pm_pbar"),
     )
     kwargs = _deprecated_kwargs(kwargs, arg_newarg)
+    ordered = kwargs.pop("pm_ordered", True)
+    cache = _get_cache(kwargs.pop("pm_cache", None))
+    checkpoint = kwargs.pop("pm_checkpoint", None)
+    if cache is not None and checkpoint is not None:
+        raise ValueError("pm_cache and pm_checkpoint can not be used together")
+    if cache is not None or checkpoint is not None:
+        if cache is not None:
+            output = _cached_map_or_starmap(
+                cache, function, iterable, args, kwargs, map_or_starmap
+            )
+        else:
+            output = _checkpointed_map_or_starmap(
+                checkpoint, function, iterable, args, kwargs, map_or_starmap
+            )
+        return output if ordered else list(enumerate(output))
+    return _run_map_or_starmap(
+        function, iterable, args, kwargs, map_or_starmap, ordered=ordered
+    )
+
+
+class Failure:
+    """Result of an item that raised `exception`, with
+    ``pm_on_error="collect"``. `index` is the index of the item."""
+
+    def __init__(self, exception, index=None):
+        self.exception = exception
+        self.index = index
+
+    def __repr__(self):
+        return "Failure(index={!r}, exception={!r})".format(
+            self.index, self.exception
+        )
+
+
+class _CollectErrors:
+    """Wraps the mapped function, returning a Failure instead of raising"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        try:
+            return self.function(*args, **kwargs)
+        except Exception as exc:
+            return Failure(exc)
+
+
+# Result of the items of a chunk whose worker was killed by pm_task_timeout,
+# other than the one that timed out: they are run again
+_LOST = object()
+
+# Delay before the first retry of pm_retries, doubled on each retry
+_RETRY_DELAY = 0.1
+
+
+def _run_map_or_starmap(
+    function, iterable, args, kwargs, map_or_starmap, on_chunk=None, ordered=True
+):
+    """_map_or_starmap, once the cache and the checkpoint have been handled.
+    If given, on_chunk(start, results) is called as chunks complete. If not
+    ordered, (index, result) pairs are returned, possibly in the order they
+    complete."""
+    on_error = kwargs.pop("pm_on_error", "raise")
+    if on_error not in ("raise", "collect"):
+        raise ValueError("Invalid pm_on_error: {!r}".format(on_error))
+    retries = kwargs.pop("pm_retries", 0)
+    retry_delay = kwargs.pop("pm_retry_delay", _RETRY_DELAY)
+    if on_error == "raise" and not retries:
+        return _execute_map_or_starmap(
+            function, iterable, args, kwargs, map_or_starmap, on_chunk, ordered
+        )
+    items = list(iterable)
+    output: T.List[T.Any] = [None] * len(items)
+    pending = list(range(len(items)))
+    failures: T.List[int] = []
+    attempt = 0
+    while pending:
+        pass_on_chunk = None
+        if on_chunk is not None:
+
+            def pass_on_chunk(start, results, pending=pending):
+                if len(pending) == len(items) and not any(
+                    result is _LOST for result in results
+                ):
+                    on_chunk(start, results)
+                    return
+                # Items are not contiguous anymore
+                for i, result in enumerate(results):
+                    if result is not _LOST:
+                        on_chunk(pending[start + i], [result])
+
+        # Each pass creates its pool (if not given), so the items are run
+        # again in other workers. The items lost with a worker killed by
+        # pm_task_timeout are run again without counting as a retry.
+        results = _execute_map_or_starmap(
+            _CollectErrors(function),
+            [items[i] for i in pending],
+            args,
+            dict(kwargs),
+            map_or_starmap,
+            pass_on_chunk,
+            collect_timeouts=True,
+        )
+        failed = []
+        lost = []
+        for index, result in zip(pending, results):
+            if result is _LOST:
+                lost.append(index)
+                continue
+            if isinstance(result, Failure):
+                result.index = index
+                failed.append(index)
+            output[index] = result
+        if failed and attempt < retries:
+            attempt += 1
+            time.sleep(retry_delay * 2 ** (attempt - 1))
+            pending = sorted(failed + lost)
+        else:
+            failures.extend(failed)
+            pending = lost
+            if on_error == "raise" and failures:
+                break
+    if on_error == "raise" and failures:
+        index = min(failures)
+        exception = output[index].exception
+        try:
+            exception.parmap_index = index
+        except AttributeError:  # Exceptions with __slots__
+            pass
+        raise exception
+    return output if ordered else list(enumerate(output))
+
+
+def _execute_map_or_starmap(
+    function,
+    iterable,
+    args,
+    kwargs,
+    map_or_starmap,
+    on_chunk=None,
+    ordered=True,
+    collect_timeouts=False,
+):
+    """_run_map_or_starmap, once errors and retries have been handled. If
+    `collect_timeouts`, the items of a chunk whose worker was killed by
+    pm_task_timeout get a Failure (the item that timed out) or _LOST as
+    their result."""
     chunksize = kwargs.pop("pm_chunksize", None)
     progress = kwargs.pop("pm_pbar", False)
-    (has_pbar, pbar_wrapper) = _prepare_pbar_wrapper(progress)
-    parallel, pool, close_pool = _create_pool(kwargs)
+    pbar_refresh = kwargs.pop("pm_pbar_refresh", None)
+    share_args = kwargs.pop("pm_share_args", False)
+    shm_min_bytes = _get_shm_min_bytes(kwargs.pop("pm_shared_memory", False))
+    max_worker_memory = kwargs.pop("pm_max_worker_memory", None)
+    task_timeout = kwargs.pop("pm_task_timeout", None)
+    serializer = _get_serializer(kwargs.pop("pm_serializer", None))
+    compression = _get_compression(kwargs.pop("pm_compress", None))
+    stats = _pop_stats(kwargs)
+    fail_fast = kwargs.pop("pm_fail_fast", False)
+    (has_pbar, pbar_wrapper) = _prepare_pbar_wrapper(progress, pbar_refresh)
+    shared, initializer, initargs = _prepare_shared_call(
+        share_args, function, args, kwargs, serializer
+    )
+    parallel, pool, close_pool = _create_pool(kwargs, initializer, initargs)
     # Handle case: Execute sequentially:
     if not parallel:
-        return _serial_map_or_starmap(
-            function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+        if on_chunk is not None:
+            output = []
+            for result in _serial_imap_or_istarmap(
+                function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+            ):
+                on_chunk(len(output), [result])
+                output.append(result)
+        else:
+            output = _serial_map_or_starmap(
+                function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+            )
+        return output if ordered else list(enumerate(output))
+    try:
+        function, iterable, args, kwargs, _, cleanup = _prepare_parallel_call(
+            function,
+            iterable,
+            args,
+            kwargs,
+            map_or_starmap,
+            pool,
+            close_pool,
+            shared,
+            shm_min_bytes,
+            task_timeout,
+            serializer,
+        )
+    except:
+        if close_pool:
+            pool.terminate()
+        raise
+    max_worker_memory = _worker_memory_limit(max_worker_memory, pool, close_pool)
+    try:
+        return _parallel_map_or_starmap(
+            function,
+            iterable,
+            args,
+            kwargs,
+            map_or_starmap,
+            pool,
+            close_pool,
+            chunksize,
+            has_pbar,
+            pbar_wrapper,
+            stats,
+            on_chunk,
+            fail_fast,
+            task_timeout,
+            ordered,
+            collect_timeouts,
+            max_worker_memory,
+            compression,
+        )
+    finally:
+        cleanup()
+
+
+def _parallel_map_or_starmap(
+    function,
+    iterable,
+    args,
+    kwargs,
+    map_or_starmap,
+    pool,
+    close_pool,
+    chunksize,
+    has_pbar,
+    pbar_wrapper,
+    stats=None,
+    on_chunk=None,
+    fail_fast=False,
+    task_timeout=None,
+    ordered=True,
+    collect_timeouts=False,
+    max_worker_memory=None,
+    compression=None,
+):
+    if (
+        has_pbar
+        or chunksize in ("auto", "guided")
+        or stats is not None
+        or on_chunk is not None
+        or fail_fast
+        or task_timeout is not None
+        or max_worker_memory is not None
+        or compression is not None
+        or not ordered
+    ):
+        # Progress, stats and on_chunk are reported as chunks complete, and
+        # the first error is raised as soon as its chunk completes, with the
+        # index of the item (also for items that timed out)
+        return _chunked_map(
+            _ChunkRunner(function, args, kwargs, map_or_starmap),
+            iterable,
+            pool,
+            close_pool,
+            chunksize,
+            pbar_wrapper if has_pbar else None,
+            stats=stats,
+            on_chunk=on_chunk,
+            ordered=ordered,
+            task_timeout=task_timeout,
+            collect_timeouts=collect_timeouts,
+            max_worker_memory=max_worker_memory,
+            compression=compression,
         )
     func_star = _get_helper_func(map_or_starmap)
-    # Handle case: Without showing progress bar
-    if not has_pbar:
-        try:
-            result = pool.map_async(
-                func_star,
-                zip(repeat(function), iterable, repeat(list(args)), repeat(kwargs)),
-                chunksize,
-            )
-            output = result.get()
-        except:
-            if close_pool:
-                pool.terminate()
-            raise
-        else:
-            if close_pool:
-                pool.close()
-                pool.join()
-        return output
-    # Handle case: Show progress bar:
+    if chunksize is None:
+        # Same default as the pool, but the pool divides by its number of
+        # workers, which is zero while it replaces a worker that was killed
+        # (pm_task_timeout)
+        if _get_num_tasks(iterable) is None:
+            iterable = list(iterable)
+        chunksize = _get_default_chunksize(None, pool, len(iterable))
+    try:
+        result = pool.map_async(
+            func_star,
+            zip(repeat(function), iterable, repeat(list(args)), repeat(kwargs)),
+            chunksize,
+        )
+        output = result.get()
+    except:
+        if close_pool:
+            pool.terminate()
+        raise
+    else:
+        if close_pool:
+            pool.close()
+            pool.join()
+    return output
+
+
+def _chunked_map(
+    runner,
+    iterable,
+    pool,
+    close_pool,
+    chunksize,
+    pbar_wrapper,
+    export_chunk=None,
+    stats=None,
+    on_chunk=None,
+    ordered=True,
+    task_timeout=None,
+    collect_timeouts=False,
+    max_worker_memory=None,
+    compression=None,
+):
+    """map, starmap and map_batched on top of _ChunkDispatcher. If given,
+    on_chunk(start, results) is called as chunks complete. If not ordered,
+    (index, result) pairs are returned in the order their chunks complete."""
+    num_tasks = _get_num_tasks(iterable)
+    if chunksize is None and num_tasks is None:
+        chunksize = "auto"
     try:
-        num_tasks = len(iterable)
-        # get a chunksize (as multiprocessing does):
-        chunksize = _get_default_chunksize(chunksize, pool, num_tasks)
-        # use map_async to get progress information
-        result = pool.map_async(
-            func_star,
-            zip(repeat(function), iterable, repeat(list(args)), repeat(kwargs)),
-            chunksize,
+        dispatcher = _ChunkDispatcher(
+            pool,
+            runner,
+            iterable,
+            _make_chunk_policy(chunksize, pool, num_tasks),
+            _default_max_inflight(pool),
+            ordered=False,
+            export_chunk=export_chunk,
+            stats=stats,
+            task_timeout=task_timeout,
+            collect_timeouts=collect_timeouts,
+            max_worker_memory=max_worker_memory,
+            compression=compression,
         )
+        chunks = []
+        for start, results in _iter_chunks(dispatcher, pbar_wrapper, num_tasks):
+            if on_chunk is not None:
+                on_chunk(start, results)
+            chunks.append((start, results))
     except:
         if close_pool:
             pool.terminate()
         raise
     else:
-        if close_pool:
+        if close_pool and dispatcher.workers_killed:
+            # The task of a killed worker never completes: the pool could
+            # not be joined
+            pool.terminate()
+        elif close_pool:
             pool.close()
-    # Progress bar:
-    try:
-        _do_pbar(
-            result, num_tasks, chunksize, refresh_time=2, pbar_wrapper=pbar_wrapper
-        )
-    finally:
-        output = result.get()
-        if close_pool:
             pool.join()
-    return output
+    if not ordered:
+        return [
+            (start + i, result)
+            for start, results in chunks
+            for i, result in enumerate(results)
+        ]
+    chunks.sort(key=itemgetter(0))
+    return [result for _, results in chunks for result in results]
 
 
 def map(function, iterable, *args, **kwargs):
@@ -374,13 +3332,45 @@ def map(function, iterable, *args, **kwargs):
 
     :param pm_parallel: Force parallelization on/off
     :type pm_parallel: bool
-    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`
-    :type pm_chunksize: int
-    :param pm_pool: Pass an existing pool
-    :type pm_pool: multiprocessing.pool.Pool
+    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`. If
+      ``"auto"``, chunk sizes are adapted to the measured time per item, so
+      each chunk takes about 0.1 seconds, and they shrink near the end of
+      the input so all workers finish together. If ``"guided"``, each chunk
+      takes a fraction of the remaining items (guided self-scheduling), so
+      workers stay busy until the end when item costs are skewed.
+    :type pm_chunksize: int or str
+    :param pm_pool: Pass an existing pool, or ``"shared"`` to reuse a pool
+      managed by parmap across calls. See :py:func:`set_default_pool`.
+    :type pm_pool: multiprocessing.pool.Pool or str
     :param pm_processes: Number of processes to use in the pool. See
       :py:class:`multiprocessing.pool.Pool`
     :type pm_processes: int
+    :param pm_backend: What runs the tasks in parallel, if `pm_pool` is not
+      given: ``"process"`` (the default, a :py:class:`multiprocessing.pool.Pool`),
+      ``"thread"`` (a :py:class:`multiprocessing.pool.ThreadPool`, with no
+      pickling nor process startup costs, for I/O bound functions, functions
+      that release the GIL, and free-threaded Python builds),
+      ``"interpreter"`` (a
+      :py:class:`concurrent.futures.InterpreterPoolExecutor`, Python 3.14+)
+      or ``"serial"`` (same as ``pm_parallel=False``).
+    :type pm_backend: str
+    :param pm_start_method: How the pools created by parmap start their
+      processes: ``"fork"``, ``"forkserver"`` or ``"spawn"``. Defaults to the
+      platform default. See :py:func:`multiprocessing.get_context`.
+    :type pm_start_method: str
+    :param pm_initializer: Function that each worker of the pools created
+      by parmap calls once, when it starts. Use it to import heavy modules
+      or load models once per worker instead of once per item. With
+      ``pm_pool="shared"`` the workers keep that state across calls.
+    :type pm_initializer: callable
+    :param pm_initargs: Arguments to call `pm_initializer` with.
+    :type pm_initargs: tuple
+    :param pm_preload: Names of modules that the forkserver imports before
+      it forks the workers, with ``pm_start_method="forkserver"``, so that
+      new workers start with them already imported. It has no effect once
+      the forkserver runs. See
+      :py:meth:`multiprocessing.set_forkserver_preload`.
+    :type pm_preload: list of str
     :param pm_pbar: Show progress bar with optional information.
 
          * If it is a `boolean`, whether to show or not the progress bar.
@@ -393,6 +3383,102 @@ def map(function, iterable, *args, **kwargs):
              parmap.map(print, range(10), pm_pbar = partial(tqdm, desc = "example"))
 
     :type pm_pbar: bool, dict or callable
+    :param pm_pbar_refresh: Minimum number of seconds between progress bar
+      updates. By default, the progress bar is updated every time a chunk
+      of items completes. `iterable` does not need a length: without it,
+      the progress bar shows no total.
+    :type pm_pbar_refresh: float
+    :param pm_share_args: Send `function`, `args` and `kwargs` to each worker
+      only once, instead of with every chunk of items. Useful when the
+      additional arguments are large. Pools created by parmap receive them
+      through their initializer; existing pools passed with `pm_pool` load
+      them once per worker from a temporary file.
+    :type pm_share_args: bool
+    :param pm_shared_memory: Send NumPy arrays and buffers (bytes,
+      bytearray...) found in the items, the additional arguments or the
+      results through shared memory segments, instead of pickling them
+      through the workers pipes. Only objects of at least 64 KiB (or the
+      given number of bytes) are sent this way. Workers receive read-only
+      arrays, or ``bytes`` and read-only ``memoryview`` objects.
+    :type pm_shared_memory: bool or int
+    :param pm_maxtasksperchild: Number of tasks (chunks) a worker of a pool
+      created by parmap completes before it is replaced by a new one, e.g.
+      to release the memory leaked by the function. No work is lost: the
+      worker finishes its current chunk first. The workers of a pool given
+      with `pm_pool` are not recycled. See
+      :py:class:`multiprocessing.pool.Pool`.
+    :type pm_maxtasksperchild: int
+    :param pm_max_worker_memory: Replace a worker of a process pool created
+      by parmap with a new one once its resident memory exceeds this
+      number of bytes after a task (chunk). Useful when the function leaks
+      memory or fragments the heap. No work is lost: the result of the
+      chunk is handed to parmap before the worker exits. It does not apply
+      to pools given with `pm_pool`, nor to the shared pool.
+    :type pm_max_worker_memory: int
+    :param pm_task_timeout: Seconds each item may run in a process pool.
+      Items that take longer are interrupted with :py:class:`TimeoutError`,
+      handled as any other error (see `pm_on_error` and `pm_retries`). If
+      an item is not interrupted within a second (e.g. it is stuck in C
+      code), its worker is killed and replaced, and its whole chunk fails
+      with :py:class:`TimeoutError`, while the other workers keep running.
+      With `pm_on_error` or `pm_retries`, only that item fails and the
+      other items of its chunk are run again. A pool given with `pm_pool`
+      is then left with a task that never completes: terminate it (e.g.
+      with a ``with`` block) rather than closing and joining it.
+    :type pm_task_timeout: float
+    :param pm_serializer: How the function, its arguments, the items and
+      the results are serialized between processes: ``"pickle"`` (the
+      default), ``"cloudpickle"`` to send lambdas and closures (requires
+      cloudpickle), or a ``(dumps, loads)`` pair of functions that the
+      workers can import.
+    :type pm_serializer: str or tuple
+    :param pm_compress: Compress the chunks of items (with the arguments)
+      and of results sent between processes, when they serialize to at
+      least 4 KiB, with ``"zlib"`` (or True), ``"lzma"`` or ``"bz2"``, for
+      payloads larger than the bandwidth between processes can carry
+      quickly. Give ``(compressor, min_bytes)`` to use another threshold.
+      `pm_stats` reports the compression ratio and time.
+    :type pm_compress: bool, str or tuple
+    :param pm_stats: A :py:class:`Stats` to fill with the measurements of
+      each chunk (pickling time and size, dispatch time, compute time,
+      result size, worker...) to tune chunk sizes and worker counts. The
+      chunks and the results are then pickled by parmap, to measure them.
+    :type pm_stats: Stats
+    :param pm_cache: Reuse the results of previous calls stored in a
+      :py:class:`Cache`, or in an SQLite database at the given path. Only
+      the items not found are computed, and their results are stored.
+    :type pm_cache: Cache, str or os.PathLike
+    :param pm_checkpoint: Path of a file where the results are appended as
+      chunks complete. If the call is interrupted, running it again with
+      the same function, arguments and items only computes the items
+      missing in the file. Remove the file to start over.
+    :type pm_checkpoint: str or os.PathLike
+    :param pm_fail_fast: Raise the first exception as soon as its chunk
+      completes, instead of waiting for all the chunks, and terminate the
+      pool if parmap created it. The exception gets the index of the item
+      that raised it as its ``parmap_index`` attribute.
+    :type pm_fail_fast: bool
+    :param pm_on_error: ``"raise"`` (default) to raise the first exception
+      raised by `function`, or ``"collect"`` to return a
+      :py:class:`Failure`, with the exception and the index of the item, as
+      the result of each item that raised an exception. The results of the
+      other items are kept.
+    :type pm_on_error: str
+    :param pm_retries: Number of times the items that raised an exception
+      are run again, in a new pass over the failed items (in a new pool,
+      unless `pm_pool` is given). Exceptions are only raised or collected
+      after the last retry.
+    :type pm_retries: int
+    :param pm_retry_delay: Seconds to wait before the first retry. The wait
+      doubles on each retry. Defaults to 0.1.
+    :type pm_retry_delay: float
+    :param pm_ordered: If False, ``(index, result)`` pairs are returned, in
+      the order their chunks complete instead of in the order of
+      `iterable`, without reordering them. They are still returned at the
+      end of the call: use :py:func:`imap_unordered` to process the results
+      as they complete. Serial calls, `pm_cache`, `pm_checkpoint`,
+      `pm_on_error="collect"` and `pm_retries` return the pairs in order.
+    :type pm_ordered: bool
     """
     return _map_or_starmap(function, iterable, args, kwargs, "map")
 
@@ -404,13 +3490,45 @@ def starmap(function, iterables, *args, **kwargs):
 
     :param pm_parallel: Force parallelization on/off
     :type pm_parallel: bool
-    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`
-    :type pm_chunksize: int
-    :param pm_pool: Pass an existing pool
-    :type pm_pool: multiprocessing.pool.Pool
+    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`. If
+      ``"auto"``, chunk sizes are adapted to the measured time per item, so
+      each chunk takes about 0.1 seconds, and they shrink near the end of
+      the input so all workers finish together. If ``"guided"``, each chunk
+      takes a fraction of the remaining items (guided self-scheduling), so
+      workers stay busy until the end when item costs are skewed.
+    :type pm_chunksize: int or str
+    :param pm_pool: Pass an existing pool, or ``"shared"`` to reuse a pool
+      managed by parmap across calls. See :py:func:`set_default_pool`.
+    :type pm_pool: multiprocessing.pool.Pool or str
     :param pm_processes: Number of processes to use in the pool. See
                       :py:class:`multiprocessing.pool.Pool`
     :type pm_processes: int
+    :param pm_backend: What runs the tasks in parallel, if `pm_pool` is not
+      given: ``"process"`` (the default, a :py:class:`multiprocessing.pool.Pool`),
+      ``"thread"`` (a :py:class:`multiprocessing.pool.ThreadPool`, with no
+      pickling nor process startup costs, for I/O bound functions, functions
+      that release the GIL, and free-threaded Python builds),
+      ``"interpreter"`` (a
+      :py:class:`concurrent.futures.InterpreterPoolExecutor`, Python 3.14+)
+      or ``"serial"`` (same as ``pm_parallel=False``).
+    :type pm_backend: str
+    :param pm_start_method: How the pools created by parmap start their
+      processes: ``"fork"``, ``"forkserver"`` or ``"spawn"``. Defaults to the
+      platform default. See :py:func:`multiprocessing.get_context`.
+    :type pm_start_method: str
+    :param pm_initializer: Function that each worker of the pools created
+      by parmap calls once, when it starts. Use it to import heavy modules
+      or load models once per worker instead of once per item. With
+      ``pm_pool="shared"`` the workers keep that state across calls.
+    :type pm_initializer: callable
+    :param pm_initargs: Arguments to call `pm_initializer` with.
+    :type pm_initargs: tuple
+    :param pm_preload: Names of modules that the forkserver imports before
+      it forks the workers, with ``pm_start_method="forkserver"``, so that
+      new workers start with them already imported. It has no effect once
+      the forkserver runs. See
+      :py:meth:`multiprocessing.set_forkserver_preload`.
+    :type pm_preload: list of str
     :param pm_pbar: Show progress bar with optional information.
 
          * If it is a `boolean`, whether to show or not the progress bar.
@@ -423,6 +3541,102 @@ def starmap(function, iterables, *args, **kwargs):
              parmap.map(print, range(10), pm_pbar = partial(tqdm, desc = "example"))
 
     :type pm_pbar: bool, dict or callable
+    :param pm_pbar_refresh: Minimum number of seconds between progress bar
+      updates. By default, the progress bar is updated every time a chunk
+      of items completes. `iterable` does not need a length: without it,
+      the progress bar shows no total.
+    :type pm_pbar_refresh: float
+    :param pm_share_args: Send `function`, `args` and `kwargs` to each worker
+      only once, instead of with every chunk of items. Useful when the
+      additional arguments are large. Pools created by parmap receive them
+      through their initializer; existing pools passed with `pm_pool` load
+      them once per worker from a temporary file.
+    :type pm_share_args: bool
+    :param pm_shared_memory: Send NumPy arrays and buffers (bytes,
+      bytearray...) found in the items, the additional arguments or the
+      results through shared memory segments, instead of pickling them
+      through the workers pipes. Only objects of at least 64 KiB (or the
+      given number of bytes) are sent this way. Workers receive read-only
+      arrays, or ``bytes`` and read-only ``memoryview`` objects.
+    :type pm_shared_memory: bool or int
+    :param pm_maxtasksperchild: Number of tasks (chunks) a worker of a pool
+      created by parmap completes before it is replaced by a new one, e.g.
+      to release the memory leaked by the function. No work is lost: the
+      worker finishes its current chunk first. The workers of a pool given
+      with `pm_pool` are not recycled. See
+      :py:class:`multiprocessing.pool.Pool`.
+    :type pm_maxtasksperchild: int
+    :param pm_max_worker_memory: Replace a worker of a process pool created
+      by parmap with a new one once its resident memory exceeds this
+      number of bytes after a task (chunk). Useful when the function leaks
+      memory or fragments the heap. No work is lost: the result of the
+      chunk is handed to parmap before the worker exits. It does not apply
+      to pools given with `pm_pool`, nor to the shared pool.
+    :type pm_max_worker_memory: int
+    :param pm_task_timeout: Seconds each item may run in a process pool.
+      Items that take longer are interrupted with :py:class:`TimeoutError`,
+      handled as any other error (see `pm_on_error` and `pm_retries`). If
+      an item is not interrupted within a second (e.g. it is stuck in C
+      code), its worker is killed and replaced, and its whole chunk fails
+      with :py:class:`TimeoutError`, while the other workers keep running.
+      With `pm_on_error` or `pm_retries`, only that item fails and the
+      other items of its chunk are run again. A pool given with `pm_pool`
+      is then left with a task that never completes: terminate it (e.g.
+      with a ``with`` block) rather than closing and joining it.
+    :type pm_task_timeout: float
+    :param pm_serializer: How the function, its arguments, the items and
+      the results are serialized between processes: ``"pickle"`` (the
+      default), ``"cloudpickle"`` to send lambdas and closures (requires
+      cloudpickle), or a ``(dumps, loads)`` pair of functions that the
+      workers can import.
+    :type pm_serializer: str or tuple
+    :param pm_compress: Compress the chunks of items (with the arguments)
+      and of results sent between processes, when they serialize to at
+      least 4 KiB, with ``"zlib"`` (or True), ``"lzma"`` or ``"bz2"``, for
+      payloads larger than the bandwidth between processes can carry
+      quickly. Give ``(compressor, min_bytes)`` to use another threshold.
+      `pm_stats` reports the compression ratio and time.
+    :type pm_compress: bool, str or tuple
+    :param pm_stats: A :py:class:`Stats` to fill with the measurements of
+      each chunk (pickling time and size, dispatch time, compute time,
+      result size, worker...) to tune chunk sizes and worker counts. The
+      chunks and the results are then pickled by parmap, to measure them.
+    :type pm_stats: Stats
+    :param pm_cache: Reuse the results of previous calls stored in a
+      :py:class:`Cache`, or in an SQLite database at the given path. Only
+      the items not found are computed, and their results are stored.
+    :type pm_cache: Cache, str or os.PathLike
+    :param pm_checkpoint: Path of a file where the results are appended as
+      chunks complete. If the call is interrupted, running it again with
+      the same function, arguments and items only computes the items
+      missing in the file. Remove the file to start over.
+    :type pm_checkpoint: str or os.PathLike
+    :param pm_fail_fast: Raise the first exception as soon as its chunk
+      completes, instead of waiting for all the chunks, and terminate the
+      pool if parmap created it. The exception gets the index of the item
+      that raised it as its ``parmap_index`` attribute.
+    :type pm_fail_fast: bool
+    :param pm_on_error: ``"raise"`` (default) to raise the first exception
+      raised by `function`, or ``"collect"`` to return a
+      :py:class:`Failure`, with the exception and the index of the item, as
+      the result of each item that raised an exception. The results of the
+      other items are kept.
+    :type pm_on_error: str
+    :param pm_retries: Number of times the items that raised an exception
+      are run again, in a new pass over the failed items (in a new pool,
+      unless `pm_pool` is given). Exceptions are only raised or collected
+      after the last retry.
+    :type pm_retries: int
+    :param pm_retry_delay: Seconds to wait before the first retry. The wait
+      doubles on each retry. Defaults to 0.1.
+    :type pm_retry_delay: float
+    :param pm_ordered: If False, ``(index, result)`` pairs are returned, in
+      the order their chunks complete instead of in the order of
+      `iterable`, without reordering them. They are still returned at the
+      end of the call: use :py:func:`imap_unordered` to process the results
+      as they complete. Serial calls, `pm_cache`, `pm_checkpoint`,
+      `pm_on_error="collect"` and `pm_retries` return the pairs in order.
+    :type pm_ordered: bool
     """
     return _map_or_starmap(function, iterables, args, kwargs, "starmap")
 
@@ -462,11 +3676,17 @@ class _DummyAsyncResult(AsyncResult):
 class _ParallelAsyncResult(AsyncResult):
     """Like the AsyncResult, but it will close the pool when we leave the
     ``with`` block or when we check if it is ready.
+
+    `result` is a _BackgroundChunkDispatcher. If given, `pool` is joined
+    once it is done, or terminated if chunks were still running (after
+    :py:meth:`cancel`, or an error with ``pm_fail_fast``).
     """
 
-    def __init__(self, result, pool=None):
+    def __init__(self, result, pool=None, cleanup=_no_cleanup):
         self._result = result
         self._pool = pool
+        # Also run the cleanup if the result is garbage collected unfinished
+        self._cleanup = weakref.finalize(self, cleanup)
 
     @property
     def _number_left(self):
@@ -498,15 +3718,37 @@ class _ParallelAsyncResult(AsyncResult):
     def __enter__(self):
         return self
 
+    def cancel(self):
+        """Stops dispatching the pending chunks. If parmap created the pool,
+        it is terminated; a pool given with ``pm_pool`` is left running: it
+        finishes the chunks already started and skips the others. Then
+        :py:meth:`get` raises :py:class:`concurrent.futures.CancelledError`.
+        Returns False if the result was already available.
+        """
+        cancelled = self._result.cancel()
+        if cancelled:
+            self.terminate()
+        return cancelled
+
     def join(self):
         if self._pool is not None:
-            self._pool.join()
+            self._result.wait()
+            if self._result.pool_closed:
+                self._pool.join()
+            else:
+                self._pool.terminate()
             self._pool = None
+        self._run_cleanup()
 
     def terminate(self):
+        self._result.cancel()
         if self._pool is not None:
             self._pool.terminate()
             self._pool = None
+        self._run_cleanup()
+
+    def _run_cleanup(self):
+        self._cleanup()
 
     def __exit__(self, type, value, traceback):
         self.terminate()
@@ -528,30 +3770,77 @@ def _map_or_starmap_async(function, iterable, args, kwargs, map_or_starmap):
     )
     kwargs = _deprecated_kwargs(kwargs, arg_newarg)
     chunksize = kwargs.pop("pm_chunksize", None)
+    fail_fast = kwargs.pop("pm_fail_fast", False)
     callback = kwargs.pop("pm_callback", None)
     error_callback = kwargs.pop("pm_error_callback", None)
-    parallel, pool, close_pool = _create_pool(kwargs)
+    share_args = kwargs.pop("pm_share_args", False)
+    shm_min_bytes = _get_shm_min_bytes(kwargs.pop("pm_shared_memory", False))
+    max_worker_memory = kwargs.pop("pm_max_worker_memory", None)
+    task_timeout = kwargs.pop("pm_task_timeout", None)
+    serializer = _get_serializer(kwargs.pop("pm_serializer", None))
+    compression = _get_compression(kwargs.pop("pm_compress", None))
+    shared, initializer, initargs = _prepare_shared_call(
+        share_args, function, args, kwargs, serializer
+    )
+    parallel, pool, close_pool = _create_pool(kwargs, initializer, initargs)
     # Map:
     if parallel:
-        func_star = _get_helper_func(map_or_starmap)
+        cleanup = _no_cleanup
         try:
-            result = pool.map_async(
-                func_star,
-                zip(repeat(function), iterable, repeat(list(args)), repeat(kwargs)),
-                chunksize=chunksize,
+            function, iterable, args, kwargs, _, cleanup = _prepare_parallel_call(
+                function,
+                iterable,
+                args,
+                kwargs,
+                map_or_starmap,
+                pool,
+                close_pool,
+                shared,
+                shm_min_bytes,
+                task_timeout,
+                serializer,
+            )
+            num_tasks = _get_num_tasks(iterable)
+            max_worker_memory = _worker_memory_limit(
+                max_worker_memory, pool, close_pool
+            )
+            if close_pool:
+                max_inflight = _default_max_inflight(pool)
+            else:
+                # As with Pool.map_async, the caller may close and join its
+                # pool before get(): dispatch all the chunks now. There are
+                # no measurements to size them yet, so "auto" falls back to
+                # the default chunksize.
+                max_inflight = float("inf")
+                if chunksize == "auto":
+                    chunksize = None
+            dispatcher = _BackgroundChunkDispatcher(
+                pool,
+                _ChunkRunner(function, args, kwargs, map_or_starmap),
+                iterable,
+                _make_chunk_policy(chunksize, pool, num_tasks),
+                max_inflight,
+                ordered=False,
+                task_timeout=task_timeout,
+                max_worker_memory=max_worker_memory,
+                compression=compression,
+                fail_fast=fail_fast,
+                close_pool=close_pool,
                 callback=callback,
                 error_callback=error_callback,
+                skip_cancelled=not close_pool,
             )
+            dispatcher.start()
         except:
             if close_pool:
                 pool.terminate()
+            cleanup()
             raise
         else:
             if close_pool:
-                pool.close()
-                result = _ParallelAsyncResult(result, pool)
+                result = _ParallelAsyncResult(dispatcher, pool, cleanup)
             else:
-                result = _ParallelAsyncResult(result)
+                result = _ParallelAsyncResult(dispatcher, cleanup=cleanup)
     else:
         values = _serial_map_or_starmap(
             function, iterable, args, kwargs, None, map_or_starmap
@@ -566,21 +3855,61 @@ def map_async(function, iterable, *args, **kwargs):
 
      >>> [function(x, args[0], args[1],...) for x in iterable]
 
+    If parmap creates the pool, chunks are dispatched as earlier ones
+    complete, and the ``cancel()`` method of the returned result stops
+    dispatching them. With a pool given in ``pm_pool`` (or the shared pool)
+    all the chunks are dispatched at once, as in
+    :py:meth:`multiprocessing.pool.Pool.map_async`, so the pool can be
+    closed and joined before calling ``get()``. After ``cancel()`` (or an
+    error) the workers skip the chunks they have not started yet.
+
     :param pm_parallel: Force parallelization on/off. If False, the
                         function won't be asynchronous.
     :type pm_parallel: bool
-    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`
-    :type pm_chunksize: int
+    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`, and
+      ``"auto"`` and ``"guided"`` in :py:func:`map`.
+    :type pm_chunksize: int or str
     :param pm_callback: see  :py:class:`multiprocessing.pool.Pool`
     :type pm_callback: function
     :param pm_error_callback: (not on python 2) see
         :py:class:`multiprocessing.pool.Pool`
     :type pm_error_callback: function
-    :param pm_pool: Pass an existing pool.
-    :type pm_pool: multiprocessing.pool.Pool
+    :param pm_pool: Pass an existing pool, or ``"shared"`` to reuse a pool
+      managed by parmap across calls. See :py:func:`set_default_pool`.
+    :type pm_pool: multiprocessing.pool.Pool or str
     :param pm_processes: Number of processes to use in the pool. See
       :py:class:`multiprocessing.pool.Pool`
     :type pm_processes: int
+    :param pm_backend: See :py:func:`map`.
+    :type pm_backend: str
+    :param pm_start_method: See :py:func:`map`.
+    :type pm_start_method: str
+    :param pm_initializer: See :py:func:`map`.
+    :type pm_initializer: callable
+    :param pm_initargs: See :py:func:`map`.
+    :type pm_initargs: tuple
+    :param pm_preload: See :py:func:`map`.
+    :type pm_preload: list of str
+    :param pm_share_args: Send `function`, `args` and `kwargs` to each worker
+      only once, instead of with every chunk of items. See :py:func:`map`.
+    :type pm_share_args: bool
+    :param pm_shared_memory: See :py:func:`map`.
+    :type pm_shared_memory: bool or int
+    :param pm_maxtasksperchild: See :py:func:`map`.
+    :type pm_maxtasksperchild: int
+    :param pm_max_worker_memory: See :py:func:`map`.
+    :type pm_max_worker_memory: int
+    :param pm_task_timeout: See :py:func:`map`.
+    :type pm_task_timeout: float
+    :param pm_serializer: See :py:func:`map`.
+    :type pm_serializer: str or tuple
+    :param pm_compress: See :py:func:`map`.
+    :type pm_compress: bool, str or tuple
+    :param pm_fail_fast: Report the first exception as soon as its chunk
+      completes, instead of once the chunks in flight complete. See
+      :py:func:`map`. No more chunks are dispatched after an exception in
+      any case.
+    :type pm_fail_fast: bool
     """
     return _map_or_starmap_async(function, iterable, args, kwargs, "map")
 
@@ -592,19 +3921,989 @@ def starmap_async(function, iterables, *args, **kwargs):
          >>> return ([function(x1,x2,x3,..., args[0], args[1],...) for
          >>>         (x1,x2,x3...) in iterable])
 
+    See :py:func:`map_async` for ``cancel()``.
+
     :param pm_parallel: Force parallelization on/off. If False, the
                         function won't be asynchronous.
     :type pm_parallel: bool
-    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`
-    :type pm_chunksize: int
+    :param pm_chunksize: see  :py:class:`multiprocessing.pool.Pool`, and
+      ``"auto"`` and ``"guided"`` in :py:func:`map`.
+    :type pm_chunksize: int or str
     :param pm_callback: see  :py:class:`multiprocessing.pool.Pool`
     :type pm_callback: function
     :param pm_error_callback: see  :py:class:`multiprocessing.pool.Pool`
     :type pm_error_callback: function
-    :param pm_pool: Pass an existing pool.
-    :type pm_pool: multiprocessing.pool.Pool
+    :param pm_pool: Pass an existing pool, or ``"shared"`` to reuse a pool
+      managed by parmap across calls. See :py:func:`set_default_pool`.
+    :type pm_pool: multiprocessing.pool.Pool or str
     :param pm_processes: Number of processes to use in the pool. See
       :py:class:`multiprocessing.pool.Pool`
     :type pm_processes: int
+    :param pm_backend: See :py:func:`map`.
+    :type pm_backend: str
+    :param pm_start_method: See :py:func:`map`.
+    :type pm_start_method: str
+    :param pm_initializer: See :py:func:`map`.
+    :type pm_initializer: callable
+    :param pm_initargs: See :py:func:`map`.
+    :type pm_initargs: tuple
+    :param pm_preload: See :py:func:`map`.
+    :type pm_preload: list of str
+    :param pm_share_args: Send `function`, `args` and `kwargs` to each worker
+      only once, instead of with every chunk of items. See :py:func:`map`.
+    :type pm_share_args: bool
+    :param pm_shared_memory: See :py:func:`map`.
+    :type pm_shared_memory: bool or int
+    :param pm_maxtasksperchild: See :py:func:`map`.
+    :type pm_maxtasksperchild: int
+    :param pm_max_worker_memory: See :py:func:`map`.
+    :type pm_max_worker_memory: int
+    :param pm_task_timeout: See :py:func:`map`.
+    :type pm_task_timeout: float
+    :param pm_serializer: See :py:func:`map`.
+    :type pm_serializer: str or tuple
+    :param pm_compress: See :py:func:`map`.
+    :type pm_compress: bool, str or tuple
+    :param pm_fail_fast: Report the first exception as soon as its chunk
+      completes, instead of once the chunks in flight complete. See
+      :py:func:`map`. No more chunks are dispatched after an exception in
+      any case.
+    :type pm_fail_fast: bool
     """
     return _map_or_starmap_async(function, iterables, args, kwargs, "starmap")
+
+
+def _imap_or_istarmap(
+    function, iterable, args, kwargs, map_or_starmap, ordered, generator=None
+):
+    """
+    Shared function between parmap.imap, parmap.imap_unordered,
+    parmap.istarmap and parmap.istarmap_unordered (and the asyncio
+    variants, with generator=_aio_chunks).
+    Refer to those functions for details.
+    """
+    _warn_reserved_kwarg_collisions(function, kwargs, _RESERVED_KWARGS_IMAP)
+    chunksize = kwargs.pop("pm_chunksize", None)
+    progress = kwargs.pop("pm_pbar", False)
+    pbar_refresh = kwargs.pop("pm_pbar_refresh", None)
+    share_args = kwargs.pop("pm_share_args", False)
+    shm_min_bytes = _get_shm_min_bytes(kwargs.pop("pm_shared_memory", False))
+    max_worker_memory = kwargs.pop("pm_max_worker_memory", None)
+    task_timeout = kwargs.pop("pm_task_timeout", None)
+    serializer = _get_serializer(kwargs.pop("pm_serializer", None))
+    compression = _get_compression(kwargs.pop("pm_compress", None))
+    max_inflight = kwargs.pop("pm_max_inflight", None)
+    stats = _pop_stats(kwargs)
+    (has_pbar, pbar_wrapper) = _prepare_pbar_wrapper(progress, pbar_refresh)
+    # The pool is created on the first next() call, so an iterator that is
+    # never consumed does not leave a pool behind.
+    if generator is None:
+        generator = _imap_generator
+    return generator(
+        function,
+        iterable,
+        args,
+        kwargs,
+        map_or_starmap,
+        ordered,
+        chunksize,
+        max_inflight,
+        share_args,
+        shm_min_bytes,
+        task_timeout,
+        max_worker_memory,
+        serializer,
+        compression,
+        pbar_wrapper,
+        stats,
+    )
+
+
+def _imap_generator(
+    function,
+    iterable,
+    args,
+    kwargs,
+    map_or_starmap,
+    ordered,
+    chunksize,
+    max_inflight,
+    share_args,
+    shm_min_bytes,
+    task_timeout,
+    max_worker_memory,
+    serializer,
+    compression,
+    pbar_wrapper,
+    stats,
+):
+    shared, initializer, initargs = _prepare_shared_call(
+        share_args, function, args, kwargs, serializer
+    )
+    parallel, pool, close_pool = _create_pool(kwargs, initializer, initargs)
+    if not parallel:
+        yield from _serial_imap_or_istarmap(
+            function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+        )
+        return
+    cleanup = _no_cleanup
+    try:
+        function, iterable, args, kwargs, _, cleanup = _prepare_parallel_call(
+            function,
+            iterable,
+            args,
+            kwargs,
+            map_or_starmap,
+            pool,
+            close_pool,
+            shared,
+            shm_min_bytes,
+            task_timeout,
+            serializer,
+        )
+        num_tasks = _get_num_tasks(iterable)
+        if max_inflight is None:
+            max_inflight = _default_max_inflight(pool)
+        dispatcher = _ChunkDispatcher(
+            pool,
+            _ChunkRunner(function, args, kwargs, map_or_starmap),
+            iterable,
+            _make_chunk_policy(chunksize, pool, num_tasks),
+            max_inflight,
+            ordered,
+            stats=stats,
+            task_timeout=task_timeout,
+            max_worker_memory=_worker_memory_limit(
+                max_worker_memory, pool, close_pool
+            ),
+            compression=compression,
+        )
+        for _, results in _iter_chunks(dispatcher, pbar_wrapper, num_tasks):
+            yield from results
+    except BaseException:
+        # Also when the consumer stops early (GeneratorExit)
+        if close_pool:
+            pool.terminate()
+        raise
+    else:
+        if close_pool and dispatcher.workers_killed:
+            pool.terminate()
+        elif close_pool:
+            pool.close()
+            pool.join()
+    finally:
+        cleanup()
+
+
+def imap(function, iterable, *args, **kwargs):
+    """Lazy version of :py:func:`map`. Returns an iterator equivalent to:
+     >>> (function(x, args[0], args[1],...) for x in iterable)
+
+    Items are consumed from `iterable` and dispatched to the workers only
+    as results are consumed, so neither the input nor the output needs to
+    fit in memory.
+
+    :param pm_parallel: Force parallelization on/off
+    :type pm_parallel: bool
+    :param pm_chunksize: Number of items sent to a worker at once. Defaults
+      to the :py:class:`multiprocessing.pool.Pool` heuristic if `iterable`
+      has a length, and to 1 otherwise. ``"auto"`` adapts the chunk sizes
+      to the measured time per item, and ``"guided"`` shrinks them as items
+      are dispatched, see :py:func:`map`.
+    :type pm_chunksize: int or str
+    :param pm_max_inflight: Maximum number of chunks dispatched to the
+      workers and not yet consumed. Defaults to twice the number of workers.
+    :type pm_max_inflight: int
+    :param pm_pool: Pass an existing pool, or ``"shared"`` to reuse a pool
+      managed by parmap across calls. See :py:func:`set_default_pool`.
+    :type pm_pool: multiprocessing.pool.Pool or str
+    :param pm_processes: Number of processes to use in the pool. See
+      :py:class:`multiprocessing.pool.Pool`
+    :type pm_processes: int
+    :param pm_backend: See :py:func:`map`.
+    :type pm_backend: str
+    :param pm_start_method: See :py:func:`map`.
+    :type pm_start_method: str
+    :param pm_initializer: See :py:func:`map`.
+    :type pm_initializer: callable
+    :param pm_initargs: See :py:func:`map`.
+    :type pm_initargs: tuple
+    :param pm_preload: See :py:func:`map`.
+    :type pm_preload: list of str
+    :param pm_pbar: Show progress bar. See :py:func:`map`.
+    :type pm_pbar: bool, dict or callable
+    :param pm_pbar_refresh: See :py:func:`map`.
+    :type pm_pbar_refresh: float
+    :param pm_share_args: See :py:func:`map`.
+    :type pm_share_args: bool
+    :param pm_shared_memory: See :py:func:`map`.
+    :type pm_shared_memory: bool or int
+    :param pm_maxtasksperchild: See :py:func:`map`.
+    :type pm_maxtasksperchild: int
+    :param pm_max_worker_memory: See :py:func:`map`.
+    :type pm_max_worker_memory: int
+    :param pm_task_timeout: See :py:func:`map`.
+    :type pm_task_timeout: float
+    :param pm_serializer: See :py:func:`map`.
+    :type pm_serializer: str or tuple
+    :param pm_compress: See :py:func:`map`.
+    :type pm_compress: bool, str or tuple
+    :param pm_stats: See :py:func:`map`.
+    :type pm_stats: Stats
+    """
+    return _imap_or_istarmap(function, iterable, args, kwargs, "map", True)
+
+
+def imap_unordered(function, iterable, *args, **kwargs):
+    """Like :py:func:`imap`, but results are yielded as soon as they are
+    computed, instead of in the order of `iterable`.
+    """
+    return _imap_or_istarmap(function, iterable, args, kwargs, "map", False)
+
+
+def istarmap(function, iterables, *args, **kwargs):
+    """Lazy version of :py:func:`starmap`. Returns an iterator equivalent to:
+         >>> ((function(x1,x2,x3,..., args[0], args[1],...) for
+         >>>  (x1,x2,x3...) in iterable)
+
+    Accepts the same parameters as :py:func:`imap`.
+    """
+    return _imap_or_istarmap(function, iterables, args, kwargs, "starmap", True)
+
+
+def istarmap_unordered(function, iterables, *args, **kwargs):
+    """Like :py:func:`istarmap`, but results are yielded as soon as they are
+    computed, instead of in the order of `iterables`.
+    """
+    return _imap_or_istarmap(function, iterables, args, kwargs, "starmap", False)
+
+
+class SinkSummary(T.NamedTuple):
+    """What :py:func:`map_to` wrote to its sink"""
+
+    #: Number of results written
+    num_results: int
+    #: Bytes written to a file sink (None for other sinks)
+    nbytes: T.Optional[int]
+    #: Seconds the call took
+    elapsed: float
+
+
+# Length prefix of each pickled result in the files written by map_to
+_RESULT_HEADER = struct.Struct("<Q")
+
+
+def _write_results_to_file(results, fh):
+    count = nbytes = 0
+    for result in results:
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        fh.write(_RESULT_HEADER.pack(len(data)))
+        fh.write(data)
+        count += 1
+        nbytes += _RESULT_HEADER.size + len(data)
+    return count, nbytes
+
+
+def _write_results(results, sink):
+    """Writes `results` to `sink` (see :py:func:`map_to`), returning the
+    number of results and the number of bytes written to a file"""
+    if _is_array(sink):
+        count = 0
+        for count, result in enumerate(results, 1):
+            sink[count - 1] = result
+        if hasattr(sink, "flush"):  # numpy.memmap
+            sink.flush()
+        return count, None
+    if callable(sink):
+        count = 0
+        for count, result in enumerate(results, 1):
+            sink(result)
+        return count, None
+    if hasattr(sink, "write"):
+        return _write_results_to_file(results, sink)
+    if isinstance(sink, (str, os.PathLike)):
+        with open(sink, "wb") as fh:
+            return _write_results_to_file(results, fh)
+    raise TypeError("Invalid sink: {!r}".format(sink))
+
+
+def _map_or_starmap_to(sink, function, iterable, args, kwargs, map_or_starmap):
+    """Shared function between parmap.map_to and parmap.starmap_to"""
+    tic = time.perf_counter()
+    num_tasks = _get_num_tasks(iterable)
+    if _is_array(sink) and num_tasks is not None and num_tasks > len(sink):
+        raise ValueError(
+            "The sink has room for {} results, not {}".format(len(sink), num_tasks)
+        )
+    results = _imap_or_istarmap(function, iterable, args, kwargs, map_or_starmap, True)
+    # Closing the iterator releases the pool if the sink raises
+    with contextlib.closing(results):
+        count, nbytes = _write_results(results, sink)
+    return SinkSummary(count, nbytes, time.perf_counter() - tic)
+
+
+def map_to(sink, function, iterable, *args, **kwargs):
+    """Like :py:func:`map`, but the results are written to `sink` in the
+    order of `iterable` as they are computed, instead of returned in a
+    list. Completed results wait for the earlier ones in a reorder buffer
+    of at most `pm_max_inflight` chunks, so memory usage depends neither on
+    the input nor on the output length.
+
+    `sink` can be:
+
+    - a callable, called with each result.
+    - a path, or a file opened in binary mode, to write each result as a
+      length-prefixed pickle. Read them back with :py:func:`read_results`.
+    - a NumPy array (e.g. a :py:class:`numpy.memmap`), for results of a
+      fixed shape: the i-th result is written to ``sink[i]``.
+
+    Returns a :py:class:`SinkSummary`.
+
+    Accepts the same parameters as :py:func:`imap`.
+    """
+    return _map_or_starmap_to(sink, function, iterable, args, kwargs, "map")
+
+
+def starmap_to(sink, function, iterables, *args, **kwargs):
+    """Like :py:func:`starmap`, writing the results to `sink`. See
+    :py:func:`map_to`.
+    """
+    return _map_or_starmap_to(sink, function, iterables, args, kwargs, "starmap")
+
+
+def read_results(file):
+    """Iterates over the results written by :py:func:`map_to` to `file` (a
+    path, or a file opened in binary mode)"""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as fh:
+            yield from read_results(fh)
+        return
+    while True:
+        header = file.read(_RESULT_HEADER.size)
+        if not header:
+            return
+        if len(header) < _RESULT_HEADER.size:
+            raise EOFError("Truncated map_to file")
+        (size,) = _RESULT_HEADER.unpack(header)
+        data = file.read(size)
+        if len(data) < size:
+            raise EOFError("Truncated map_to file")
+        yield pickle.loads(data)
+
+
+async def _aio_chunks(
+    function,
+    iterable,
+    args,
+    kwargs,
+    map_or_starmap,
+    ordered,
+    chunksize,
+    max_inflight,
+    share_args,
+    shm_min_bytes,
+    task_timeout,
+    max_worker_memory,
+    serializer,
+    compression,
+    pbar_wrapper,
+    stats,
+):
+    """Like _imap_generator, for asyncio, yielding ``(start, results)`` for
+    each chunk"""
+    shared, initializer, initargs = _prepare_shared_call(
+        share_args, function, args, kwargs, serializer
+    )
+    parallel, pool, close_pool = _create_pool(kwargs, initializer, initargs)
+    if not parallel:
+        results = _serial_imap_or_istarmap(
+            function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+        )
+        for start, result in enumerate(results):
+            yield start, [result]
+        return
+    loop = asyncio.get_running_loop()
+    cleanup = _no_cleanup
+    try:
+        function, iterable, args, kwargs, _, cleanup = _prepare_parallel_call(
+            function,
+            iterable,
+            args,
+            kwargs,
+            map_or_starmap,
+            pool,
+            close_pool,
+            shared,
+            shm_min_bytes,
+            task_timeout,
+            serializer,
+        )
+        num_tasks = _get_num_tasks(iterable)
+        if max_inflight is None:
+            max_inflight = _default_max_inflight(pool)
+        dispatcher = _AsyncChunkDispatcher(
+            loop,
+            pool,
+            _ChunkRunner(function, args, kwargs, map_or_starmap),
+            iterable,
+            _make_chunk_policy(chunksize, pool, num_tasks),
+            max_inflight,
+            ordered,
+            stats=stats,
+            task_timeout=task_timeout,
+            max_worker_memory=_worker_memory_limit(
+                max_worker_memory, pool, close_pool
+            ),
+            compression=compression,
+        )
+        if pbar_wrapper is None:
+            async for chunk in dispatcher:
+                yield chunk
+        else:
+            with pbar_wrapper(total=num_tasks) as pbar:
+                async for chunk in dispatcher:
+                    pbar.update(len(chunk[1]))
+                    yield chunk
+    except BaseException:
+        # Also when cancelled, or when the consumer stops early
+        if close_pool:
+            pool.terminate()
+        raise
+    else:
+        if close_pool and dispatcher.workers_killed:
+            pool.terminate()
+        elif close_pool:
+            pool.close()
+            # Joining waits for the workers to exit, out of the loop:
+            await loop.run_in_executor(None, pool.join)
+    finally:
+        cleanup()
+
+
+async def _flatten_aio(chunks):
+    """Yields the results of the chunks of _aio_chunks"""
+    try:
+        async for _, results in chunks:
+            for result in results:
+                yield result
+    finally:
+        await chunks.aclose()
+
+
+async def _map_or_starmap_aio(function, iterable, args, kwargs, map_or_starmap):
+    chunks = []
+    async for chunk in _imap_or_istarmap(
+        function, iterable, args, kwargs, map_or_starmap, False, _aio_chunks
+    ):
+        chunks.append(chunk)
+    chunks.sort(key=itemgetter(0))
+    return [result for _, results in chunks for result in results]
+
+
+async def map_aio(function, iterable, *args, **kwargs):
+    """asyncio version of :py:func:`map`::
+
+        results = await parmap.map_aio(function, iterable, args[0], ...)
+
+    Waiting for the results does not block the event loop: chunks are
+    dispatched as previous ones complete, and their completion is notified
+    to the loop by the pool. With ``pm_parallel=False`` the function runs
+    in the event loop.
+
+    Creating and closing a pool takes some time: consider using
+    ``pm_pool="shared"`` in services that call it often.
+
+    Takes the same ``pm_`` arguments as :py:func:`imap`.
+    """
+    return await _map_or_starmap_aio(function, iterable, args, kwargs, "map")
+
+
+async def starmap_aio(function, iterables, *args, **kwargs):
+    """asyncio version of :py:func:`starmap`. See :py:func:`map_aio`."""
+    return await _map_or_starmap_aio(function, iterables, args, kwargs, "starmap")
+
+
+def imap_aio(function, iterable, *args, **kwargs):
+    """asyncio version of :py:func:`imap`, to use with ``async for``::
+
+        async for result in parmap.imap_aio(function, iterable, args[0], ...):
+            ...
+
+    The results of each chunk are yielded as soon as it completes (and all
+    the previous chunks, to keep the order of `iterable`). See
+    :py:func:`map_aio`.
+    """
+    return _flatten_aio(
+        _imap_or_istarmap(function, iterable, args, kwargs, "map", True, _aio_chunks)
+    )
+
+
+def imap_unordered_aio(function, iterable, *args, **kwargs):
+    """Like :py:func:`imap_aio`, but the results of each chunk are yielded
+    as soon as it completes, instead of in the order of `iterable`.
+    """
+    return _flatten_aio(
+        _imap_or_istarmap(function, iterable, args, kwargs, "map", False, _aio_chunks)
+    )
+
+
+def istarmap_aio(function, iterables, *args, **kwargs):
+    """asyncio version of :py:func:`istarmap`. See :py:func:`imap_aio`."""
+    return _flatten_aio(
+        _imap_or_istarmap(
+            function, iterables, args, kwargs, "starmap", True, _aio_chunks
+        )
+    )
+
+
+def istarmap_unordered_aio(function, iterables, *args, **kwargs):
+    """Like :py:func:`istarmap_aio`, but the results of each chunk are
+    yielded as soon as it completes, instead of in the order of `iterables`.
+    """
+    return _flatten_aio(
+        _imap_or_istarmap(
+            function, iterables, args, kwargs, "starmap", False, _aio_chunks
+        )
+    )
+
+
+def _serial_batches(iterable, chunksize):
+    """Splits `iterable` in batches of `chunksize` items, or in a single
+    batch if chunksize is not an int"""
+    if not isinstance(chunksize, int):
+        chunksize = None
+    if _is_sliceable(iterable):
+        step = chunksize or max(len(iterable), 1)
+        for start in range(0, len(iterable), step):
+            yield iterable[start : start + step]
+        return
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, chunksize))
+        if not batch:
+            return
+        yield batch
+
+
+def _serial_map_batched(function, iterable, args, kwargs, chunksize, pbar_wrapper):
+    output = []
+    if pbar_wrapper is None:
+        for batch in _serial_batches(iterable, chunksize):
+            output.extend(function(batch, *args, **kwargs))
+        return output
+    with pbar_wrapper(total=_get_num_tasks(iterable)) as pbar:
+        for batch in _serial_batches(iterable, chunksize):
+            output.extend(function(batch, *args, **kwargs))
+            pbar.update(len(batch))
+    return output
+
+
+# Sources opened by map_indexed in this process, by _MappedSource key. The
+# least recently used ones are closed when there are too many.
+_MAPPED_SOURCES: "OrderedDict[tuple, T.Any]" = OrderedDict()
+_MAX_MAPPED_SOURCES = 8
+
+
+class _MappedSource:
+    """A map_indexed source backed by a file: the path of a .npy file, or a
+    numpy.memmap. It is pickled as the arguments to map the file, and each
+    process maps it once."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def open(self):
+        try:
+            array = _MAPPED_SOURCES[self.key]
+        except KeyError:
+            import numpy as np
+
+            if self.key[0] == "npy":
+                array = np.load(self.key[1], mmap_mode="r")
+            else:
+                _, filename, dtype, offset, shape, order = self.key
+                array = np.memmap(
+                    filename,
+                    dtype=dtype,
+                    mode="r",
+                    offset=offset,
+                    shape=shape,
+                    order=order,
+                )
+            _MAPPED_SOURCES[self.key] = array
+            while len(_MAPPED_SOURCES) > _MAX_MAPPED_SOURCES:
+                _MAPPED_SOURCES.popitem(last=False)
+        else:
+            _MAPPED_SOURCES.move_to_end(self.key)
+        return array
+
+
+def _as_indexed_source(source):
+    """Returns a _MappedSource for the sources of map_indexed that are
+    files, or `source` itself"""
+    if isinstance(source, (str, os.PathLike)):
+        return _MappedSource(("npy", os.fspath(source)))
+    np = sys.modules.get("numpy")
+    # Views of a memmap (whose base is not the mmap) are pickled instead
+    if (
+        np is not None
+        and isinstance(source, np.memmap)
+        and isinstance(source.base, mmap.mmap)
+        and source.filename is not None
+    ):
+        flags = source.flags
+        order = "F" if flags.f_contiguous and not flags.c_contiguous else "C"
+        return _MappedSource(
+            (
+                "memmap",
+                os.fspath(source.filename),
+                source.dtype,
+                source.offset,
+                source.shape,
+                order,
+            )
+        )
+    return source
+
+
+class _IndexedBatch:
+    """The function map_indexed passes to map_batched: reads the items of a
+    chunk of _Indices from the source and calls `function` on each one"""
+
+    def __init__(self, function, source):
+        self.function = function
+        self.source = source
+
+    def __call__(self, indices, *args, **kwargs):
+        source = self.source
+        if isinstance(source, _MappedSource):
+            source = source.open()
+        function = self.function
+        return [
+            function(item, *args, **kwargs)
+            for item in source[indices.start : indices.stop]
+        ]
+
+
+def map_indexed(function, source, *args, **kwargs):
+    """Like :py:func:`map` on the items of `source`, but the items are not
+    sent to the workers: only ranges of indices are, and each worker reads
+    its chunks of items from `source` with a slice. Equivalent to:
+     >>> [function(x, args[0], args[1],...) for x in source]
+
+    `source` can be:
+
+    - the path of a ``.npy`` file, or a :py:class:`numpy.memmap`, which
+      each worker maps in memory once.
+    - any object with a length that supports slicing (e.g. an HDF5
+      dataset, or a reader of a record file). It is sent to each worker
+      once, with ``pm_share_args=True``: make it pickle as whatever it
+      needs to open the data, not as the data itself.
+
+    Accepts the same parameters as :py:func:`map_batched`.
+    """
+    _warn_reserved_kwarg_collisions(function, kwargs, _RESERVED_KWARGS_BATCHED)
+    source = _as_indexed_source(source)
+    num_items = len(source.open() if isinstance(source, _MappedSource) else source)
+    kwargs.setdefault("pm_share_args", True)
+    return map_batched(
+        _IndexedBatch(function, source), _Indices(0, num_items), *args, **kwargs
+    )
+
+
+def map_batched(function, iterable, *args, **kwargs):
+    """Vectorized version of :py:func:`map`. Equivalent to:
+     >>> [function(x, args[0], args[1],...) for x in iterable]
+
+    but `function` is called once per chunk of items (a list, or a slice if
+    `iterable` is a NumPy array), instead of once per item::
+
+        results_chunk = function(chunk, args[0], args[1],...)
+
+    and must return a sequence with one result per item of the chunk.
+    Results are concatenated back in the order of `iterable`. This saves the
+    overhead of calling `function` and sending each result separately.
+
+    :param pm_parallel: Force parallelization on/off. If False, `function`
+      is called on chunks of `pm_chunksize` items (if given), or once on all
+      the items.
+    :type pm_parallel: bool
+    :param pm_chunksize: Number of items of each chunk. Defaults to the
+      :py:class:`multiprocessing.pool.Pool` heuristic if `iterable` has a
+      length, and to ``"auto"`` otherwise (see :py:func:`map`).
+    :type pm_chunksize: int or str
+    :param pm_pool: See :py:func:`map`.
+    :type pm_pool: multiprocessing.pool.Pool or str
+    :param pm_processes: See :py:func:`map`.
+    :type pm_processes: int
+    :param pm_backend: See :py:func:`map`.
+    :type pm_backend: str
+    :param pm_start_method: See :py:func:`map`.
+    :type pm_start_method: str
+    :param pm_initializer: See :py:func:`map`.
+    :type pm_initializer: callable
+    :param pm_initargs: See :py:func:`map`.
+    :type pm_initargs: tuple
+    :param pm_preload: See :py:func:`map`.
+    :type pm_preload: list of str
+    :param pm_pbar: See :py:func:`map`.
+    :type pm_pbar: bool, dict or callable
+    :param pm_pbar_refresh: See :py:func:`map`.
+    :type pm_pbar_refresh: float
+    :param pm_share_args: See :py:func:`map`.
+    :type pm_share_args: bool
+    :param pm_shared_memory: See :py:func:`map`. Chunks that are slices of
+      an array go through shared memory as a whole.
+    :type pm_shared_memory: bool or int
+    :param pm_maxtasksperchild: See :py:func:`map`.
+    :type pm_maxtasksperchild: int
+    :param pm_max_worker_memory: See :py:func:`map`.
+    :type pm_max_worker_memory: int
+    :param pm_task_timeout: See :py:func:`map`. It applies to each call of
+      `function`, with a whole chunk.
+    :type pm_task_timeout: float
+    :param pm_serializer: See :py:func:`map`.
+    :type pm_serializer: str or tuple
+    :param pm_compress: See :py:func:`map`.
+    :type pm_compress: bool, str or tuple
+    :param pm_stats: See :py:func:`map`.
+    :type pm_stats: Stats
+    """
+    _warn_reserved_kwarg_collisions(function, kwargs, _RESERVED_KWARGS_BATCHED)
+    chunksize = kwargs.pop("pm_chunksize", None)
+    progress = kwargs.pop("pm_pbar", False)
+    pbar_refresh = kwargs.pop("pm_pbar_refresh", None)
+    share_args = kwargs.pop("pm_share_args", False)
+    shm_min_bytes = _get_shm_min_bytes(kwargs.pop("pm_shared_memory", False))
+    max_worker_memory = kwargs.pop("pm_max_worker_memory", None)
+    task_timeout = kwargs.pop("pm_task_timeout", None)
+    serializer = _get_serializer(kwargs.pop("pm_serializer", None))
+    compression = _get_compression(kwargs.pop("pm_compress", None))
+    stats = _pop_stats(kwargs)
+    (has_pbar, pbar_wrapper) = _prepare_pbar_wrapper(progress, pbar_refresh)
+    function = _BatchFunction(function)
+    shared, initializer, initargs = _prepare_shared_call(
+        share_args, function, args, kwargs, serializer
+    )
+    parallel, pool, close_pool = _create_pool(kwargs, initializer, initargs)
+    if not parallel:
+        return _serial_map_batched(
+            function, iterable, args, kwargs, chunksize, pbar_wrapper
+        )
+    try:
+        function, iterable, args, kwargs, export_chunk, cleanup = (
+            _prepare_parallel_call(
+                function,
+                iterable,
+                args,
+                kwargs,
+                "batch",
+                pool,
+                close_pool,
+                shared,
+                shm_min_bytes,
+                task_timeout,
+                serializer,
+            )
+        )
+    except:
+        if close_pool:
+            pool.terminate()
+        raise
+    try:
+        return _chunked_map(
+            _BatchRunner(function, args, kwargs),
+            iterable,
+            pool,
+            close_pool,
+            chunksize,
+            pbar_wrapper,
+            export_chunk,
+            stats,
+            task_timeout=task_timeout,
+            max_worker_memory=_worker_memory_limit(
+                max_worker_memory, pool, close_pool
+            ),
+            compression=compression,
+        )
+    finally:
+        cleanup()
+
+
+# pm_initial of map_reduce when it is not given
+_NO_INITIAL = object()
+
+
+class _ReduceBatch:
+    """The batch function of map_reduce: maps the function on a chunk of
+    items and reduces their results in the worker. Returns
+    ``[(num_items, partial_result)]``.
+
+    The exception raised by an item gets its index in the chunk as its
+    ``parmap_index`` attribute (the dispatcher adds the chunk start).
+    """
+
+    def __init__(self, function, reducer, map_or_starmap):
+        self.func_star = _get_helper_func(map_or_starmap)
+        self.function = function
+        self.reducer = reducer
+
+    def __call__(self, items, *args, **kwargs):
+        func_star, function, reducer = self.func_star, self.function, self.reducer
+        args = list(args)
+        partial_result = _NO_INITIAL
+        num_items = 0
+        try:
+            for item in items:
+                result = func_star((function, item, args, kwargs))
+                if partial_result is _NO_INITIAL:
+                    partial_result = result
+                else:
+                    partial_result = reducer(partial_result, result)
+                num_items += 1
+        except Exception as exc:
+            _set_parmap_index(exc, num_items)
+            raise
+        return [(num_items, partial_result)]
+
+
+def _combine_partials(chunks, reducer, initial, pbar):
+    """Reduces the ``(start, [(num_items, partial_result)])`` chunks of
+    map_reduce, that complete in any order. Each partial result is combined
+    once all the ones before it are, so the reducer needs to be associative
+    but not commutative."""
+    output = initial
+    pending = {}
+    next_start = 0
+    for start, ((num_items, partial_result),) in chunks:
+        if pbar is not None:
+            pbar.update(num_items)
+        pending[start] = (num_items, partial_result)
+        while next_start in pending:
+            num_items, partial_result = pending.pop(next_start)
+            if output is _NO_INITIAL:
+                output = partial_result
+            else:
+                output = reducer(output, partial_result)
+            next_start += num_items
+    if output is _NO_INITIAL:
+        raise TypeError("map_reduce() of empty iterable with no initial value")
+    return output
+
+
+def _map_or_starmap_reduce(function, iterable, reducer, args, kwargs, map_or_starmap):
+    """Shared function between parmap.map_reduce and parmap.starmap_reduce"""
+    _warn_reserved_kwarg_collisions(function, kwargs, _RESERVED_KWARGS_REDUCE)
+    initial = kwargs.pop("pm_initial", _NO_INITIAL)
+    chunksize = kwargs.pop("pm_chunksize", None)
+    progress = kwargs.pop("pm_pbar", False)
+    pbar_refresh = kwargs.pop("pm_pbar_refresh", None)
+    share_args = kwargs.pop("pm_share_args", False)
+    shm_min_bytes = _get_shm_min_bytes(kwargs.pop("pm_shared_memory", False))
+    max_worker_memory = kwargs.pop("pm_max_worker_memory", None)
+    task_timeout = kwargs.pop("pm_task_timeout", None)
+    serializer = _get_serializer(kwargs.pop("pm_serializer", None))
+    compression = _get_compression(kwargs.pop("pm_compress", None))
+    max_inflight = kwargs.pop("pm_max_inflight", None)
+    stats = _pop_stats(kwargs)
+    has_pbar, pbar_wrapper = _prepare_pbar_wrapper(progress, pbar_refresh)
+    reduce_batch = _ReduceBatch(function, reducer, map_or_starmap)
+    shared, initializer, initargs = _prepare_shared_call(
+        share_args, reduce_batch, args, kwargs, serializer
+    )
+    parallel, pool, close_pool = _create_pool(kwargs, initializer, initargs)
+    if not parallel:
+        results = _serial_imap_or_istarmap(
+            function, iterable, args, kwargs, pbar_wrapper, map_or_starmap
+        )
+        if initial is _NO_INITIAL:
+            results = iter(results)
+            initial = next(results, _NO_INITIAL)
+            if initial is _NO_INITIAL:
+                raise TypeError("map_reduce() of empty iterable with no initial value")
+        return reduce(reducer, results, initial)
+    cleanup = _no_cleanup
+    try:
+        # Each chunk is reduced inside the function sent to the workers, so
+        # shared memory and serializers wrap the partial results, not the
+        # results of each item
+        reduce_batch, iterable, args, kwargs, export_chunk, cleanup = (
+            _prepare_parallel_call(
+                reduce_batch,
+                iterable,
+                args,
+                kwargs,
+                "batch",
+                pool,
+                close_pool,
+                shared,
+                shm_min_bytes,
+                task_timeout,
+                serializer,
+            )
+        )
+        num_tasks = _get_num_tasks(iterable)
+        if chunksize is None and num_tasks is None:
+            chunksize = "auto"
+        if max_inflight is None:
+            max_inflight = _default_max_inflight(pool)
+        dispatcher = _ChunkDispatcher(
+            pool,
+            _BatchRunner(reduce_batch, args, kwargs),
+            iterable,
+            _make_chunk_policy(chunksize, pool, num_tasks),
+            max_inflight,
+            ordered=False,
+            export_chunk=export_chunk,
+            stats=stats,
+            task_timeout=task_timeout,
+            max_worker_memory=_worker_memory_limit(
+                max_worker_memory, pool, close_pool
+            ),
+            compression=compression,
+        )
+        if pbar_wrapper is None:
+            output = _combine_partials(dispatcher, reducer, initial, None)
+        else:
+            with pbar_wrapper(total=num_tasks) as pbar:
+                output = _combine_partials(dispatcher, reducer, initial, pbar)
+    except:
+        if close_pool:
+            pool.terminate()
+        raise
+    else:
+        if close_pool and dispatcher.workers_killed:
+            pool.terminate()
+        elif close_pool:
+            pool.close()
+            pool.join()
+    finally:
+        cleanup()
+    return output
+
+
+def map_reduce(function, iterable, reducer, *args, **kwargs):
+    """This function is equivalent to:
+     >>> functools.reduce(reducer, map(function, iterable, ...), pm_initial)
+
+    Each worker reduces the results of a chunk of items, so one partial
+    result per chunk is sent back instead of one result per item. The
+    parent combines the partial results in the order of `iterable` as they
+    arrive, so `reducer` must be associative (e.g. ``operator.add``) but
+    does not need to be commutative.
+
+    :param pm_initial: Initial value of the reduction, returned if
+      `iterable` is empty.
+    :type pm_initial: object
+
+    Accepts the same parameters as :py:func:`imap`. `pm_task_timeout`
+    applies to each chunk.
+    """
+    return _map_or_starmap_reduce(function, iterable, reducer, args, kwargs, "map")
+
+
+def starmap_reduce(function, iterables, reducer, *args, **kwargs):
+    """Like :py:func:`map_reduce`, for :py:func:`starmap`:
+    >>> functools.reduce(reducer, starmap(function, iterables, ...), pm_initial)
+    """
+    return _map_or_starmap_reduce(function, iterables, reducer, args, kwargs, "starmap")
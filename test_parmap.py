@@ -1,7 +1,15 @@
+import glob
 import multiprocessing
+import operator
+import os
+import pickle
+import struct
+import tempfile
+import threading
 import time
 import unittest
 import warnings
+import zlib
 
 import parmap
 
@@ -39,6 +47,21 @@ def _boom(x):
     return x
 
 
+def _boom_or_wait(x):
+    """Raises for one specific input, waits for the others"""
+    if x == 2:
+        raise ValueError("boom")
+    return _wait(x)
+
+
+def _fail_once(x, path):
+    """Raises the first time it is called with x == 2 (tracked in `path`)"""
+    if x == 2 and not os.path.exists(path):
+        open(path, "w").close()
+        raise ValueError("transient")
+    return x
+
+
 _DEFAULT_B = 1
 
 
@@ -57,6 +80,64 @@ def _fun_needing_pm_pbar(x, pm_pbar="default"):
     return (x, pm_pbar)
 
 
+def _describe(x, *args):
+    """Type names and lengths of the arguments, and a large result"""
+    values = (x,) + args
+    described = [(type(v).__name__, len(v)) for v in values]
+    return described, bytes(100000)
+
+
+def _array_sum(x, y=None, scale=1):
+    """Sums two arrays, checking the input arrays are read-only"""
+    assert not x.flags.writeable
+    return (x + (0 if y is None else y)) * scale
+
+
+def _first_half(x):
+    """Returns a view of its input"""
+    return x[: len(x) // 2]
+
+
+def _batch_add(batch, a, b=0):
+    """Vectorized function for map_batched"""
+    return [x + a + b for x in batch]
+
+
+def _batch_first(batch):
+    """Wrong vectorized function: returns a single result per batch"""
+    return batch[:1]
+
+
+def _batch_array_sum(batch, y, scale=1):
+    return (batch + y) * scale
+
+
+def _pid_and_table_id(x, table, offset=0):
+    """Reports which copy of `table` the worker used"""
+    return (os.getpid(), id(table), table[x] + offset)
+
+
+# Number of _CountedTable unpickled by this process
+_NUM_TABLE_LOADS = [0]
+
+
+def _load_counted_table(values):
+    _NUM_TABLE_LOADS[0] += 1
+    return _CountedTable(values)
+
+
+class _CountedTable(list):
+    """A list that counts how many times each process unpickles it"""
+
+    def __reduce__(self):
+        return (_load_counted_table, (list(self),))
+
+
+def _pid_and_table_loads(x, table, offset=0):
+    """Reports how many tables the worker unpickled so far"""
+    return (os.getpid(), _NUM_TABLE_LOADS[0], table[x] + offset)
+
+
 class ProgrBar:
     def __init__(self, **kwargs):
         self.expected = "S" + "T" * kwargs["total"] + "E"
@@ -75,6 +156,105 @@ class ProgrBar:
         self.content += "T" * n
 
 
+_CACHED_CALLS = []
+
+
+def _counted_add(x, a=0):
+    """Records its calls, to check which items a cache computes"""
+    _CACHED_CALLS.append(x)
+    return x + a
+
+
+_FAIL_ON = set()
+
+
+def _flaky_add(x, a=0):
+    """Like _counted_add, raising for the items in _FAIL_ON"""
+    _CACHED_CALLS.append(x)
+    if x in _FAIL_ON:
+        raise ValueError("flaky")
+    return x + a
+
+
+def _getpid(x):
+    return os.getpid()
+
+
+def _zlib_dumps(obj):
+    return zlib.compress(pickle.dumps(obj))
+
+
+def _zlib_loads(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+_WORKER_VALUE = None
+
+
+def _set_worker_value(value):
+    global _WORKER_VALUE
+    _WORKER_VALUE = value
+
+
+def _add_worker_value(x, a=0):
+    return x + a + _WORKER_VALUE
+
+
+def _sleep_for(x):
+    time.sleep(x)
+    return x
+
+
+def _sleep_or_boom(x):
+    """Sleeps x seconds, or raises if x is negative"""
+    if x < 0:
+        raise ValueError("boom")
+    return _sleep_for(x)
+
+
+def _hang(x):
+    """Sleeps x seconds, ignoring the TimeoutError of pm_task_timeout"""
+    end = time.monotonic() + x
+    while time.monotonic() < end:
+        try:
+            time.sleep(end - time.monotonic())
+        except TimeoutError:
+            pass
+    return x
+
+
+_LEAKED = []
+
+
+def _leak(x):
+    """Leaks 16 MiB, returns x and the pid of the worker"""
+    _LEAKED.append(b"\1" * (16 << 20))
+    return x, os.getpid()
+
+
+class _CountingPbar:
+    """Progress bar that records its updates. The last one created is kept
+    in _CountingPbar.last"""
+
+    last = None
+
+    def __init__(self, total=None):
+        self.total = total
+        self.count = 0
+        self.updates = []
+        _CountingPbar.last = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def update(self, n=1):
+        self.count += n
+        self.updates.append(n)
+
+
 class TestParmap(unittest.TestCase):
     def test_map_without_parallel_timings(self):
         NUM_TASKS = 6
@@ -220,42 +400,6 @@ class TestParmap(unittest.TestCase):
             # The pool must be joined for cleanup even though get() raised.
             self.assertIsNone(result._pool)
 
-    def test_do_pbar_does_not_swallow_unexpected_errors(self):
-        from parmap.parmap import _do_pbar
-
-        class _NullPbar:
-            def __init__(self, total=None):
-                pass
-
-            def __enter__(self):
-                return self
-
-            def __exit__(self, *exc_info):
-                return False
-
-            def update(self, n=1):
-                pass
-
-        class _FakeAsyncResult:
-            def ready(self):
-                return False
-
-            @property
-            def _number_left(self):
-                raise RuntimeError("unexpected failure, not an AttributeError")
-
-            def wait(self, timeout=None):
-                pass
-
-        with self.assertRaises(RuntimeError):
-            _do_pbar(
-                _FakeAsyncResult(),
-                num_tasks=1,
-                chunksize=1,
-                refresh_time=0,
-                pbar_wrapper=_NullPbar,
-            )
-
     def test_get_default_chunksize_zero_workers(self):
         from parmap.parmap import _get_default_chunksize
 
@@ -311,6 +455,1088 @@ class TestParmap(unittest.TestCase):
         ]
         self.assertEqual(collision_warnings, [])
 
+    def test_map_share_args(self):
+        table = _CountedTable(range(100, 110))
+        expected = [x + 100 + 1 for x in range(10)]
+        for map_or_starmap in (parmap.map, parmap.starmap):
+            items = range(10) if map_or_starmap is parmap.map else [(x,) for x in range(10)]
+            for share_args, start_method in (
+                (True, None),
+                (True, "spawn"),
+                (False, None),
+            ):
+                result = map_or_starmap(
+                    _pid_and_table_loads,
+                    items,
+                    table,
+                    offset=1,
+                    pm_processes=2,
+                    pm_chunksize=1,
+                    pm_share_args=share_args,
+                    pm_start_method=start_method,
+                )
+                self.assertEqual([r[2] for r in result], expected)
+                max_loads = max(num_loads for _, num_loads, _ in result)
+                if share_args:
+                    # Each worker unpickled the table at most once (forked
+                    # workers inherit it):
+                    self.assertLessEqual(max_loads, 1)
+                else:
+                    self.assertGreater(max_loads, 1)
+
+    def test_map_share_args_existing_pool(self):
+        table = list(range(100, 110))
+        pattern = os.path.join(tempfile.gettempdir(), "parmap-*.pickle")
+        before = set(glob.glob(pattern))
+        with multiprocessing.Pool(2) as pool:
+            result = parmap.map(
+                _pid_and_table_id, range(10), table, pm_pool=pool, pm_share_args=True
+            )
+            with parmap.map_async(
+                _pid_and_table_id, range(10), table, pm_pool=pool, pm_share_args=True
+            ) as result_async:
+                result_async = result_async.get()
+        self.assertEqual([r[2] for r in result_async], table)
+        self.assertEqual([r[2] for r in result], table)
+        # The temporary files holding the arguments were removed:
+        self.assertEqual(set(glob.glob(pattern)), before)
+        # Also if the arguments can not be pickled
+        with multiprocessing.Pool(1) as pool:
+            with self.assertRaises(Exception):
+                parmap.map(
+                    _identity, range(2), lambda: 0, pm_pool=pool, pm_share_args=True
+                )
+        self.assertEqual(set(glob.glob(pattern)), before)
+
+    def test_shared_call_pickles_small(self):
+        import pickle
+
+        from parmap.parmap import _prepare_shared_call
+
+        shared, _, _ = _prepare_shared_call(True, _identity, [b"x" * 100000], {})
+        self.assertLess(len(pickle.dumps(shared)), 1000)
+
+    def test_imap(self):
+        items = list(range(20))
+        expected = [x + 10 + _DEFAULT_B for x in items]
+        for parallel in (False, True):
+            result = parmap.imap(
+                _fun_with_keywords, iter(items), pm_parallel=parallel, a=10
+            )
+            self.assertFalse(isinstance(result, list))
+            self.assertEqual(list(result), expected)
+            result = parmap.imap_unordered(
+                _fun_with_keywords, items, pm_parallel=parallel, a=10
+            )
+            self.assertEqual(sorted(result), expected)
+
+    def test_istarmap(self):
+        items = [(1, 2), (3, 4), (5, 6)]
+        expected = parmap.starmap(_identity, items, 5, 6, pm_parallel=False)
+        self.assertEqual(list(parmap.istarmap(_identity, items, 5, 6)), expected)
+        self.assertEqual(
+            sorted(parmap.istarmap_unordered(_identity, iter(items), 5, 6)),
+            expected,
+        )
+
+    def test_imap_bounded_inflight(self):
+        consumed = []
+
+        def endless():
+            x = 0
+            while True:
+                consumed.append(x)
+                yield x
+                x += 1
+
+        result = parmap.imap(
+            _identity, endless(), pm_processes=2, pm_chunksize=1, pm_max_inflight=3
+        )
+        self.assertEqual(next(result), (0,))
+        self.assertLessEqual(len(consumed), 4)
+        self.assertEqual(next(result), (1,))
+        result.close()
+
+    def test_imap_worker_exception_propagates(self):
+        results = parmap.imap(_boom, range(4), pm_processes=2, pm_chunksize=1)
+        self.assertEqual(next(results), 0)
+        self.assertEqual(next(results), 1)
+        with self.assertRaises(ValueError):
+            next(results)
+
+    def test_shared_pool(self):
+        from parmap import parmap as parmap_module
+
+        try:
+            result = parmap.map(_fun_with_keywords, range(4), pm_pool="shared", a=1)
+            self.assertEqual(result, [x + 1 + _DEFAULT_B for x in range(4)])
+            pool = parmap_module._shared_pool
+            self.assertIsNotNone(pool)
+            parmap.starmap(_identity, [(1,), (2,)], pm_pool="shared")
+            with parmap.map_async(_identity, range(2), pm_pool="shared") as result:
+                result.get()
+            self.assertIs(parmap_module._shared_pool, pool)
+            # Resized on demand:
+            parmap.map(_identity, range(4), pm_pool="shared", pm_processes=3)
+            self.assertIsNot(parmap_module._shared_pool, pool)
+            self.assertEqual(len(parmap_module._shared_pool._pool), 3)
+            # A pool inherited through fork is not reused:
+            pool = parmap_module._shared_pool
+            parmap_module._shared_pool_pid = -1
+            parmap.map(_identity, range(4), pm_pool="shared")
+            self.assertIsNot(parmap_module._shared_pool, pool)
+            pool.terminate()
+        finally:
+            parmap.close_shared_pool()
+        self.assertIsNone(parmap_module._shared_pool)
+
+    def test_shared_pool_resized_while_in_use(self):
+        from parmap import parmap as parmap_module
+
+        results = []
+        # Chunks are dispatched as earlier ones complete
+        thread = threading.Thread(
+            target=lambda: results.extend(
+                parmap.map(
+                    _sleep_for,
+                    [0.1] * 10,
+                    pm_pool="shared",
+                    pm_processes=2,
+                    pm_chunksize="auto",
+                )
+            )
+        )
+        try:
+            thread.start()
+            time.sleep(0.2)
+            pool = parmap_module._shared_pool
+            # Replaces the shared pool. The old one is closed when the
+            # thread is done with it.
+            self.assertEqual(
+                parmap.map(_identity, range(4), pm_pool="shared", pm_processes=3),
+                [(x,) for x in range(4)],
+            )
+            self.assertIsNot(parmap_module._shared_pool, pool)
+            thread.join()
+            self.assertEqual(results, [0.1] * 10)
+            self.assertNotIn(pool, parmap_module._shared_pool_users)
+            pool.join()
+        finally:
+            thread.join()
+            parmap.close_shared_pool()
+
+    def test_set_default_pool(self):
+        from parmap import parmap as parmap_module
+
+        parmap.set_default_pool("shared")
+        try:
+            self.assertEqual(parmap.map(_identity, range(2)), [(0,), (1,)])
+            self.assertIsNotNone(parmap_module._shared_pool)
+            with self.assertRaises(ValueError):
+                parmap.set_default_pool("invalid")
+        finally:
+            parmap.set_default_pool(None)
+            parmap.close_shared_pool()
+        with self.assertRaises(ValueError):
+            parmap.map(_identity, range(2), pm_pool="invalid")
+
+    def test_map_chunksize_auto(self):
+        items = list(range(50))
+        expected = [x + 10 + _DEFAULT_B for x in items]
+        result = parmap.map(_fun_with_keywords, items, a=10, pm_chunksize="auto")
+        self.assertEqual(result, expected)
+        # Also without len():
+        result = parmap.map(
+            _fun_with_keywords, iter(items), a=10, pm_chunksize="auto", pm_processes=2
+        )
+        self.assertEqual(result, expected)
+        result = parmap.starmap(_identity, [(1, 2), (3, 4)], pm_chunksize="auto")
+        self.assertEqual(result, [(1, 2), (3, 4)])
+        result = parmap.imap_unordered(_identity, items, pm_chunksize="auto")
+        self.assertEqual(sorted(result), [(x,) for x in items])
+
+    def test_adaptive_chunksize(self):
+        from parmap.parmap import _AdaptiveChunksize
+
+        policy = _AdaptiveChunksize(num_workers=2, num_tasks=None, target=0.1)
+        self.assertEqual(policy.next_size(0), 1)
+        policy.record(1, 0.001)
+        sizes = [policy.next_size(0) for _ in range(10)]
+        # Grows gradually up to ~target / time_per_item:
+        self.assertEqual(sizes[:3], [2, 4, 8])
+        self.assertEqual(sizes[-1], 100)
+        # Shrinks if items get slower:
+        policy.record(100, 10.0)
+        self.assertLess(policy.next_size(0), 100)
+        # Smaller chunks near the end of the input:
+        policy = _AdaptiveChunksize(num_workers=2, num_tasks=1000, target=0.1)
+        policy.record(1, 0.0)
+        for _ in range(20):
+            policy.next_size(0)
+        self.assertEqual(policy.next_size(0), 250)
+        self.assertEqual(policy.next_size(990), 3)
+        self.assertEqual(policy.next_size(999), 1)
+
+    def test_backends(self):
+        items = list(range(6))
+        expected = [x + 10 + _DEFAULT_B for x in items]
+        for backend in ("process", "thread", "serial"):
+            with self.subTest(backend=backend):
+                result = parmap.map(
+                    _fun_with_keywords, items, a=10, pm_backend=backend
+                )
+                self.assertEqual(result, expected)
+                result = parmap.map(
+                    _wait, range(4), pm_backend=backend, pm_pbar=ProgrBar
+                )
+                self.assertEqual(result, list(range(4)))
+                result = parmap.starmap_async(
+                    _identity, [(1, 2), (3, 4)], 5, pm_backend=backend
+                ).get()
+                self.assertEqual(result, [(1, 2, 5), (3, 4, 5)])
+                result = parmap.imap(_identity, items, pm_backend=backend)
+                self.assertEqual(list(result), [(x,) for x in items])
+        with self.assertRaises(ValueError):
+            parmap.map(_identity, items, pm_backend="invalid")
+
+    def test_thread_backend_runs_in_parallel(self):
+        NUM_TASKS = 4
+        mytime = time.time()
+        result = parmap.map(
+            _wait, range(NUM_TASKS), pm_backend="thread", pm_processes=NUM_TASKS
+        )
+        elapsed = time.time() - mytime
+        self.assertEqual(result, list(range(NUM_TASKS)))
+        self.assertTrue(elapsed < TIME_PER_TEST * (NUM_TASKS - 1))
+
+    def test_interpreter_backend(self):
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter("always")
+            result = parmap.map(_identity, range(3), pm_backend="interpreter")
+        # Either in subinterpreters, or serially where not supported:
+        self.assertEqual(result, [(0,), (1,), (2,)])
+
+    def test_executor_pool(self):
+        import concurrent.futures
+
+        from parmap.parmap import _ExecutorPool
+
+        pool = _ExecutorPool(concurrent.futures.ThreadPoolExecutor(2), 2)
+        try:
+            result = parmap.map(_identity, range(10), 1, pm_pool=pool)
+            self.assertEqual(result, [(x, 1) for x in range(10)])
+            result = parmap.map(_identity, range(10), pm_pool=pool, pm_pbar=ProgrBar)
+            self.assertEqual(result, [(x,) for x in range(10)])
+            result = parmap.imap_unordered(_identity, range(10), pm_pool=pool)
+            self.assertEqual(sorted(result), [(x,) for x in range(10)])
+            errors = []
+            with self.assertRaises(ValueError):
+                parmap.map_async(
+                    _boom, range(4), pm_pool=pool, pm_error_callback=errors.append
+                ).get()
+            self.assertEqual(len(errors), 1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _shm_segments(self):
+        if not os.path.isdir("/dev/shm"):
+            return set()
+        return set(os.listdir("/dev/shm"))
+
+    def test_shared_memory_buffers(self):
+        before = self._shm_segments()
+        big = b"x" * 200000
+        items = [b"a" * 100000, bytearray(300000), b"small"]
+        result = parmap.map(_describe, items, big, pm_shared_memory=True)
+        for (described, data), item in zip(result, items):
+            self.assertEqual(data, bytes(100000))
+            self.assertEqual(described[0][1], len(item))
+            self.assertEqual(described[1], ("bytes", len(big)))
+        self.assertEqual(result[0][0][0][0], "bytes")
+        self.assertEqual(result[1][0][0][0], "memoryview")
+        result = parmap.starmap_async(
+            _describe, [(big, big)], pm_shared_memory=1000
+        ).get()
+        self.assertEqual(result[0][0], [("bytes", len(big))] * 2)
+        result = list(parmap.imap(_describe, items, pm_shared_memory=True))
+        self.assertEqual(result[2][0], [("bytes", 5)])
+        self.assertEqual(self._shm_segments(), before)
+
+    def test_shared_memory_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest("numpy is not installed")
+        before = self._shm_segments()
+        arrays = [np.arange(100000, dtype=float) + i for i in range(4)]
+        offset = np.ones(100000)
+        result = parmap.map(
+            _array_sum, arrays, offset, scale=2, pm_shared_memory=True
+        )
+        for array, res in zip(arrays, result):
+            np.testing.assert_array_equal(res, (array + 1) * 2)
+            self.assertTrue(res.flags.writeable)
+        # Results that are (views of) the items, in their segments:
+        result = parmap.map(_identity, arrays, pm_shared_memory=True)
+        for array, res in zip(arrays, result):
+            np.testing.assert_array_equal(res[0], array)
+        result = parmap.map(_first_half, arrays, pm_shared_memory=True)
+        for array, res in zip(arrays, result):
+            np.testing.assert_array_equal(res, array[:50000])
+        self.assertEqual(self._shm_segments(), before)
+
+    def test_shared_memory_cleanup(self):
+        if parmap.parmap._posixshmem is None:
+            self.skipTest("segments are not named files on Windows")
+        transport = parmap.parmap._ShmTransport(1000)
+        items = list(transport.export_items([b"a" * 5000, b"b" * 5000], "map"))
+        # A worker returns a large result for the first item and dies:
+        function = parmap.parmap._ShmFunction(bytes, 1000, transport.prefix)
+        result = function(items[0])
+        names = [item.values[0].name for item in items] + [result.name]
+        transport.cleanup()
+        for name in names:
+            with self.assertRaises(FileNotFoundError):
+                parmap.parmap._AttachedShm(name, 1)
+
+    def test_map_batched(self):
+        items = list(range(25))
+        expected = [x + 10 + 1 for x in items]
+        for parallel in (False, True):
+            for chunksize in (None, 4, "auto"):
+                result = parmap.map_batched(
+                    _batch_add,
+                    iter(items),
+                    10,
+                    b=1,
+                    pm_parallel=parallel,
+                    pm_chunksize=chunksize,
+                )
+                self.assertEqual(result, expected)
+        result = parmap.map_batched(_batch_add, items, 10, pm_pbar=ProgrBar)
+        self.assertEqual(result, [x + 10 for x in items])
+        self.assertEqual(parmap.map_batched(_batch_add, [], 10), [])
+        with self.assertRaises(ValueError):
+            parmap.map_batched(_batch_first, items, pm_chunksize=5)
+
+    def test_map_batched_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest("numpy is not installed")
+        items = np.arange(200000, dtype=float)
+        for options in ({}, {"pm_shared_memory": True}, {"pm_parallel": False}):
+            result = parmap.map_batched(
+                _batch_array_sum,
+                items,
+                np.ones(1),
+                scale=2,
+                pm_chunksize=50000,
+                **options
+            )
+            np.testing.assert_array_equal(result, (items + 1) * 2)
+
+    def test_map_pbar_without_len(self):
+        items = (x for x in range(10))
+        result = parmap.map(_identity, items, pm_pbar=_CountingPbar, pm_chunksize=3)
+        self.assertEqual(result, [(x,) for x in range(10)])
+        self.assertEqual(_CountingPbar.last.total, None)
+        self.assertEqual(_CountingPbar.last.count, 10)
+        # One update per chunk:
+        self.assertEqual(sorted(_CountingPbar.last.updates), [1, 3, 3, 3])
+        result = parmap.starmap(_identity, iter([(1, 2)]), pm_pbar=_CountingPbar)
+        self.assertEqual(result, [(1, 2)])
+        self.assertEqual(_CountingPbar.last.count, 1)
+
+    def test_pbar_refresh(self):
+        result = parmap.map(
+            _identity,
+            range(20),
+            pm_pbar=_CountingPbar,
+            pm_chunksize=1,
+            pm_pbar_refresh=60,
+        )
+        self.assertEqual(len(result), 20)
+        self.assertEqual(_CountingPbar.last.total, 20)
+        # Updates were coalesced, and flushed at the end:
+        self.assertEqual(_CountingPbar.last.count, 20)
+        self.assertEqual(len(_CountingPbar.last.updates), 1)
+        list(
+            parmap.imap(
+                _identity, range(5), pm_pbar=_CountingPbar, pm_pbar_refresh=60
+            )
+        )
+        self.assertEqual(_CountingPbar.last.updates, [5])
+
+    def test_bench_quick(self):
+        import json
+
+        import parmap.bench
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "bench.json")
+            self.assertEqual(
+                parmap.bench.main(["--quick", "--processes", "1", "--output", path]),
+                0,
+            )
+            with open(path) as fh:
+                output = json.load(fh)
+        self.assertEqual(output["schema_version"], parmap.bench.SCHEMA_VERSION)
+        names = {entry["name"] for entry in output["results"]}
+        self.assertEqual(
+            names,
+            {
+                "pool_startup",
+                "dispatch_map",
+                "dispatch_starmap",
+                "chunksize",
+                "large_args",
+                "pbar",
+                "sync",
+                "async",
+            },
+        )
+        for entry in output["results"]:
+            self.assertLessEqual(entry["min"], entry["median"])
+
+    def test_stats(self):
+        stats = parmap.Stats()
+        items = list(range(10))
+        result = parmap.map(_identity, items, pm_stats=stats, pm_chunksize=3)
+        self.assertEqual(result, [(x,) for x in items])
+        self.assertEqual(sorted(c.start for c in stats.chunks), [0, 3, 6, 9])
+        self.assertEqual(sum(c.num_items for c in stats.chunks), 10)
+        for chunk in stats.chunks:
+            self.assertNotEqual(chunk.pid, os.getpid())
+            self.assertGreater(chunk.bytes_in, 0)
+            self.assertGreater(chunk.bytes_out, 0)
+            self.assertLessEqual(chunk.dispatched_at, chunk.received_at)
+        summary = stats.summary()
+        self.assertEqual(summary["chunks"], 4)
+        self.assertEqual(summary["items"], 10)
+        self.assertEqual(summary["workers"], len(stats.by_worker()))
+        self.assertGreaterEqual(summary["idle_time"], 0)
+        # Reported as chunks complete, also with map_batched and imap:
+        chunks = []
+
+        class _RecordingStats(parmap.Stats):
+            def record(self, chunk):
+                chunks.append(chunk)
+
+        result = parmap.map_batched(
+            _batch_add, items, 1, pm_stats=_RecordingStats(), pm_chunksize=5
+        )
+        self.assertEqual(result, [x + 1 for x in items])
+        self.assertEqual([c.num_items for c in chunks], [5, 5])
+        stats = parmap.Stats()
+        list(parmap.istarmap(_identity, [(1, 2)], pm_stats=stats))
+        self.assertEqual(len(stats.chunks), 1)
+        # Serial runs record nothing:
+        stats = parmap.Stats()
+        parmap.map(_identity, items, pm_stats=stats, pm_parallel=False)
+        self.assertEqual(stats.summary()["chunks"], 0)
+        with self.assertRaises(TypeError):
+            parmap.map(_identity, items, pm_stats=True)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            del _CACHED_CALLS[:]
+            self.assertEqual(
+                parmap.map(
+                    _counted_add, [1, 2, 3], a=1, pm_cache=path, pm_parallel=False
+                ),
+                [2, 3, 4],
+            )
+            self.assertEqual(_CACHED_CALLS, [1, 2, 3])
+            del _CACHED_CALLS[:]
+            # Only the misses are computed, results are merged in order:
+            self.assertEqual(
+                parmap.map(
+                    _counted_add, [4, 3, 2, 5], a=1, pm_cache=path, pm_parallel=False
+                ),
+                [5, 4, 3, 6],
+            )
+            self.assertEqual(_CACHED_CALLS, [4, 5])
+            del _CACHED_CALLS[:]
+            # Other arguments, or starmap, are other keys:
+            parmap.map(_counted_add, [1], a=2, pm_cache=path, pm_parallel=False)
+            parmap.starmap(_counted_add, [(1,)], pm_cache=path, pm_parallel=False)
+            self.assertEqual(_CACHED_CALLS, [1, 1])
+            # In parallel:
+            cache = parmap.Cache(path)
+            self.assertEqual(
+                parmap.starmap(_counted_add, [(1, 1), (7, 1)], pm_cache=cache),
+                [2, 8],
+            )
+            self.assertEqual(
+                parmap.map(_counted_add, range(6), a=1, pm_cache=cache),
+                [1, 2, 3, 4, 5, 6],
+            )
+
+    def test_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = parmap.Cache(os.path.join(tmpdir, "cache.sqlite"), max_bytes=1)
+            keys = cache.keys(_counted_add, [1, 2], (), {}, "map")
+            cache.set_many(keys[:1], ["a" * 100])
+            self.assertEqual(cache.get_many(keys), {})
+            cache.max_bytes = 1000
+            cache.set_many(keys, ["a", "b"])
+            self.assertEqual(cache.get_many(keys), {keys[0]: "a", keys[1]: "b"})
+            cache.clear()
+            self.assertEqual(cache.get_many(keys), {})
+
+    def test_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint")
+            del _CACHED_CALLS[:]
+            _FAIL_ON.add(3)
+            try:
+                with self.assertRaises(ValueError):
+                    parmap.map(
+                        _flaky_add, range(6), 1, pm_checkpoint=path, pm_parallel=False
+                    )
+            finally:
+                _FAIL_ON.clear()
+            self.assertEqual(_CACHED_CALLS, [0, 1, 2, 3])
+            del _CACHED_CALLS[:]
+            # Resumes where it failed:
+            result = parmap.map(
+                _flaky_add, range(6), 1, pm_checkpoint=path, pm_parallel=False
+            )
+            self.assertEqual(result, [1, 2, 3, 4, 5, 6])
+            self.assertEqual(_CACHED_CALLS, [3, 4, 5])
+            del _CACHED_CALLS[:]
+            result = parmap.map(
+                _flaky_add, range(6), 1, pm_checkpoint=path, pm_parallel=False
+            )
+            self.assertEqual(result, [1, 2, 3, 4, 5, 6])
+            self.assertEqual(_CACHED_CALLS, [])
+            # Another call can not use it:
+            with self.assertRaises(ValueError):
+                parmap.map(_flaky_add, range(6), 2, pm_checkpoint=path)
+            with self.assertRaises(ValueError):
+                parmap.map(_flaky_add, range(7), 1, pm_checkpoint=path)
+            # Nor can other items of the same length:
+            with self.assertRaises(ValueError):
+                parmap.map(_flaky_add, range(1, 7), 1, pm_checkpoint=path)
+
+    def test_checkpoint_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "checkpoint")
+            items = [(x, x) for x in range(10)]
+            result = parmap.starmap(
+                _identity, items, pm_checkpoint=path, pm_chunksize=3
+            )
+            self.assertEqual(result, items)
+            size = os.path.getsize(path)
+            # A record cut short by a crash is ignored, and removed:
+            with open(path, "ab") as fh:
+                fh.write(struct.pack("<QQ", 1, 100) + bytes(10))
+            result = parmap.starmap(_identity, items, pm_checkpoint=path)
+            self.assertEqual(result, items)
+            self.assertEqual(os.path.getsize(path), size)
+
+    def test_aio(self):
+        import asyncio
+
+        async def run():
+            items = list(range(10))
+            self.assertEqual(
+                await parmap.map_aio(_identity, items, 1, pm_chunksize=3),
+                [(x, 1) for x in items],
+            )
+            self.assertEqual(
+                await parmap.starmap_aio(_identity, [(1, 2), (3, 4)], 5),
+                [(1, 2, 5), (3, 4, 5)],
+            )
+            self.assertEqual(
+                [x async for x in parmap.imap_aio(_identity, iter(items))],
+                [(x,) for x in items],
+            )
+            results = parmap.istarmap_unordered_aio(
+                _identity, [(x,) for x in items], pm_pbar=_CountingPbar
+            )
+            self.assertEqual(sorted([x async for x in results]), [(x,) for x in items])
+            self.assertEqual(_CountingPbar.last.count, 10)
+            self.assertEqual(
+                await parmap.map_aio(_identity, items, pm_parallel=False),
+                [(x,) for x in items],
+            )
+            with self.assertRaises(ValueError):
+                await parmap.map_aio(_boom, items)
+            # Stopping early:
+            results = parmap.imap_aio(_identity, items, pm_chunksize=1)
+            async for result in results:
+                break
+            await results.aclose()
+
+        asyncio.run(run())
+
+    def test_fail_fast(self):
+        mytime = time.time()
+        with self.assertRaises(ValueError) as context:
+            parmap.map(
+                _boom_or_wait,
+                range(10),
+                pm_processes=2,
+                pm_chunksize=1,
+                pm_fail_fast=True,
+            )
+        elapsed = time.time() - mytime
+        self.assertEqual(context.exception.parmap_index, 2)
+        # Did not wait for the other 9 items, 4.5 * TIME_PER_TEST:
+        self.assertTrue(elapsed < TIME_PER_TEST + TIME_OVERHEAD)
+        with self.assertRaises(ValueError) as context:
+            parmap.map_async(
+                _boom, range(4), pm_chunksize=2, pm_fail_fast=True
+            ).get()
+        self.assertEqual(context.exception.parmap_index, 2)
+
+    def test_map_async_cancel(self):
+        import concurrent.futures
+
+        result = parmap.map_async(_wait, range(20), pm_processes=2, pm_chunksize=1)
+        self.assertTrue(result.cancel())
+        with self.assertRaises(concurrent.futures.CancelledError):
+            result.get()
+        self.assertIsNone(result._pool)
+        with multiprocessing.Pool(2) as pool:
+            errors = []
+            # All the chunks are given to the pool at once, and discarded
+            result = parmap.map_async(
+                _wait,
+                range(4),
+                pm_pool=pool,
+                pm_chunksize=1,
+                pm_error_callback=errors.append,
+            )
+            self.assertTrue(result.cancel())
+            self.assertFalse(result.cancel())
+            with self.assertRaises(concurrent.futures.CancelledError):
+                result.get(timeout=1)
+            self.assertEqual(len(errors), 1)
+            # The pool is still usable:
+            self.assertEqual(parmap.map(_identity, [1], pm_pool=pool), [(1,)])
+        result = parmap.map_async(_identity, range(3))
+        self.assertEqual(result.get(), [(0,), (1,), (2,)])
+        self.assertFalse(result.cancel())
+
+    def test_map_async_skips_pending_chunks(self):
+        import concurrent.futures
+
+        # The chunks given to a caller's pool are skipped once the call is
+        # cancelled or fails, so the pool is soon idle again
+        for fail_fast in (None, False, True):
+            with self.subTest(fail_fast=fail_fast):
+                with multiprocessing.Pool(2) as pool:
+                    result = parmap.map_async(
+                        _sleep_or_boom,
+                        [0.5] * 20 if fail_fast is None else [-1] + [0.5] * 19,
+                        pm_pool=pool,
+                        pm_chunksize=1,
+                        pm_fail_fast=bool(fail_fast),
+                    )
+                    if fail_fast is None:
+                        time.sleep(0.2)
+                        result.cancel()
+                        expected = concurrent.futures.CancelledError
+                    else:
+                        expected = ValueError
+                    with self.assertRaises(expected):
+                        result.get(timeout=10)
+                    mytime = time.time()
+                    pool.close()
+                    pool.join()
+                    self.assertLess(time.time() - mytime, 2)
+
+    def test_map_async_close_pool_before_get(self):
+        for chunksize in (None, "auto", "guided"):
+            with self.subTest(chunksize=chunksize):
+                pool = multiprocessing.Pool(2)
+                result = parmap.map_async(
+                    _identity, range(100), pm_pool=pool, pm_chunksize=chunksize
+                )
+                pool.close()
+                pool.join()
+                self.assertEqual(result.get(), [(x,) for x in range(100)])
+
+    def test_on_error_collect(self):
+        for parallel in (True, False):
+            with self.subTest(parallel=parallel):
+                result = parmap.map(
+                    _boom, range(4), pm_on_error="collect", pm_parallel=parallel
+                )
+                self.assertEqual(result[:2] + result[3:], [0, 1, 3])
+                self.assertIsInstance(result[2], parmap.Failure)
+                self.assertEqual(result[2].index, 2)
+                self.assertIsInstance(result[2].exception, ValueError)
+        with self.assertRaises(ValueError):
+            parmap.map(_boom, range(4), pm_on_error="ignore")
+
+    def test_retries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "failed")
+            result = parmap.map(
+                _fail_once, range(4), path, pm_retries=1, pm_retry_delay=0
+            )
+            self.assertEqual(result, [0, 1, 2, 3])
+            self.assertTrue(os.path.exists(path))
+        with self.assertRaises(ValueError) as context:
+            parmap.starmap(
+                _boom, [(x,) for x in range(4)], pm_retries=2, pm_retry_delay=0
+            )
+        self.assertEqual(context.exception.parmap_index, 2)
+
+    def test_maxtasksperchild(self):
+        pids = parmap.map(
+            _getpid, range(3), pm_processes=1, pm_chunksize=1, pm_maxtasksperchild=1
+        )
+        self.assertEqual(len(set(pids)), 3)
+        # The workers of a pool given by the caller are not recycled
+        with multiprocessing.Pool(1) as pool:
+            with self.assertWarns(UserWarning):
+                pids = parmap.map(
+                    _getpid,
+                    range(3),
+                    pm_pool=pool,
+                    pm_chunksize=1,
+                    pm_maxtasksperchild=1,
+                )
+        self.assertEqual(len(set(pids)), 1)
+
+    def test_max_worker_memory(self):
+        # Each worker is retired after a few items, keeping their results
+        limit = parmap.parmap._worker_rss() + (40 << 20)
+        for chunksize in (1, 2):
+            result = parmap.map(
+                _leak,
+                range(8),
+                pm_processes=1,
+                pm_chunksize=chunksize,
+                pm_max_worker_memory=limit,
+            )
+            self.assertEqual([x for x, _ in result], list(range(8)))
+            self.assertTrue(1 < len({pid for _, pid in result}) < 8)
+        result = list(
+            parmap.imap(_leak, range(8), pm_processes=1, pm_max_worker_memory=limit)
+        )
+        self.assertEqual([x for x, _ in result], list(range(8)))
+        self.assertGreater(len({pid for _, pid in result}), 1)
+        with multiprocessing.Pool(1) as pool:
+            with self.assertWarns(UserWarning):
+                result = parmap.map(
+                    _leak, range(4), pm_pool=pool, pm_max_worker_memory=limit
+                )
+        self.assertEqual(len({pid for _, pid in result}), 1)
+
+    def test_task_timeout(self):
+        result = parmap.map(
+            _sleep_for, [0, 30, 0], pm_task_timeout=0.5, pm_on_error="collect"
+        )
+        self.assertEqual(result[0::2], [0, 0])
+        self.assertIsInstance(result[1].exception, TimeoutError)
+        mytime = time.time()
+        with multiprocessing.Pool(1) as pool:
+            # The worker is killed and replaced
+            with self.assertRaises(TimeoutError) as context:
+                parmap.map(
+                    _hang, [0, 30], pm_pool=pool, pm_chunksize=1, pm_task_timeout=0.2
+                )
+            self.assertEqual(context.exception.parmap_index, 1)
+            self.assertEqual(parmap.map(_sleep_for, [0, 0], pm_pool=pool), [0, 0])
+        self.assertLess(time.time() - mytime, 10)
+        # Only the item of the killed worker fails, the rest of its chunk
+        # is run again
+        for chunksize in (1, 4):
+            with self.subTest(chunksize=chunksize):
+                result = parmap.map(
+                    _hang,
+                    [0, 0, 0, 30, 0, 0, 0, 0],
+                    pm_processes=2,
+                    pm_chunksize=chunksize,
+                    pm_task_timeout=0.5,
+                    pm_on_error="collect",
+                )
+                self.assertIsInstance(result[3], parmap.Failure)
+                self.assertIsInstance(result[3].exception, TimeoutError)
+                self.assertEqual(result[3].index, 3)
+                self.assertEqual(result[:3] + result[4:], [0] * 7)
+        with self.assertRaises(TimeoutError):
+            parmap.map_async(_sleep_for, [30], pm_task_timeout=0.2).get(10)
+
+    def test_initializer(self):
+        for start_method in multiprocessing.get_all_start_methods():
+            with self.subTest(start_method=start_method):
+                result = parmap.map(
+                    _add_worker_value,
+                    range(4),
+                    pm_start_method=start_method,
+                    pm_preload=["json"] if start_method == "forkserver" else None,
+                    pm_initializer=_set_worker_value,
+                    pm_initargs=(10,),
+                )
+                self.assertEqual(result, [10, 11, 12, 13])
+        # Along with the initializer of pm_share_args
+        result = parmap.map(
+            _add_worker_value,
+            range(4),
+            1,
+            pm_share_args=True,
+            pm_initializer=_set_worker_value,
+            pm_initargs=(10,),
+        )
+        self.assertEqual(result, [11, 12, 13, 14])
+        # The workers of the shared pool keep their state
+        parmap.map(
+            _identity,
+            range(2),
+            pm_pool="shared",
+            pm_initializer=_set_worker_value,
+            pm_initargs=(20,),
+        )
+        try:
+            self.assertEqual(
+                parmap.map(_add_worker_value, range(2), pm_pool="shared"), [20, 21]
+            )
+        finally:
+            parmap.close_shared_pool()
+        with self.assertRaises(ValueError):
+            parmap.map(_identity, range(2), pm_start_method="teleport")
+
+    def test_map_to(self):
+        received = []
+        summary = parmap.map_to(
+            received.append, _counted_add, range(20), 1, pm_chunksize=3
+        )
+        self.assertEqual(received, list(range(1, 21)))
+        self.assertEqual(summary.num_results, 20)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "results")
+            pairs = [(x, 1) for x in range(20)]
+            summary = parmap.starmap_to(path, _counted_add, pairs, pm_parallel=False)
+            self.assertEqual(summary.nbytes, os.path.getsize(path))
+            self.assertEqual(list(parmap.read_results(path)), list(range(1, 21)))
+        try:
+            import numpy as np
+        except ImportError:
+            return
+        output = np.zeros(20)
+        parmap.map_to(output, _counted_add, range(20), 1, pm_chunksize=3)
+        np.testing.assert_array_equal(output, np.arange(1, 21))
+        with self.assertRaises(ValueError):
+            parmap.map_to(np.zeros(10), _counted_add, range(20))
+
+    def test_guided_chunksize(self):
+        stats = parmap.Stats()
+        items = list(range(40))
+        result = parmap.map(
+            _identity, items, pm_processes=2, pm_chunksize="guided", pm_stats=stats
+        )
+        self.assertEqual(result, [(x,) for x in items])
+        sizes = [c.num_items for c in sorted(stats.chunks, key=lambda c: c.start)]
+        self.assertEqual(sizes[0], 10)
+        self.assertEqual(sizes[-1], 1)
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertEqual(
+            list(parmap.imap(_identity, iter(items), pm_chunksize="guided")),
+            [(x,) for x in items],
+        )
+
+    def test_map_indexed(self):
+        items = list(range(10))
+        for parallel in (True, False):
+            with self.subTest(parallel=parallel):
+                self.assertEqual(
+                    parmap.map_indexed(
+                        _counted_add, items, 1, pm_chunksize=3, pm_parallel=parallel
+                    ),
+                    [x + 1 for x in items],
+                )
+        try:
+            import numpy as np
+        except ImportError:
+            return
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "source.npy")
+            array = np.arange(20.0).reshape(10, 2)
+            np.save(path, array)
+            expected = [row.sum() for row in array]
+            self.assertEqual(parmap.map_indexed(np.sum, path), expected)
+            memmap = np.memmap(
+                os.path.join(tmpdir, "source.dat"),
+                dtype=float,
+                mode="w+",
+                shape=(10, 2),
+            )
+            memmap[:] = array
+            memmap.flush()
+            self.assertEqual(
+                parmap.map_indexed(np.sum, memmap, pm_chunksize=4), expected
+            )
+            self.assertEqual(parmap.map_indexed(np.sum, memmap[2:]), expected[2:])
+            del memmap
+
+    def test_compress(self):
+        items = [b"x" * 10000 * i for i in range(5)]
+        for compress in ("zlib", "lzma", "bz2", ("zlib", 1)):
+            with self.subTest(compress=compress):
+                stats = parmap.Stats()
+                result = parmap.map(
+                    _identity, items, pm_compress=compress, pm_stats=stats
+                )
+                self.assertEqual(result, [(x,) for x in items])
+                summary = stats.summary()
+                self.assertGreater(summary["compression_ratio"], 10)
+                self.assertGreater(summary["compression_time"], 0)
+        self.assertEqual(
+            parmap.map(
+                _identity,
+                items,
+                pm_compress=True,
+                pm_serializer=(_zlib_dumps, _zlib_loads),
+            ),
+            [(x,) for x in items],
+        )
+        # Many small items: the chunks are compressed as a whole
+        items = ["{:04d}".format(i) * 256 for i in range(2000)]
+        for function in (parmap.map, parmap.imap):
+            with self.subTest(function=function):
+                stats = parmap.Stats()
+                result = function(
+                    len, items, pm_chunksize=250, pm_compress=True, pm_stats=stats
+                )
+                self.assertEqual(list(result), [1024] * 2000)
+                summary = stats.summary()
+                self.assertGreater(summary["uncompressed_bytes"], 2000 * 1024)
+                self.assertGreater(summary["compression_ratio"], 10)
+        with self.assertRaises(ValueError):
+            parmap.map(_identity, items, pm_compress="snappy")
+
+    def test_serializer(self):
+        items = list(range(10))
+        pairs = [(x, 1) for x in items]
+        expected = [x + 1 for x in items]
+        for serializer in ("pickle", (_zlib_dumps, _zlib_loads)):
+            with self.subTest(serializer=serializer):
+                self.assertEqual(
+                    parmap.map(_counted_add, items, a=1, pm_serializer=serializer),
+                    expected,
+                )
+                self.assertEqual(
+                    parmap.starmap(
+                        _counted_add, pairs, pm_serializer=serializer, pm_chunksize=3
+                    ),
+                    expected,
+                )
+                self.assertEqual(
+                    parmap.map_batched(_batch_add, items, 1, pm_serializer=serializer),
+                    expected,
+                )
+        with self.assertRaises(ValueError):
+            parmap.map(_identity, items, pm_serializer="json")
+        with self.assertRaises(ValueError):
+            parmap.map(_identity, items, pm_serializer="pickle5")
+        try:
+            import cloudpickle  # noqa: F401
+        except ImportError:
+            return
+        offset = 2
+        self.assertEqual(
+            list(parmap.imap(lambda x: x + offset, items, pm_serializer="cloudpickle")),
+            [x + 2 for x in items],
+        )
+        # The arguments of pm_share_args are sent with the serializer too,
+        # whether the pool runs them as its initializer or reads their file
+        with multiprocessing.Pool(2) as pool:
+            for pm_pool, start_method in (
+                (None, None),
+                (None, "spawn"),
+                (pool, None),
+                ("shared", None),
+            ):
+                with self.subTest(pm_pool=pm_pool, start_method=start_method):
+                    with warnings.catch_warnings():
+                        # No fallback to a serial map
+                        warnings.simplefilter("error")
+                        result = parmap.map(
+                            lambda x, y: x + y + offset,
+                            items,
+                            1,
+                            pm_serializer="cloudpickle",
+                            pm_share_args=True,
+                            pm_pool=pm_pool,
+                            pm_start_method=start_method,
+                        )
+                    self.assertEqual(result, [x + 3 for x in items])
+        parmap.close_shared_pool()
+
+    def test_map_reduce(self):
+        items = list(range(100))
+        for parallel in (False, True):
+            with self.subTest(parallel=parallel):
+                self.assertEqual(
+                    parmap.map_reduce(
+                        _counted_add, items, operator.add, 1, pm_parallel=parallel
+                    ),
+                    sum(items) + len(items),
+                )
+                # Not commutative: the partial results are combined in order
+                self.assertEqual(
+                    parmap.map_reduce(
+                        _identity,
+                        items,
+                        operator.add,
+                        pm_chunksize=7,
+                        pm_parallel=parallel,
+                    ),
+                    tuple(items),
+                )
+                self.assertEqual(
+                    parmap.starmap_reduce(
+                        _counted_add,
+                        [(x, 2) for x in items],
+                        operator.add,
+                        pm_initial=-1,
+                        pm_parallel=parallel,
+                    ),
+                    sum(items) + 2 * len(items) - 1,
+                )
+                self.assertEqual(
+                    parmap.map_reduce(
+                        _identity, [], operator.add, pm_initial=(), pm_parallel=parallel
+                    ),
+                    (),
+                )
+                with self.assertRaises(TypeError):
+                    parmap.map_reduce(_identity, [], operator.add, pm_parallel=parallel)
+        with self.assertRaises(ValueError) as context:
+            parmap.map_reduce(_boom, items, operator.add, pm_chunksize=10)
+        self.assertEqual(context.exception.parmap_index, 2)
+
+    def test_map_unordered(self):
+        items = [0.5, 0, 0, 0]
+        result = parmap.map(
+            _sleep_for, items, pm_processes=2, pm_chunksize=1, pm_ordered=False
+        )
+        self.assertEqual(sorted(result), list(enumerate(items)))
+        # The slow first item completes last
+        self.assertEqual(result[-1], (0, 0.5))
+        result = parmap.starmap(
+            _identity, [(x, 1) for x in range(100)], pm_ordered=False
+        )
+        self.assertEqual(sorted(result), [(x, (x, 1)) for x in range(100)])
+        expected = [(x, (x,)) for x in range(10)]
+        for options in (
+            {"pm_parallel": False},
+            {"pm_on_error": "collect"},
+            {"pm_retries": 1},
+        ):
+            with self.subTest(**options):
+                result = parmap.map(_identity, range(10), pm_ordered=False, **options)
+                self.assertEqual(result, expected)
+
 
 if __name__ == "__main__":
     multiprocessing.freeze_support()